@@ -4,7 +4,11 @@ from pathlib import Path
 
 from app.services.pdf_processor import PDFProcessor
 from app.services.embeddings import EmbeddingService
+from app.services.embedding_store import EmbeddingStore
 from app.services.vector_store import VectorStore
+from app.services.index_rebuild import blue_green_rebuild
+from app.services.compression import embed_chunk_sentences, sentence_fields
+from app.services.centroids import build_groups
 from app.config import get_settings
 
 def process_pdf_pipeline():
@@ -14,41 +18,73 @@ def process_pdf_pipeline():
     pdf_processor = PDFProcessor()
     embedding_service = EmbeddingService(
         settings.EMBEDDING_MODEL,
-        settings.HUGGINGFACE_API_KEY)
+        settings.HUGGINGFACE_API_KEY,
+        store=EmbeddingStore.from_settings())  # Unchanged chunks are not re-embedded
     vector_store = VectorStore(
         settings.MONGODB_URI,
         settings.MONGODB_DB_NAME, 
-        settings.MONGODB_COLLECTION)
+        settings.MONGODB_COLLECTION,
+        storage=settings.EMBEDDING_STORAGE)
 
     pdf_file = Path("data/Institute_Placement_Policy-IIITK_2025.pdf")
 
     # Generate Chunks
-    chunkS = pdf_processor.process_pdf(str(pdf_file))
+    if settings.CHUNKING_STRATEGY == "structured":
+        # Whole clauses go to the LLM; small children are what gets embedded
+        parents, chunkS = pdf_processor.process_pdf_structured(str(pdf_file))
+    else:
+        parents, chunkS = [], pdf_processor.process_pdf(str(pdf_file))
     
     # Generate Embeddings
     texts = [chunk["text"] for chunk in chunkS]
         # print(texts[:1])
-    embeddings = embedding_service.generate_embeddings(texts)
+    embeddings = embedding_service.generate_embeddings(texts)  # (n, dim) float32
         # print(embeddings)
 
-    # Create document with embeddings
+    # Precompute sentence embeddings for context compression, on whatever
+    # reaches the LLM (the parents when chunking is structured)
+    compressed = parents or chunkS
+    sentence_data = embed_chunk_sentences([c["text"] for c in compressed], embedding_service)
+    for item, (sentences, sentence_embeddings) in zip(compressed, sentence_data):
+        item.update(sentence_fields(sentences, sentence_embeddings))
+
+    # Create documents; embeddings are encoded straight from the array
     documents = []
-    for chunk, embedding in zip(chunkS, embeddings):
+    for chunk in chunkS:
         doc = {
             "text": chunk["text"],
             "chunk_id": chunk["chunk_id"],
             "chunk_index": chunk["chunk_index"],
-            "embedding": embedding.tolist() if hasattr(embedding, 'tolist') else embedding,
-            "metadata": chunk.get("metadata", {})
+            "metadata": chunk.get("metadata", {}),
+            **{k: chunk[k] for k in ("parent_id", "sentences", "sentence_embeddings") if k in chunk}
         }
         documents.append(doc)
         # print(documents)
 
-    # Store to MangoDB
-    vector_store.insert_documents(documents)
-    print(f"✅ Stored {len(documents)} documents in MongoDB!")
+    # Page/section and document centroids for coarse-to-fine search
+    groups = build_groups(documents, embeddings, level=settings.CENTROID_GROUP_LEVEL)
+
+    # Store to MangoDB: build a shadow version with its own index, validate
+    # it and switch the live pointer; the API keeps serving the old version
+    report = blue_green_rebuild(
+        vector_store,
+        documents,
+        embeddings,
+        parents=parents,
+        groups=groups,
+        embedding_dimension=embedding_service.dimension,
+        smoke_queries=settings.REBUILD_SMOKE_QUERIES,
+        min_recall=settings.REBUILD_MIN_RECALL,
+        keep_versions=settings.INDEX_KEEP_VERSIONS,
+        index_timeout_s=settings.INDEX_BUILD_TIMEOUT_S
+    )
+    print(f"✅ Stored {len(documents)} documents ({len(parents)} parent clauses) in {report['collection']}!")
+    print(f"   Smoke-query recall: {report['validation']['recall']:.2f}; now active")
+    if report["dropped"]:
+        print(f"   Dropped old versions: {', '.join(report['dropped'])}")
 
     
     
 
-process_pdf_pipeline()
\ No newline at end of file
+if __name__ == "__main__":
+    process_pdf_pipeline()
@@ -0,0 +1,174 @@
+"""
+Document ingestion endpoints: PDF upload and background job status
+
+Uploads rewrite the collections answers are built from, so every
+endpoint here requires the INGEST_ADMIN_TOKEN in an X-Admin-Token header.
+"""
+
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Response, UploadFile, status
+from app.models.documents import JobListResponse, JobResponse
+from app.services.ingestion import JobQueueFull, get_job_manager
+from app.services.tenants import UnknownTenantError, get_tenant_registry
+from app.config import get_settings
+from typing import BinaryIO, Optional
+from pathlib import Path
+import asyncio
+import re
+import secrets
+import shutil
+import uuid
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Ingestion is only served when INGEST_ADMIN_TOKEN is set, and to its holder"""
+    token = get_settings().INGEST_ADMIN_TOKEN
+    if not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document ingestion is disabled")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Missing or invalid X-Admin-Token")
+
+
+router = APIRouter(prefix="/api", tags=["documents"], dependencies=[Depends(require_admin_token)])
+
+# Suggested wait before retrying an upload rejected because the queue is full
+QUEUE_FULL_RETRY_AFTER_S = 60
+
+_COPY_CHUNK = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeds INGEST_MAX_UPLOAD_MB"""
+
+
+class NotAPdf(Exception):
+    """The upload is empty or not a PDF"""
+
+
+def _safe_filename(filename: Optional[str]) -> str:
+    """Base name of an uploaded file, reduced to characters safe on any filesystem"""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", Path(filename or "").name).strip("._")
+    return name or "document.pdf"
+
+
+def _save_upload(source: BinaryIO, path: Path, max_bytes: int) -> int:
+    """
+    Copy an upload to disk.
+
+    Returns:
+        Bytes written
+
+    Raises:
+        UploadTooLarge: If the file exceeds max_bytes
+        NotAPdf: If the file is empty or not a PDF
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(path, "wb") as target:
+        while True:
+            chunk = source.read(_COPY_CHUNK)
+            if not chunk:
+                break
+            if written == 0 and not chunk.startswith(b"%PDF-"):
+                raise NotAPdf("The uploaded file is not a PDF")
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLarge()
+            target.write(chunk)
+    if written == 0:
+        raise NotAPdf("The uploaded file is empty")
+    return written
+
+
+def _job_or_404(job_id: str):
+    try:
+        return get_job_manager().get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No ingestion job {job_id}")
+
+
+@router.post("/documents", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(
+    response: Response,
+    file: UploadFile = File(..., description="PDF to ingest"),
+    tenant_id: Optional[str] = Form(None, description="Tenant to ingest into (the default tenant if omitted)", max_length=64)
+):
+    """
+    Upload a PDF and queue it for ingestion.
+
+    The document is parsed, embedded and written in the background; poll
+    the returned job (also in the Location header) for progress.
+
+    Raises:
+        HTTPException: 404 for an unknown tenant, 400 for a tenant that
+            cannot be ingested into, 413/415 for bad uploads, 429 when the
+            job queue is full
+    """
+    settings = get_settings()
+    try:
+        tenant = get_tenant_registry().resolve(tenant_id)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown tenant '{e.args[0]}'")
+
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Only PDF files can be ingested")
+
+    # Each upload gets its own directory, so equal file names never collide
+    upload_dir = Path(settings.INGEST_UPLOAD_DIR) / tenant.tenant_id / uuid.uuid4().hex
+    path = upload_dir / _safe_filename(file.filename)
+    max_bytes = int(settings.INGEST_MAX_UPLOAD_MB * 1024 * 1024)
+    try:
+        await asyncio.to_thread(_save_upload, file.file, path, max_bytes)
+        job = get_job_manager().submit(str(path), tenant, filename=file.filename, cleanup_dir=str(upload_dir))
+    except UploadTooLarge:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Uploads are limited to {settings.INGEST_MAX_UPLOAD_MB:g} MB"
+        )
+    except NotAPdf as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except ValueError as e:
+        # Tenant that cannot be ingested into (sharded)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except JobQueueFull as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_S)}
+        )
+
+    response.headers["Location"] = f"/api/jobs/{job.job_id}"
+    return job.to_dict()
+
+
+@router.get("/jobs", response_model=JobListResponse)
+async def list_jobs(tenant_id: Optional[str] = None):
+    """Recent ingestion jobs, newest first"""
+    return {"jobs": [job.to_dict() for job in get_job_manager().jobs(tenant_id)]}
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Status and per-stage progress of an ingestion job"""
+    return _job_or_404(job_id).to_dict()
+
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running ingestion job.
+
+    A running job stops before its next embedding call; nothing has been
+    written at that point. Jobs that are writing or finished cannot be
+    cancelled (409).
+    """
+    job = _job_or_404(job_id)
+    if not get_job_manager().cancel(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job {job_id} is {job.status if job.finished else 'writing'} and can no longer be cancelled"
+        )
+    return job.to_dict()
@@ -2,34 +2,125 @@
 Query API endpoints for semantic search and RAG chat
 """
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import FileResponse, ORJSONResponse
 from app.models.query import (
-    QueryRequest, QueryResponse, RetrievalResultModel, HealthResponse,
-    ChatRequest, ChatResponse, SourceChunk
+    QueryRequest, QueryResponse, HealthResponse,
+    ChatRequest, ChatResponse, PrefetchRequest, PrefetchResponse
 )
 from app.services.retrieval import RetrievalService
 from app.services.rag_pipeline import RAGPipeline
-from typing import List
+from app.services.resilience import CircuitOpenError, status_code_of, upstream_stats
+from app.services.scheduler import AdmissionRejected, priority, scheduler_stats
+from app.services.cache import get_cache
+from app.services.deadlines import DeadlineExceeded, applied_degradations, request_deadline
+from app.services.ingestion import ingestion_stats
+from app.services.prefetch import get_prefetcher, prefetch_stats
+from app.services.profiling import list_profiles
+from app.services.tenants import UnknownTenantError, get_tenant_registry
+from app.services.tracing import annotate, get_slow_query_log, request_trace
+from app.config import get_settings
+from typing import Optional
+from contextlib import asynccontextmanager
+from pathlib import Path
+import asyncio
+import math
+import secrets
 
 router = APIRouter(prefix="/api", tags=["query"])
 
-# Singleton instances
-_retrieval_service = None
-_rag_pipeline = None
+# Services are per tenant; the registry builds a tenant's pipeline on first
+# use (warm_up() builds the default tenant's) and unloads idle tenants
 
 
-def get_retrieval_service() -> RetrievalService:
-    global _retrieval_service
-    if _retrieval_service is None:
-        _retrieval_service = RetrievalService()
-    return _retrieval_service
+def get_rag_pipeline(tenant_id: Optional[str] = None) -> RAGPipeline:
+    return get_tenant_registry().pipeline(tenant_id)
 
 
-def get_rag_pipeline() -> RAGPipeline:
-    global _rag_pipeline
-    if _rag_pipeline is None:
-        _rag_pipeline = RAGPipeline()
-    return _rag_pipeline
+def get_retrieval_service(tenant_id: Optional[str] = None) -> RetrievalService:
+    return get_rag_pipeline(tenant_id).retrieval_service
+
+
+async def aget_rag_pipeline(tenant_id: Optional[str] = None) -> RAGPipeline:
+    """get_rag_pipeline() that builds a tenant that is not resident off the event loop"""
+    registry = get_tenant_registry()
+    if registry.is_resident(tenant_id):
+        return registry.pipeline(tenant_id)
+    return await asyncio.to_thread(registry.pipeline, tenant_id)
+
+
+@asynccontextmanager
+async def leased_rag_pipeline(tenant_id: Optional[str] = None):
+    """
+    The tenant's pipeline, leased for the enclosed request.
+
+    A tenant unloaded while the request runs is closed only after it
+    finishes; a tenant that is not resident is built off the event loop.
+    """
+    registry = get_tenant_registry()
+    if registry.is_resident(tenant_id):
+        pipeline = registry.acquire(tenant_id, build=False)
+    else:
+        pipeline = None
+    if pipeline is None:
+        pipeline = await asyncio.to_thread(registry.acquire, tenant_id)
+    try:
+        yield pipeline
+    finally:
+        registry.release(pipeline)
+
+
+def _unknown_tenant_error(e: UnknownTenantError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown tenant '{e.args[0]}'")
+
+
+async def _settle_prefetch(tenant_id: str, client_id: Optional[str], query: str):
+    """Cancel the client's prefetch of another question, or wait for this one's"""
+    if client_id and await get_prefetcher().supersede(f"{tenant_id}:{client_id}", query):
+        annotate(prefetched=True)
+
+
+async def warm_up():
+    """
+    Build the default tenant's services in a worker thread after startup.
+
+    The SDK clients (huggingface_hub, groq, pymongo) are imported when the
+    services are built, not when the app is imported, so a worker starts
+    serving quickly and pays for them off the request path.
+    """
+    try:
+        await aget_rag_pipeline()
+    except Exception as e:
+        # The first request builds them instead and reports the error
+        print(f"⚠ Service warm-up failed: {e}")
+
+
+def _deadline_error(e: DeadlineExceeded) -> HTTPException:
+    """A required stage (embedding, search) did not finish within the request deadline"""
+    return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+
+
+def _overload_error(e: Exception) -> HTTPException:
+    """
+    Map upstream saturation to a retryable HTTP error.
+    
+    An open circuit becomes 503; a shed request or an upstream 429 that
+    survived retries becomes 429. Both carry a Retry-After header.
+    """
+    settings = get_settings()
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(settings.BREAKER_RESET_S))}
+        )
+    
+    retry_after = getattr(e, "retry_after", settings.SCHEDULER_MAX_WAIT_S)
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(retry_after))}
+    )
 
 
 @router.post("/query", response_model=QueryResponse)
@@ -47,43 +138,92 @@ async def query_documents(request: QueryRequest):
         HTTPException: If query processing fails
     """
     try:
-        # Get retrieval service
-        service = get_retrieval_service()
-        
-        # Perform retrieval
-        results = service.retrieve(
-            query=request.query,
-            top_k=request.top_k,
-            min_score=request.min_score
-        )
-        
-        # Convert to response models
-        result_models = [
-            RetrievalResultModel(
-                text=r.text,
-                chunk_id=r.chunk_id,
-                score=r.score,
-                metadata=r.metadata
-            )
-            for r in results
-        ]
-        
-        # Build response
-        response = QueryResponse(
-            query=request.query,
-            results=result_models,
-            total_results=len(result_models)
-        )
+        # Get the tenant's retrieval service
+        async with leased_rag_pipeline(request.tenant_id) as pipeline:
+            service = pipeline.retrieval_service
+            
+            # Perform retrieval (interactive traffic is admitted ahead of batch jobs,
+            # and cheaper search is used when the deadline gets close);
+            # slow requests land in the slow-query log with their full trace
+            with request_trace("/api/query", request.query) as trace, priority("interactive"), \
+                    request_deadline(request.deadline_ms):
+                trace.fields["tenant_id"] = service.tenant.tenant_id
+                await _settle_prefetch(service.tenant.tenant_id, request.client_id, request.query)
+                results = await service.aretrieve(
+                    query=request.query,
+                    top_k=request.top_k,
+                    min_score=request.min_score
+                )
+                degradations = applied_degradations()
         
-        return response
+        # Serialize straight to JSON bytes; the shape matches QueryResponse,
+        # so re-validating every result through pydantic is skipped
+        return ORJSONResponse({
+            "query": request.query,
+            "results": [r.to_dict() for r in results],
+            "total_results": len(results),
+            "degradations": degradations
+        }, headers={"X-Trace-Id": trace.trace_id})
         
+    except UnknownTenantError as e:
+        raise _unknown_tenant_error(e)
+    except DeadlineExceeded as e:
+        raise _deadline_error(e)
+    except (CircuitOpenError, AdmissionRejected) as e:
+        raise _overload_error(e)
     except Exception as e:
+        if status_code_of(e) == status.HTTP_429_TOO_MANY_REQUESTS:
+            raise _overload_error(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Query processing failed: {str(e)}"
         )
 
 
+@router.post("/prefetch", response_model=PrefetchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def prefetch(request: PrefetchRequest):
+    """
+    Warm the caches for a question the user is still typing.
+    
+    Returns immediately. The partial question is embedded and retrieved
+    in the background at the lowest priority; a newer prefetch from the
+    same client_id cancels it. Send the final question with the same
+    client_id, top_k and min_score to benefit.
+    """
+    settings = get_settings()
+    if not settings.PREFETCH_ENABLED or len(request.query.strip()) < settings.PREFETCH_MIN_CHARS:
+        return {"status": "skipped"}
+    
+    registry = get_tenant_registry()
+    try:
+        tenant = registry.resolve(request.tenant_id)
+    except UnknownTenantError as e:
+        raise _unknown_tenant_error(e)
+    # Speculation never pays for loading a tenant
+    if not registry.is_resident(tenant.tenant_id):
+        return {"status": "skipped"}
+    
+    scheduled = get_prefetcher().submit(
+        f"{tenant.tenant_id}:{request.client_id}",
+        request.query,
+        _prefetch, tenant.tenant_id, request.query, request.top_k, request.min_score
+    )
+    return {"status": "scheduled" if scheduled else "skipped"}
+
+
+async def _prefetch(tenant_id: str, query: str, top_k: int, min_score: Optional[float]):
+    """Background prefetch holding a lease on the tenant's pipeline while it runs"""
+    registry = get_tenant_registry()
+    pipeline = registry.acquire(tenant_id, build=False)
+    if pipeline is None:
+        # Unloaded since the request was accepted
+        return
+    try:
+        await pipeline.retrieval_service.aprefetch(query, top_k, min_score)
+    finally:
+        registry.release(pipeline)
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """
@@ -96,13 +236,24 @@ async def health_check():
         # Try to initialize retrieval service
         service = get_retrieval_service()
         
+        # Circuit breaker state per upstream ("closed" is healthy)
+        circuits = {
+            f"{name}_circuit": stats["circuit"]
+            for name, stats in upstream_stats().items()
+        }
+        degraded = [name for name, state in circuits.items() if state != "closed"]
+        
         return HealthResponse(
-            status="healthy",
-            message="All services operational",
+            status="degraded" if degraded else "healthy",
+            message=(
+                f"Upstream circuit not closed: {', '.join(degraded)}"
+                if degraded else "All services operational"
+            ),
             services={
                 "retrieval": "ready",
                 "embeddings": "ready",
-                "vector_store": "ready"
+                "vector_store": "ready",
+                **circuits
             }
         )
         
@@ -118,29 +269,113 @@ async def health_check():
         )
 
 
+@router.get("/metrics")
+async def metrics():
+    """
+    Runtime counters for the query services.
+    
+    Only services that have been initialized report anything.
+    """
+    data = {}
+    registry = get_tenant_registry()
+    resident = registry.resident()
+    per_tenant = {}
+    for tenant_id, pipeline in resident.items():
+        service = pipeline.retrieval_service
+        per_tenant[tenant_id] = {
+            "retrieval_coalescing": service.flights.stats(),
+            "chat_coalescing": pipeline.flights.stats(),
+            "sessions": pipeline.sessions.stats()
+        }
+        if hasattr(service.vector_store, "stats"):
+            per_tenant[tenant_id]["vector_shards"] = service.vector_store.stats()
+    if resident:
+        # The micro-batcher is shared by all tenants
+        data["query_embedding_batches"] = next(iter(resident.values())).retrieval_service.query_batcher.stats()
+    data["tenants"] = {**registry.stats(), "services": per_tenant}
+    data["cache"] = get_cache().stats()
+    data["upstreams"] = upstream_stats()
+    data["admission"] = scheduler_stats()
+    prefetches = prefetch_stats()
+    if prefetches is not None:
+        data["prefetch"] = prefetches
+    ingestion = ingestion_stats()
+    if ingestion is not None:
+        data["ingestion"] = ingestion
+    slow_log = get_slow_query_log()
+    if slow_log is not None:
+        data["slow_queries"] = {"threshold_ms": slow_log.threshold_ms, "logged": slow_log.logged}
+    return data
+
+
+def _check_profiling_access(x_profile: Optional[str]):
+    """Profiles are only served when profiling is on and PROFILING_ADMIN_TOKEN is set, and to its holder"""
+    settings = get_settings()
+    token = settings.PROFILING_ADMIN_TOKEN
+    if not settings.PROFILING_ENABLED or not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled")
+    if x_profile is None or not secrets.compare_digest(x_profile.encode(), token.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Missing or invalid X-Profile token")
+
+
+@router.get("/profiles")
+async def profiles(limit: int = 50, x_profile: Optional[str] = Header(None)):
+    """
+    Recent request profiles, newest first.
+    
+    Open a file from GET /api/profiles/{name} in https://www.speedscope.app
+    """
+    _check_profiling_access(x_profile)
+    return {"profiles": list_profiles(get_settings().PROFILING_DIR, limit)}
+
+
+@router.get("/profiles/{name}")
+async def profile_file(name: str, x_profile: Optional[str] = Header(None)):
+    """Download one profile file"""
+    _check_profiling_access(x_profile)
+    directory = Path(get_settings().PROFILING_DIR).resolve()
+    path = (directory / name).resolve()
+    if path.parent != directory or not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No profile named {name}")
+    return FileResponse(path)
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
     Full RAG pipeline: retrieve relevant chunks + generate answer with FLAN-T5.
+    
+    Under a tight deadline the pipeline degrades step by step instead of
+    timing out, down to returning the sources without an answer; the
+    response lists the degradations applied.
     """
     try:
-        pipeline = get_rag_pipeline()
-        result = pipeline.answer(query=request.query, top_k=request.top_k)
-
-        return ChatResponse(
-            query=result.query,
-            answer=result.answer,
-            sources=[
-                SourceChunk(
-                    chunk_id=s["chunk_id"],
-                    score=s["score"],
-                    text_preview=s["text_preview"]
+        async with leased_rag_pipeline(request.tenant_id) as pipeline:
+            # Every chat turn belongs to a session (of this tenant); the id is returned for follow-ups
+            session = pipeline.sessions.get_or_create(request.session_id)
+            with request_trace("/api/chat", request.query) as trace, priority("interactive"), \
+                    request_deadline(request.deadline_ms):
+                trace.fields["tenant_id"] = pipeline.tenant.tenant_id
+                await _settle_prefetch(pipeline.tenant.tenant_id, request.client_id, request.query)
+                result = await pipeline.aanswer(
+                    query=request.query,
+                    top_k=request.top_k,
+                    session=session
                 )
-                for s in result.sources
-            ]
-        )
+                annotate(answer_path=result.answer_path)
+
+        # Same fast path as /query: the dict already matches ChatResponse
+        return ORJSONResponse(result.to_dict(), headers={"X-Trace-Id": trace.trace_id})
 
+    except UnknownTenantError as e:
+        raise _unknown_tenant_error(e)
+    except DeadlineExceeded as e:
+        raise _deadline_error(e)
+    except (CircuitOpenError, AdmissionRejected) as e:
+        raise _overload_error(e)
     except Exception as e:
+        if status_code_of(e) == status.HTTP_429_TOO_MANY_REQUESTS:
+            raise _overload_error(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Chat processing failed: {str(e)}"
@@ -1,8 +1,22 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
+
+class TenantConfig(BaseModel):
+    """One institute served by this deployment"""
+    tenant_id: str
+    institute: str
+    collection: str
+    db_name: Optional[str] = None  # MONGODB_DB_NAME if omitted
+    mongodb_uri: Optional[str] = None  # MONGODB_URI if omitted
+    shards: List[Dict] = []  # Same format as VECTOR_SHARDS; replaces collection when set
+    system_prompt: Optional[str] = None  # Replaces the default prompt; may use {institute}
+
+
 class Settings(BaseSettings):
     # MongoDB
     MONGODB_URI: str
@@ -18,6 +32,18 @@ class Settings(BaseSettings):
     # Models
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     LLM_MODEL: str = "llama-3.3-70b-versatile"  # Groq model
+    LLM_FAST_MODEL: str = "llama-3.1-8b-instant"  # Groq model for simple questions
+    
+    # LLM routing table: a question goes to LLM_FAST_MODEL only if every rule passes
+    LLM_ROUTING_ENABLED: bool = True
+    ROUTER_MAX_QUERY_WORDS: int = 12
+    ROUTER_MIN_TOP_SCORE: float = 0.75  # Best retrieval score
+    ROUTER_MIN_SCORE_MARGIN: float = 0.03  # Top-1 minus top-2 score
+    ROUTER_MAX_CONTEXT_CHARS: int = 2500
+    ROUTER_COMPLEX_MARKERS: List[str] = [
+        "and", "or", "compare", "difference", "versus", "vs", "why", "explain",
+        "if", "unless", "whether", "both", "except", "what happens"
+    ]
     
     # API
     API_HOST: str = "0.0.0.0"
@@ -27,9 +53,169 @@ class Settings(BaseSettings):
     TOP_K: int = 5
     SIMILARITY_THRESHOLD: float = 0.5
     
+    # Chunking: "structured" indexes small child chunks and returns their
+    # parent clauses (small-to-big); "flat" indexes fixed 1000-char chunks
+    CHUNKING_STRATEGY: str = "structured"
+    CHILD_CHUNK_SIZE: int = 300
+    CHILD_CHUNK_OVERLAP: int = 50
+    PARENT_MAX_CHARS: int = 3000
+    PARENT_FETCH_FACTOR: int = 3  # Children fetched per parent returned (several may share a parent)
+    
+    # Coarse-to-fine search: chunks are grouped by page or section at ingestion;
+    # queries score the group centroids first and search only the best groups
+    CENTROID_GROUP_LEVEL: str = "page"  # or "section" (parent clause, structured chunking)
+    COARSE_TOP_GROUPS: int = 8  # Groups searched per query (0 = always search flat)
+    COARSE_TOP_DOCUMENTS: int = 20  # Groups considered come from this many best documents (0 = all)
+    
+    # PDF page extraction cache (content-addressed, reused across ingestions)
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_DIR: str = ".cache/extraction"
+    EXTRACTION_WORKERS: int = 0  # Extraction processes; 0 = one per CPU
+    
+    # Persistent chunk embedding store keyed by (model, text hash), used by ingestion
+    EMBEDDING_STORE_ENABLED: bool = True
+    EMBEDDING_STORE_PATH: str = ".cache/embeddings.sqlite3"
+    
+    # Blue/green rebuilds (ETL.py): validation before the active pointer is switched
+    REBUILD_SMOKE_QUERIES: int = 20
+    REBUILD_MIN_RECALL: float = 0.9  # Ingested vectors that must find their own chunk in the top 5
+    INDEX_KEEP_VERSIONS: int = 3  # Collection versions kept for rollback, including the active one
+    INDEX_BUILD_TIMEOUT_S: float = 600.0
+    
+    # Embedding storage: "float" (BSON double array), "float32", "int8" or "binary".
+    # int8/binary shrink the chunk documents and the vector index, but keep a
+    # float32 copy per chunk in "<collection>_vectors" for rescoring
+    EMBEDDING_STORAGE: str = "float"
+    RESCORE_FACTOR: int = 4  # Candidates per result rescored at full precision
+    
+    # Sharded retrieval: JSON list of shards searched in parallel, e.g.
+    # [{"name": "2024", "collection": "documents_2024"}, {"name": "2025", "collection": "documents_2025",
+    #   "mongodb_uri": "...", "timeout_ms": 1500, "score_scale": 1.0, "score_offset": 0.0}]
+    # Empty searches MONGODB_COLLECTION only
+    VECTOR_SHARDS: List[Dict] = []
+    SHARD_TIMEOUT_MS: float = 1000.0  # Per-shard deadline; later shards are left out of the results
+    
+    # Upload ingestion (POST /api/documents): jobs run in a background pool.
+    # The endpoints require "X-Admin-Token: <token>" and are disabled while it is empty
+    INGEST_ADMIN_TOKEN: str = ""
+    INGEST_MAX_CONCURRENT_JOBS: int = 1
+    INGEST_MAX_QUEUED_JOBS: int = 20  # More uploads are rejected with a 429
+    INGEST_MAX_UPLOAD_MB: float = 50.0
+    INGEST_UPLOAD_DIR: str = "data/uploads"  # Uploaded PDFs are kept as the chunks' source
+    INGEST_JOB_HISTORY: int = 100  # Finished jobs kept for GET /api/jobs/{id}
+    
+    # Query embedding micro-batching
+    EMBED_BATCH_MAX_SIZE: int = 16
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # End-to-end request deadline (a request's deadline_ms overrides it; 0 = none).
+    # As the remaining budget drops below each threshold the request degrades:
+    # optional stages, then search effort, then the model, then generation
+    REQUEST_DEADLINE_MS: float = 10000.0
+    DEGRADE_SKIP_OPTIONAL_MS: float = 6000.0  # Compression embeds no missing sentences
+    DEGRADE_REDUCED_SEARCH_MS: float = 5000.0  # Vector search considers fewer candidates
+    DEGRADE_FAST_MODEL_MS: float = 4000.0  # LLM_FAST_MODEL for every question
+    DEGRADE_NO_GENERATION_MS: float = 1000.0  # Sources only, no answer
+    DEGRADED_CANDIDATES_FACTOR: int = 3  # numCandidates per result under reduced search (normally 10)
+    
+    # Upstream (HuggingFace / Groq) resilience
+    UPSTREAM_TIMEOUT_S: float = 20.0  # Deadline per call, including retries
+    UPSTREAM_MAX_RETRIES: int = 2
+    UPSTREAM_BACKOFF_BASE_S: float = 0.25
+    UPSTREAM_BACKOFF_MAX_S: float = 4.0
+    UPSTREAM_HEDGE_ENABLED: bool = True
+    UPSTREAM_HEDGE_PERCENTILE: float = 0.95
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_S: float = 30.0
+    
+    # Upstream rate limits modelled by the admission scheduler (0 = unlimited)
+    GROQ_REQUESTS_PER_MINUTE: int = 30
+    GROQ_TOKENS_PER_MINUTE: int = 12000
+    HF_REQUESTS_PER_MINUTE: int = 300
+    HF_TOKENS_PER_MINUTE: int = 0
+    SCHEDULER_MAX_QUEUE: int = 100
+    SCHEDULER_MAX_WAIT_S: float = 10.0  # Requests expected to wait longer get a 429
+    
+    # Extractive context compression before the LLM
+    CONTEXT_COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MAX_SENTENCES: int = 8  # Sentences kept across all retrieved chunks
+    
+    # Extractive fast path: simple questions answered by one retrieved sentence
+    # skip the LLM (needs CONTEXT_COMPRESSION_ENABLED for sentence embeddings)
+    EXTRACTIVE_ANSWERS_ENABLED: bool = True
+    EXTRACTIVE_TOP_CHUNKS: int = 2  # Leading chunks whose sentences are candidates
+    EXTRACTIVE_MIN_SCORE: float = 0.8  # Query-sentence similarity of the answer
+    EXTRACTIVE_MIN_MARGIN: float = 0.08  # Best sentence minus the runner-up
+    
+    # Speculative prefetch (POST /api/prefetch) of questions still being typed
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_MIN_CHARS: int = 12  # Shorter partial questions are not prefetched
+    PREFETCH_MAX_IN_FLIGHT: int = 32  # Across all clients
+    PREFETCH_MAX_WAIT_S: float = 0.25  # Prefetches expected to queue longer for an upstream are dropped
+    
+    # Multi-turn chat sessions
+    SESSION_TTL_S: float = 1800.0
+    SESSION_MEMORY_BUDGET_MB: int = 64
+    SESSION_MAX_TURNS: int = 6
+    SESSION_POOL_SIZE: int = 30  # Chunks remembered per session
+    SESSION_REUSE_MIN_SCORE: float = 0.75  # Pool chunks scoring this high skip the vector search
+    SESSION_CONTEXT_WEIGHT: float = 0.5  # Weight of the previous question in follow-up embeddings
+    SESSION_FOLLOW_UP_MIN_SIMILARITY: float = 0.5  # Less similar to the previous question = new topic (coalesced and cached)
+    
+    # Build the query services in the background at API startup instead
+    # of on the first request
+    WARMUP_ON_STARTUP: bool = True
+    
+    # Caching: in-process LRU in front of a shared tier ("redis", "sqlite" or "none")
+    CACHE_BACKEND: str = "none"
+    CACHE_URL: str = "redis://localhost:6379/0"
+    CACHE_SQLITE_PATH: str = ".cache/rag_cache.sqlite3"
+    CACHE_LOCAL_MAX_ITEMS: int = 1024
+    CACHE_TTL_S: int = 3600  # Retrieval results and answers
+    CACHE_EMBEDDING_TTL_S: int = 7 * 24 * 3600  # Query embeddings
+    CORPUS_VERSION_TTL_S: float = 30.0  # How long a worker trusts its corpus version
+    
+    # On-demand request profiling (the middleware is only installed when enabled)
+    PROFILING_ENABLED: bool = False
+    PROFILING_ADMIN_TOKEN: str = ""  # Requests with "X-Profile: <token>" are profiled; also required to read /api/profiles
+    PROFILING_SAMPLE_EVERY: int = 0  # Also profile 1 in N requests (0 = never)
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_FORMAT: str = "speedscope"  # or "collapsed"
+    PROFILING_DIR: str = ".cache/profiles"
+    PROFILING_MAX_FILES: int = 200
+    
+    # Multi-tenancy: requests name a tenant_id from TENANTS (JSON list of
+    # TenantConfig); requests without one go to DEFAULT_TENANT, which is
+    # built from MONGODB_COLLECTION, VECTOR_SHARDS and INSTITUTE_NAME
+    # unless TENANTS defines it
+    DEFAULT_TENANT: str = "default"
+    INSTITUTE_NAME: str = "IIIT Kota"
+    TENANTS: List[TenantConfig] = []
+    TENANT_MEMORY_BUDGET_MB: float = 512.0  # Least recently used tenants are unloaded above this
+    
+    # Slow-query log: full retrieval trace of requests above the threshold
+    SLOW_QUERY_LOG_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 2000.0  # 0 logs every request
+    SLOW_QUERY_LOG_PATH: str = ".cache/logs/slow_queries.jsonl"
+    SLOW_QUERY_LOG_MAX_BYTES: int = 10_000_000
+    SLOW_QUERY_LOG_BACKUPS: int = 5
+    
     class Config:
         env_file = ".env"
 
+    def tenants(self) -> Dict[str, TenantConfig]:
+        """Configured tenants by id, including the default tenant"""
+        tenants = {
+            self.DEFAULT_TENANT: TenantConfig(
+                tenant_id=self.DEFAULT_TENANT,
+                institute=self.INSTITUTE_NAME,
+                collection=self.MONGODB_COLLECTION,
+                shards=self.VECTOR_SHARDS
+            )
+        }
+        tenants.update({tenant.tenant_id: tenant for tenant in self.TENANTS})
+        return tenants
+
 @lru_cache()
 def get_settings():
     return Settings()
\ No newline at end of file
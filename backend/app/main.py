@@ -6,7 +6,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from app.api.query import router as query_router
+import asyncio
+
+from app.api.query import router as query_router, warm_up
+from app.api.documents import router as documents_router
+from app.services.ingestion import shutdown_ingestion
+from app.services.profiling import install_profiling
 from app.config import get_settings
 
 settings = get_settings()
@@ -26,6 +31,24 @@ app.add_middleware(
 )
 
 app.include_router(query_router)
+app.include_router(documents_router)
+
+# Opt-in per-request profiling of /api/query and /api/chat
+install_profiling(app)
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Not awaited: the server accepts requests while the services are built
+    if settings.WARMUP_ON_STARTUP:
+        app.state.warm_up = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_ingestion():
+    # Queued and running ingestion jobs are cancelled; a job that is
+    # writing its documents finishes first
+    shutdown_ingestion()
 
 
 @app.get("/")
@@ -36,6 +59,11 @@ async def root():
             "health": "/api/health",
             "search": "POST /api/query",
             "chat": "POST /api/chat",
+            "prefetch": "POST /api/prefetch",
+            "upload": "POST /api/documents",
+            "jobs": "/api/jobs/{job_id}",
+            "metrics": "/api/metrics",
+            "profiles": "/api/profiles",
             "docs": "/docs"
         }
     }
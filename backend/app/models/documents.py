@@ -0,0 +1,62 @@
+"""
+Pydantic models for document upload and ingestion job responses
+"""
+
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class JobProgress(BaseModel):
+    """Per-stage progress counters of an ingestion job"""
+    pages_parsed: int = Field(0, description="Pages whose text was loaded")
+    pages_extracted: int = Field(0, description="Pages parsed from the PDF (the rest came from the extraction cache)")
+    chunks_total: int = Field(0, description="Chunks to embed")
+    chunks_embedded: int = Field(0, description="Chunks embedded so far")
+    contexts_total: int = Field(0, description="Chunks or parent clauses whose sentences are embedded for compression")
+    contexts_embedded: int = Field(0, description="Of those, embedded so far")
+    docs_written: int = Field(0, description="Chunks written to the collection")
+    docs_replaced: int = Field(0, description="Chunks of an earlier ingestion of the same PDF that were removed")
+
+
+class JobResponse(BaseModel):
+    """State of one ingestion job"""
+    job_id: str = Field(..., description="Id to poll with GET /api/jobs/{job_id}")
+    tenant_id: str = Field(..., description="Tenant whose collection receives the document")
+    filename: str = Field(..., description="Uploaded file name")
+    status: str = Field(..., description="queued, running, succeeded, failed or cancelled")
+    stage: str = Field(..., description="queued, parsing, embedding, writing or done")
+    progress: JobProgress
+    error: Optional[str] = Field(None, description="Why the job failed")
+    created_at: float = Field(..., description="Unix time the job was submitted")
+    started_at: Optional[float] = Field(None, description="Unix time a worker picked it up")
+    finished_at: Optional[float] = Field(None, description="Unix time it succeeded, failed or was cancelled")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "job_id": "5f0c8a3e9b7d4c2a8e6f1b0d3c5a7e9f",
+                "tenant_id": "default",
+                "filename": "Institute_Placement_Policy-IIITK_2025.pdf",
+                "status": "running",
+                "stage": "embedding",
+                "progress": {
+                    "pages_parsed": 12,
+                    "pages_extracted": 12,
+                    "chunks_total": 184,
+                    "chunks_embedded": 128,
+                    "contexts_total": 41,
+                    "contexts_embedded": 0,
+                    "docs_written": 0,
+                    "docs_replaced": 0
+                },
+                "error": None,
+                "created_at": 1760870400.0,
+                "started_at": 1760870400.2,
+                "finished_at": None
+            }
+        }
+
+
+class JobListResponse(BaseModel):
+    """Known ingestion jobs, newest first"""
+    jobs: List[JobResponse]
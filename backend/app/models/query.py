@@ -11,6 +11,9 @@ class QueryRequest(BaseModel):
     query: str = Field(..., description="User query text", min_length=1)
     top_k: Optional[int] = Field(3, description="Number of results to return", ge=1, le=10)
     min_score: Optional[float] = Field(None, description="Minimum similarity score threshold", ge=0.0, le=1.0)
+    tenant_id: Optional[str] = Field(None, description="Institute to search (the deployment's default if omitted)", max_length=64)
+    client_id: Optional[str] = Field(None, description="Client that may have prefetched this query (see /api/prefetch)", max_length=64)
+    deadline_ms: Optional[float] = Field(None, description="Time budget for the request (REQUEST_DEADLINE_MS if omitted)", ge=100, le=120000)
     
     class Config:
         json_schema_extra = {
@@ -45,6 +48,7 @@ class QueryResponse(BaseModel):
     query: str = Field(..., description="Original query text")
     results: List[RetrievalResultModel] = Field(..., description="List of retrieved results")
     total_results: int = Field(..., description="Total number of results returned")
+    degradations: List[str] = Field(default_factory=list, description="Shortcuts taken to meet the request deadline")
     
     class Config:
         json_schema_extra = {
@@ -74,12 +78,17 @@ class ChatRequest(BaseModel):
     """Request model for RAG chat endpoint"""
     query: str = Field(..., description="User question", min_length=1)
     top_k: Optional[int] = Field(3, description="Number of chunks to retrieve", ge=1, le=10)
+    session_id: Optional[str] = Field(None, description="Conversation to continue (from a previous ChatResponse)", max_length=64)
+    tenant_id: Optional[str] = Field(None, description="Institute to ask (the deployment's default if omitted)", max_length=64)
+    client_id: Optional[str] = Field(None, description="Client that may have prefetched this question (see /api/prefetch)", max_length=64)
+    deadline_ms: Optional[float] = Field(None, description="Time budget for the request (REQUEST_DEADLINE_MS if omitted)", ge=100, le=120000)
 
     class Config:
         json_schema_extra = {
             "example": {
                 "query": "What is the One Student One Job policy?",
-                "top_k": 3
+                "top_k": 3,
+                "session_id": None
             }
         }
 
@@ -94,5 +103,29 @@ class SourceChunk(BaseModel):
 class ChatResponse(BaseModel):
     """Response model for RAG chat endpoint"""
     query: str = Field(..., description="Original user question")
-    answer: str = Field(..., description="Generated answer from FLAN-T5")
+    answer: Optional[str] = Field(..., description="Generated answer from FLAN-T5 (null if the deadline left no time to generate one)")
     sources: List[SourceChunk] = Field(..., description="Source chunks used to generate the answer")
+    model: Optional[str] = Field(None, description="LLM that generated the answer (chosen by the router; null if no LLM was called)")
+    session_id: Optional[str] = Field(None, description="Conversation id to send with follow-up questions")
+    degradations: List[str] = Field(
+        default_factory=list,
+        description="Shortcuts taken to meet the deadline, in order: skip_optional, reduced_search, fast_model, no_generation"
+    )
+    answer_path: str = Field(
+        "llm",
+        description="How the answer was produced: llm, extractive (a retrieved sentence, no LLM call), sources_only or no_results"
+    )
+
+
+class PrefetchRequest(BaseModel):
+    """Request model for speculative prefetch of a question being typed"""
+    query: str = Field(..., description="Text typed so far", min_length=1)
+    client_id: str = Field(..., description="Stable id of the input box; a newer prefetch cancels the previous one", min_length=1, max_length=64)
+    top_k: Optional[int] = Field(3, description="Same top_k the question will be sent with", ge=1, le=10)
+    min_score: Optional[float] = Field(None, description="Same min_score the question will be sent with", ge=0.0, le=1.0)
+    tenant_id: Optional[str] = Field(None, description="Institute the question is for (the deployment's default if omitted)", max_length=64)
+
+
+class PrefetchResponse(BaseModel):
+    """Response model for the prefetch endpoint"""
+    status: str = Field(..., description="scheduled, or skipped (disabled, too short, busy or tenant not loaded)")
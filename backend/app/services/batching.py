@@ -0,0 +1,140 @@
+"""
+Micro-batching for query embeddings
+
+Collects query texts from concurrent requests for a few milliseconds
+(or until the batch is full) and embeds them in one batched call,
+resolving each caller's future with its own row.
+
+Batches belong to no single request: the collector runs in a fresh
+context, so no caller's deadline, priority or trace leaks into later
+batches. Each batch goes upstream at the most urgent priority among its
+callers, and each caller bounds its own wait (see within_deadline()).
+"""
+
+import asyncio
+import contextvars
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from app.services.scheduler import PRIORITIES, current_priority, priority
+
+
+class MicroBatcher:
+    """Async scheduler that groups single-text embedding requests into batches"""
+
+    # Upper bounds of the batch-size histogram buckets
+    HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Args:
+            batch_fn: Blocking function embedding a list of texts into an (n, dim) array
+            max_batch_size: Dispatch as soon as this many texts are pending
+            max_wait_ms: Longest time the first text in a batch waits for company
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatching = set()
+
+        self.batches = 0
+        self.items = 0
+        self.max_observed = 0
+        self.histogram = {f"<={bound}": 0 for bound in self.HISTOGRAM_BOUNDS}
+        self.histogram[f">{self.HISTOGRAM_BOUNDS[-1]}"] = 0
+
+    async def submit(self, text: str) -> np.ndarray:
+        """
+        Queue a text and wait for its embedding.
+
+        Args:
+            text: Query text to embed
+
+        Returns:
+            Embedding vector for this text
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, current_priority()))
+        return await future
+
+    def _ensure_worker(self):
+        """Start the collector on the current event loop on first use"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Not in the context of the request that happens to come first:
+            # its deadline would cut off every later batch
+            self._worker = contextvars.Context().run(loop.create_task, self._collect())
+
+    async def _collect(self):
+        """Group queued texts into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Run the batch concurrently so the next one can start collecting
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future, str]]):
+        """Embed one batch and resolve every waiting caller"""
+        self._record(len(batch))
+        texts = [text for text, _, _ in batch]
+        urgent = min((name for _, _, name in batch), key=PRIORITIES.__getitem__)
+
+        try:
+            with priority(urgent):
+                vectors = await asyncio.to_thread(self.batch_fn, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def _record(self, size: int):
+        """Update batch-size metrics"""
+        self.batches += 1
+        self.items += size
+        self.max_observed = max(self.max_observed, size)
+        for bound in self.HISTOGRAM_BOUNDS:
+            if size <= bound:
+                self.histogram[f"<={bound}"] += 1
+                return
+        self.histogram[f">{self.HISTOGRAM_BOUNDS[-1]}"] += 1
+
+    def stats(self) -> Dict:
+        """Batch-size metrics for the metrics endpoint"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_observed,
+            "histogram": dict(self.histogram)
+        }
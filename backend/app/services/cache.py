@@ -0,0 +1,398 @@
+"""
+Two-level cache: in-process LRU in front of a shared tier
+
+The shared tier is what makes cache hits carry over between uvicorn
+workers and restarts. Backends:
+    - "redis":  any Redis-protocol server (requires the `redis` package)
+    - "sqlite": a local SQLite file, a stand-in for single-host deployments
+    - "none":   in-process LRU only
+
+Keys are versioned by the caller (corpus version, model names), so stale
+entries are simply never read again and age out via their TTL.
+
+Values in the shared tier are JSON: numpy arrays are stored as base64
+bytes with their dtype and shape, and objects only as classes registered
+with @cache_serializable. Reading an entry never runs code, so whoever
+can write to Redis or the SQLite file cannot execute anything in a worker.
+"""
+
+import asyncio
+import base64
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import orjson
+
+from app.config import get_settings
+
+
+_TYPE_TAG = "__cache_type__"
+
+# Classes whose instances may be stored in the shared tier, by name
+_SERIALIZABLE: Dict[str, type] = {}
+
+
+def cache_serializable(cls: type) -> type:
+    """
+    Class decorator allowing instances in the shared cache tier.
+
+    The class must declare __slots__ matching its __init__ parameters;
+    instances are stored as their slot values and rebuilt with cls(**slots).
+    """
+    _SERIALIZABLE[cls.__name__] = cls
+    return cls
+
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return {
+            _TYPE_TAG: "ndarray",
+            "dtype": value.dtype.str,
+            "shape": list(value.shape),
+            "data": base64.b64encode(np.ascontiguousarray(value).tobytes()).decode("ascii")
+        }
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if type(value).__name__ in _SERIALIZABLE:
+        return {
+            _TYPE_TAG: type(value).__name__,
+            "fields": {slot: _to_plain(getattr(value, slot)) for slot in type(value).__slots__}
+        }
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Cannot store {type(value).__name__} in the shared cache")
+
+
+def _from_plain(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_plain(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    tag = value.get(_TYPE_TAG)
+    if tag is None:
+        return {key: _from_plain(item) for key, item in value.items()}
+    if tag == "ndarray":
+        data = base64.b64decode(value["data"])
+        return np.frombuffer(data, dtype=np.dtype(value["dtype"])).reshape(value["shape"]).copy()
+    cls = _SERIALIZABLE.get(tag)
+    if cls is None:
+        raise ValueError(f"Unknown cached type '{tag}'")
+    return cls(**{key: _from_plain(item) for key, item in value["fields"].items()})
+
+
+def encode_value(value: Any) -> bytes:
+    """Serialize a cache value for the shared tier"""
+    return orjson.dumps(_to_plain(value))
+
+
+def decode_value(payload: bytes) -> Any:
+    """
+    Rebuild a value stored by encode_value.
+
+    Tuples come back as lists.
+
+    Raises:
+        ValueError: If the payload is not a valid cache entry
+    """
+    try:
+        return _from_plain(orjson.loads(payload))
+    except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed cache entry: {e}") from e
+
+
+class CacheBackend:
+    """Shared byte-value store used as the second cache level"""
+
+    name = "none"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+
+class RedisBackend(CacheBackend):
+    """Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly, ...)"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "CACHE_BACKEND=redis requires the 'redis' package: pip install redis"
+            ) from e
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None):
+        self.client.set(key, value, ex=int(ttl_s) if ttl_s else None)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+class SQLiteBackend(CacheBackend):
+    """SQLite file shared by all workers on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets workers read while one writes"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None):
+        expires_at = time.time() + ttl_s if ttl_s else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at)
+        )
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        """Delete expired rows; returns how many were removed"""
+        cursor = self._connection().execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        expires_at = time.monotonic() + ttl_s if ttl_s else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """In-process LRU backed by a shared CacheBackend"""
+
+    def __init__(self, local: LRUCache, shared: CacheBackend, prefix: str = "rag"):
+        """
+        Args:
+            local: First-level in-process cache
+            shared: Second-level cache shared across workers
+            prefix: Namespace prepended to every shared key
+        """
+        self.local = local
+        self.shared = shared
+        self.prefix = prefix
+
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key(self, kind: str, *parts: Any) -> str:
+        """
+        Build a cache key from a kind and the values it depends on.
+
+        Args:
+            kind: Entry type ("embedding", "retrieval", "answer", ...)
+            *parts: Everything that changes the value: versions, model names, query, params
+
+        Returns:
+            Key such as "rag:retrieval:3f2a..."
+        """
+        digest = hashlib.sha1("\x1f".join(map(str, parts)).encode()).hexdigest()
+        return f"{self.prefix}:{kind}:{digest}"
+
+    def get(self, key: str) -> Any:
+        """Look up the local tier, then the shared tier (promoting hits)"""
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        try:
+            payload = self.shared.get(key)
+        except Exception:
+            # The shared tier is an optimization; never fail a request on it
+            self.errors += 1
+            payload = None
+
+        if payload is None:
+            self.misses += 1
+            return None
+
+        try:
+            value = decode_value(payload)
+        except ValueError:
+            # Written by an older version or not by us; recomputed and overwritten
+            self.errors += 1
+            self.misses += 1
+            return None
+        self.local.set(key, value)
+        self.shared_hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        """Store in both tiers"""
+        self.local.set(key, value, ttl_s)
+        try:
+            self.shared.set(key, encode_value(value), ttl_s)
+        except Exception:
+            self.errors += 1
+
+    async def aget(self, key: str) -> Any:
+        """Async get: local tier inline, shared tier in a worker thread"""
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+        if self.shared.name == "none":
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        """Async set: shared-tier write happens in a worker thread"""
+        if self.shared.name == "none":
+            self.local.set(key, value, ttl_s)
+            return
+        await asyncio.to_thread(self.set, key, value, ttl_s)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for the metrics endpoint"""
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "backend": self.shared.name,
+            "local_items": len(self.local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def namespaced(self, namespace: str) -> "NamespacedCache":
+        """View of this cache whose keys cannot collide with other namespaces"""
+        return NamespacedCache(self, namespace)
+
+
+class NamespacedCache:
+    """
+    TieredCache view with its own key prefix (one per tenant).
+
+    Lookups, tiers and counters are the underlying cache's; only key()
+    differs, so every entry a tenant's services create is isolated.
+    """
+
+    def __init__(self, cache: TieredCache, namespace: str):
+        self._cache = cache
+        self.namespace = namespace
+        self.prefix = f"{cache.prefix}:{namespace}"
+
+    key = TieredCache.key
+
+    def __getattr__(self, name: str):
+        return getattr(self._cache, name)
+
+
+def build_backend(name: str, url: str = "", sqlite_path: str = "") -> CacheBackend:
+    """Create the shared cache backend named in Settings"""
+    if name == "redis":
+        return RedisBackend(url)
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    if name == "none":
+        return CacheBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND '{name}'. Choose one of: redis, sqlite, none")
+
+
+_cache: Optional[TieredCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """Process-wide TieredCache configured from Settings"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = get_settings()
+            _cache = TieredCache(
+                local=LRUCache(settings.CACHE_LOCAL_MAX_ITEMS),
+                shared=build_backend(
+                    settings.CACHE_BACKEND,
+                    url=settings.CACHE_URL,
+                    sqlite_path=settings.CACHE_SQLITE_PATH
+                )
+            )
+        return _cache
@@ -0,0 +1,166 @@
+"""
+Centroid index for two-stage (coarse-to-fine) vector search
+
+At ingestion every chunk is assigned to a group (a page or a section
+of its document) and the normalized mean embedding of each group and
+of each whole document is stored next to the chunks. A query then:
+    1. scores the document centroids and keeps the best documents
+    2. scores the groups of those documents and keeps the top M
+    3. runs the vector search filtered to the chunks of those groups
+
+Centroids are few compared to chunks and are scored in memory, so the
+fine search only ever covers a fixed fan-out of groups instead of the
+whole corpus.
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.quantization import decode_vector, encode_vector, normalize
+
+
+GROUP_LEVELS = ("page", "section")
+
+
+def _group_id(*parts) -> str:
+    return hashlib.md5("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _centroid(embeddings: np.ndarray) -> np.ndarray:
+    return normalize(embeddings.mean(axis=0).astype(np.float32))
+
+
+def build_groups(
+    documents: List[Dict],
+    embeddings: np.ndarray,
+    level: str = "page"
+) -> List[Dict]:
+    """
+    Assign chunks to groups and compute the group and document centroids.
+
+    Sets "group_id" on every document, so it must run before the documents
+    are inserted.
+
+    Args:
+        documents: Chunk documents with metadata (source, page) and, for
+            level "section", parent_id
+        embeddings: (n, dim) normalized embeddings, row-aligned with documents
+        level: "page" or "section" (falls back to the page for chunks
+            without a parent_id)
+
+    Returns:
+        Group documents (level "group" and "document") for VectorStore.insert_groups()
+    """
+    if level not in GROUP_LEVELS:
+        raise ValueError(f"Unknown CENTROID_GROUP_LEVEL '{level}'. Choose one of: {', '.join(GROUP_LEVELS)}")
+
+    # Step 1: Assign each chunk to its group and its document
+    members: Dict[str, List[int]] = {}
+    group_source: Dict[str, str] = {}
+    source_members: Dict[str, List[int]] = {}
+    for i, doc in enumerate(documents):
+        metadata = doc.get("metadata", {})
+        source = metadata.get("source", "")
+        if level == "section" and doc.get("parent_id"):
+            group_id = _group_id(source, "section", doc["parent_id"])
+        else:
+            group_id = _group_id(source, "page", metadata.get("page"))
+        doc["group_id"] = group_id
+        members.setdefault(group_id, []).append(i)
+        group_source[group_id] = source
+        source_members.setdefault(source, []).append(i)
+
+    # Step 2: Normalized mean embedding per group and per document
+    groups = [
+        {
+            "group_id": group_id,
+            "level": "group",
+            "document_id": _group_id(group_source[group_id]),
+            "count": len(rows),
+            "embedding": encode_vector(_centroid(embeddings[rows]), "float32")
+        }
+        for group_id, rows in members.items()
+    ]
+    groups.extend(
+        {
+            "group_id": _group_id(source),
+            "level": "document",
+            "source": source,
+            "count": len(rows),
+            "embedding": encode_vector(_centroid(embeddings[rows]), "float32")
+        }
+        for source, rows in source_members.items()
+    )
+    return groups
+
+
+class CentroidIndex:
+    """In-memory document and group centroids of one collection version"""
+
+    def __init__(self, groups: List[Dict]):
+        """
+        Args:
+            groups: Group documents as written by build_groups()
+        """
+        documents = [g for g in groups if g.get("level") == "document"]
+        fine = [g for g in groups if g.get("level") == "group"]
+
+        self.document_ids = [d["group_id"] for d in documents]
+        self.document_matrix = self._matrix(documents)
+        self.group_ids = [g["group_id"] for g in fine]
+        self.group_matrix = self._matrix(fine)
+
+        # Row indexes of each document's groups
+        position = {doc_id: i for i, doc_id in enumerate(self.document_ids)}
+        self.group_document = np.array([position.get(g["document_id"], -1) for g in fine], dtype=np.int64)
+
+    @staticmethod
+    def _matrix(groups: List[Dict]) -> np.ndarray:
+        if not groups:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([decode_vector(g["embedding"]) for g in groups]).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.group_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.document_matrix.nbytes + self.group_matrix.nbytes + self.group_document.nbytes
+
+    def top_groups(
+        self,
+        query_embedding: np.ndarray,
+        top_groups: int,
+        top_documents: int = 0
+    ) -> Tuple[List[str], Optional[int]]:
+        """
+        Groups whose centroids are closest to the query.
+
+        Args:
+            query_embedding: Normalized query vector
+            top_groups: Groups to keep (M)
+            top_documents: Only consider groups of this many best documents
+                (0 considers every group)
+
+        Returns:
+            (group ids best first, number of documents considered or None)
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        candidates = np.arange(len(self.group_ids))
+        documents_considered = None
+
+        if 0 < top_documents < len(self.document_ids):
+            document_scores = self.document_matrix @ query
+            best_documents = np.argpartition(-document_scores, top_documents - 1)[:top_documents]
+            candidates = candidates[np.isin(self.group_document, best_documents)]
+            documents_considered = top_documents
+
+        scores = self.group_matrix[candidates] @ query
+        keep = min(top_groups, len(candidates))
+        if keep == 0:
+            return [], documents_considered
+        best = np.argpartition(-scores, keep - 1)[:keep]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.group_ids[candidates[i]] for i in best], documents_considered
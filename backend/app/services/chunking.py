@@ -0,0 +1,162 @@
+"""
+Structure-aware chunking with small-to-big (parent/child) retrieval
+
+The placement policy is organised in numbered sections and clauses. The
+chunker detects those boundaries in the extracted text and produces:
+    - parents:  one per clause or section (split further only if very
+                long), stored once and passed to the LLM whole
+    - children: small overlapping windows of a parent, embedded and
+                indexed for precise vector matching; each carries its
+                parent_id
+
+Retrieval matches children and returns their deduplicated parents.
+"""
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.config import get_settings
+
+
+# Lines that open a new section or clause
+_HEADINGS = (
+    re.compile(r"^\d{1,2}(\.\d{1,2}){0,3}[.)]?\s+\S"),  # "3.", "3.2", "3.2.1 Eligibility"
+    re.compile(r"^(section|clause|article|chapter|annexure|appendix)\s+[\dIVXA-Z]+\b", re.IGNORECASE),
+    re.compile(r"^[IVX]{1,5}\.\s+\S"),  # "IV. Code of Conduct"
+    re.compile(r"^[A-Z][A-Z0-9 &/,\-()]{3,80}:?$"),  # Short ALL-CAPS headings
+)
+
+# "(a)", "a)", "ii)" style items stay inside their clause
+_SUB_ITEM = re.compile(r"^\(?([a-z]|[ivx]{1,4})\)\s")
+
+# Headings are short; longer numbered lines are list items of a clause body
+MAX_HEADING_CHARS = 120
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > MAX_HEADING_CHARS or _SUB_ITEM.match(stripped):
+        return False
+    return any(pattern.match(stripped) for pattern in _HEADINGS)
+
+
+def _content_id(*parts: str) -> str:
+    return hashlib.md5("\x1f".join(parts).encode()).hexdigest()
+
+
+class StructureAwareChunker:
+    """Splits page texts into clause-level parents and small indexed children"""
+
+    def __init__(
+        self,
+        child_size: int = 300,
+        child_overlap: int = 50,
+        max_parent_chars: int = 3000,
+        min_parent_chars: int = 200
+    ):
+        """
+        Args:
+            child_size: Maximum characters per indexed child chunk
+            child_overlap: Overlapping characters between neighbouring children
+            max_parent_chars: Longer sections are split into several parents
+            min_parent_chars: Shorter sections (lone headings) are merged into the next one
+        """
+        self.max_parent_chars = max_parent_chars
+        self.min_parent_chars = min_parent_chars
+        self.child_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=child_size,
+            chunk_overlap=child_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        self.parent_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=max_parent_chars,
+            chunk_overlap=0,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+
+    @classmethod
+    def from_settings(cls) -> "StructureAwareChunker":
+        """Build the chunker from the chunk sizes in Settings"""
+        settings = get_settings()
+        return cls(
+            child_size=settings.CHILD_CHUNK_SIZE,
+            child_overlap=settings.CHILD_CHUNK_OVERLAP,
+            max_parent_chars=settings.PARENT_MAX_CHARS
+        )
+
+    def _sections(self, pages: List[Tuple[Optional[int], str]]) -> List[Dict]:
+        """Group lines into sections at detected headings, remembering start pages"""
+        sections = []
+        current = {"heading": None, "page": None, "lines": []}
+
+        for page, text in pages:
+            for line in text.splitlines():
+                if _is_heading(line) and sum(len(l) for l in current["lines"]) >= self.min_parent_chars:
+                    sections.append(current)
+                    current = {"heading": None, "page": None, "lines": []}
+                if current["page"] is None and line.strip():
+                    current["page"] = page
+                if current["heading"] is None and _is_heading(line):
+                    current["heading"] = line.strip()
+                current["lines"].append(line)
+
+        sections.append(current)
+        return [s for s in sections if "".join(s["lines"]).strip()]
+
+    def split(
+        self,
+        pages: List[Tuple[Optional[int], str]],
+        source: str
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Chunk a document.
+
+        Args:
+            pages: (page number, extracted text) pairs in reading order
+            source: Document path, kept in metadata
+
+        Returns:
+            (parents, children). Parents have parent_id, text and metadata
+            (source, page, section heading); children have chunk_id, text,
+            parent_id, chunk_index and metadata, ready for embedding.
+        """
+        parents = []
+        children = []
+
+        for section in self._sections(pages):
+            text = "\n".join(section["lines"]).strip()
+            pieces = [text] if len(text) <= self.max_parent_chars else self.parent_splitter.split_text(text)
+
+            for piece in pieces:
+                parent_id = _content_id(source, piece)
+                metadata = {
+                    "source": source,
+                    "page": section["page"],
+                    "section": section["heading"]
+                }
+                parents.append({
+                    "parent_id": parent_id,
+                    "text": piece,
+                    "metadata": metadata
+                })
+                # Children repeat the heading so a window of a clause body still
+                # matches questions phrased in terms of its title
+                heading = section["heading"]
+                body = piece[len(heading):].strip() if heading and piece.startswith(heading) else piece
+                for child_text in self.child_splitter.split_text(body or piece):
+                    if heading:
+                        child_text = f"{heading}\n{child_text}"
+                    children.append({
+                        "chunk_id": _content_id(parent_id, child_text),
+                        "text": child_text,
+                        "parent_id": parent_id,
+                        "chunk_index": len(children),
+                        "metadata": metadata
+                    })
+
+        return parents, children
@@ -0,0 +1,215 @@
+"""
+Extractive contextual compression
+
+Retrieved chunks are ~1000 characters, but usually only one or two
+sentences in each matter. The compressor splits chunks into sentences,
+scores every sentence against the query embedding with one matrix
+product, and keeps only the best ones under their original citation
+numbers.
+
+Sentence embeddings are precomputed at ingestion time and stored on the
+chunk documents; chunks ingested before that are embedded on first use
+and cached by chunk id. When a request is short of time, that embedding
+is skipped and such chunks go into the context whole.
+"""
+
+import copy
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.services.deadlines import degrade
+from app.services.quantization import decode_vector, encode_vector
+
+
+# Sentence ends, or line breaks (the policy PDF uses many bullet lines)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9(\"'•\-])|\n+")
+
+# Fragments shorter than this are merged into the following sentence
+MIN_SENTENCE_CHARS = 25
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split a chunk into sentences.
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        Non-empty sentences; very short fragments (headings, list
+        markers) are merged into the sentence that follows them
+    """
+    sentences = []
+    carry = ""
+    for part in _SENTENCE_BOUNDARY.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        part = f"{carry} {part}".strip() if carry else part
+        if len(part) < MIN_SENTENCE_CHARS:
+            carry = part
+            continue
+        sentences.append(part)
+        carry = ""
+
+    if carry:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {carry}"
+        else:
+            sentences.append(carry)
+    return sentences
+
+
+def embed_chunk_sentences(texts: List[str], embedding_service) -> List[Tuple[List[str], np.ndarray]]:
+    """
+    Split chunks into sentences and embed all of them in one batched pass.
+
+    Args:
+        texts: Chunk texts
+        embedding_service: EmbeddingService used for the batch
+
+    Returns:
+        One (sentences, (n_sentences, dim) float32 array) pair per chunk
+    """
+    split = [split_sentences(text) for text in texts]
+    flat = [sentence for sentences in split for sentence in sentences]
+    matrix = embedding_service.generate_embeddings(flat) if flat else None
+
+    output = []
+    offset = 0
+    for sentences in split:
+        rows = matrix[offset:offset + len(sentences)] if matrix is not None else np.empty((0, 0), np.float32)
+        output.append((sentences, rows))
+        offset += len(sentences)
+    return output
+
+
+def sentence_fields(sentences: List[str], embeddings: np.ndarray) -> Dict:
+    """Document fields storing a chunk's sentences and their embeddings"""
+    return {
+        "sentences": sentences,
+        # Row-major (n_sentences, dim) matrix packed into one float32 vector
+        "sentence_embeddings": encode_vector(embeddings.ravel(), "float32")
+    }
+
+
+def decode_sentence_embeddings(value, n_sentences: int) -> Optional[np.ndarray]:
+    """Inverse of sentence_fields() for the embeddings matrix"""
+    if value is None or not n_sentences:
+        return None
+    return decode_vector(value).reshape(n_sentences, -1)
+
+
+def _with_sentences(result, sentences: List[str], embeddings: np.ndarray):
+    """Copy of a retrieved chunk carrying its sentences and their embeddings"""
+    filled = copy.copy(result)
+    filled.sentences, filled.sentence_embeddings = sentences, embeddings
+    return filled
+
+
+class ContextCompressor:
+    """Keeps the sentences of retrieved chunks that best match the query"""
+
+    def __init__(self, embedding_service, cache, max_sentences: int = 8, cache_ttl_s: Optional[float] = None):
+        """
+        Args:
+            embedding_service: Used for chunks without precomputed sentence embeddings
+            cache: TieredCache for computed sentence embeddings
+            max_sentences: Sentences kept across all chunks
+            cache_ttl_s: TTL for cached sentence embeddings
+        """
+        self.embedding_service = embedding_service
+        self.cache = cache
+        self.max_sentences = max_sentences
+        self.cache_ttl_s = cache_ttl_s
+
+    def _sentence_key(self, chunk_id: str) -> str:
+        # chunk_id is a hash of the chunk text, so it identifies the content
+        return self.cache.key("sentences", self.embedding_service.model_name, chunk_id)
+
+    def with_sentence_embeddings(self, results: List, compute: bool = True) -> List:
+        """
+        Results with sentences/embeddings filled in where they were missing
+        (cache, then one batch).
+
+        Results are shared through the retrieval cache and coalesced
+        requests, so they are never modified: those that lack sentence
+        embeddings are replaced by copies carrying them.
+
+        Args:
+            results: Retrieved chunks
+            compute: Embed the sentences of chunks missing from the cache; if
+                False, those chunks are left without sentence embeddings
+
+        Returns:
+            The results in the same order
+        """
+        filled = list(results)
+        missing = []
+        for index, result in enumerate(filled):
+            if result.sentence_embeddings is not None:
+                continue
+            cached = self.cache.get(self._sentence_key(result.chunk_id))
+            if cached is not None:
+                filled[index] = _with_sentences(result, *cached)
+            else:
+                missing.append(index)
+
+        if not missing or not compute:
+            return filled
+
+        computed = embed_chunk_sentences([filled[i].text for i in missing], self.embedding_service)
+        for index, (sentences, embeddings) in zip(missing, computed):
+            filled[index] = _with_sentences(filled[index], sentences, embeddings)
+            self.cache.set(self._sentence_key(filled[index].chunk_id), (sentences, embeddings), self.cache_ttl_s)
+        return filled
+
+    def compress(self, query_embedding: np.ndarray, results: List) -> str:
+        """
+        Build a compressed, citation-numbered context.
+
+        Args:
+            query_embedding: Normalized query vector computed during retrieval
+            results: Retrieved chunks in rank order (citation i+1 = results[i])
+
+        Returns:
+            Context with one "[i] sentence ..." block per chunk that kept any
+            sentences, and the full text of chunks that could not be scored
+        """
+        # Embedding sentences on the fly is optional work a tight deadline skips
+        results = self.with_sentence_embeddings(results, compute=not degrade("skip_optional"))
+
+        owners = []
+        blocks = []
+        whole = []
+        for index, result in enumerate(results):
+            if result.sentence_embeddings is None:
+                whole.append(index)
+            elif result.sentences:
+                owners.extend((index, position) for position in range(len(result.sentences)))
+                blocks.append(result.sentence_embeddings)
+
+        if not owners:
+            return "\n\n".join(f"[{i+1}] {r.text}" for i, r in enumerate(results))
+
+        # One batched dot product scores every sentence of every chunk
+        scores = np.concatenate(blocks) @ np.asarray(query_embedding, dtype=np.float32)
+        keep = np.argsort(-scores, kind="stable")[:self.max_sentences]
+
+        kept: Dict[int, Optional[List[int]]] = {}
+        for flat_index in keep:
+            index, position = owners[flat_index]
+            kept.setdefault(index, []).append(position)
+
+        for index in whole:
+            kept[index] = None
+
+        # Chunks stay in rank order and sentences in reading order
+        return "\n\n".join(
+            f"[{index+1}] " + (
+                results[index].text if kept[index] is None
+                else " ".join(results[index].sentences[p] for p in sorted(kept[index]))
+            )
+            for index in sorted(kept)
+        )
@@ -0,0 +1,181 @@
+"""
+End-to-end request deadlines with staged degradation
+
+A request gets a time budget (its deadline_ms, or REQUEST_DEADLINE_MS).
+The deadline travels with the request in a context variable, which
+asyncio.to_thread copies into worker threads, and every stage checks
+the remaining budget before optional or expensive work. As the budget
+shrinks, degradations are applied in a fixed order:
+    1. skip_optional: chunks without stored sentence embeddings are not
+       embedded for compression; their full text goes into the prompt
+    2. reduced_search: the vector search considers fewer candidates
+    3. fast_model: generation uses the fast model whatever the router says
+    4. no_generation: the retrieved sources are returned without an answer
+       (unless the extractive fast path finds one)
+
+Upstream calls and admission waits are capped at the remaining budget
+too. A generation cut short by the deadline degrades to no_generation
+instead of failing the request. The degradations applied are returned
+with the response, and degraded results are never cached.
+
+Coalesced requests share the work of the request that started it, under
+that request's deadline. Coalescing keys therefore include a deadline
+bucket, so only requests with similar budgets share, and every caller
+still waits no longer than its own deadline.
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, List, Optional
+
+from app.config import get_settings
+from app.services.tracing import annotate
+
+
+DEGRADATIONS = ("skip_optional", "reduced_search", "fast_model", "no_generation")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before a required stage completed"""
+
+
+class Deadline:
+    """Time budget of one request and the degradations applied so far"""
+
+    def __init__(self, budget_s: float, thresholds_s: Dict[str, float]):
+        """
+        Args:
+            budget_s: Time allowed for the whole request
+            thresholds_s: Per degradation, the remaining budget below which it applies
+        """
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+        self.thresholds_s = thresholds_s
+        self.applied: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining_s(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def degrade(self, name: str) -> bool:
+        """
+        Whether the remaining budget calls for a degradation.
+
+        A degradation that applies is recorded, and keeps applying for the
+        rest of the request.
+        """
+        if name in self.applied:
+            return True
+        if self.remaining_s() >= self.thresholds_s[name]:
+            return False
+        self.apply(name)
+        return True
+
+    def apply(self, name: str):
+        """Record a degradation regardless of the remaining budget"""
+        with self._lock:
+            if name not in self.applied:
+                # Reported in the defined order, whichever stage checked first
+                self.applied = sorted(self.applied + [name], key=DEGRADATIONS.index)
+            annotate(degradations=list(self.applied))
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+@contextmanager
+def request_deadline(deadline_ms: Optional[float] = None):
+    """
+    Run the enclosed request (and worker threads started from it) under a deadline.
+
+    Args:
+        deadline_ms: Budget of this request (REQUEST_DEADLINE_MS if omitted;
+            no deadline if both are 0)
+
+    Example:
+        with request_deadline(request.deadline_ms):
+            response = await pipeline.aanswer(query)
+    """
+    settings = get_settings()
+    budget_ms = deadline_ms or settings.REQUEST_DEADLINE_MS
+    if not budget_ms:
+        yield None
+        return
+
+    deadline = Deadline(
+        budget_ms / 1000.0,
+        thresholds_s={
+            "skip_optional": settings.DEGRADE_SKIP_OPTIONAL_MS / 1000.0,
+            "reduced_search": settings.DEGRADE_REDUCED_SEARCH_MS / 1000.0,
+            "fast_model": settings.DEGRADE_FAST_MODEL_MS / 1000.0,
+            "no_generation": settings.DEGRADE_NO_GENERATION_MS / 1000.0
+        }
+    )
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining_s() -> float:
+    """Remaining budget of the current request (infinite without a deadline)"""
+    deadline = _current_deadline.get()
+    return deadline.remaining_s() if deadline is not None else float("inf")
+
+
+def degrade(name: str) -> bool:
+    """Whether the current request should apply a degradation (never without a deadline)"""
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.degrade(name)
+
+
+def apply_degradation(name: str):
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.apply(name)
+
+
+def deadline_bucket() -> Optional[int]:
+    """
+    Coarse remaining budget for coalescing keys (None without a deadline).
+
+    Requests in the same bucket have remaining budgets within a factor of
+    two, so sharing one's degradations or deadline is fair to the other.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return int(math.log2(max(1.0, deadline.remaining_s() * 1000)))
+
+
+def applied_degradations() -> List[str]:
+    """Degradations applied to the current request so far"""
+    deadline = _current_deadline.get()
+    return list(deadline.applied) if deadline is not None else []
+
+
+async def within_deadline(awaitable: Awaitable):
+    """
+    Await something for at most the remaining budget.
+
+    Raises:
+        DeadlineExceeded: If the budget runs out first
+    """
+    budget = remaining_s()
+    if budget == float("inf"):
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded") from None
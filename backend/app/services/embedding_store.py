@@ -0,0 +1,177 @@
+"""
+Persistent, content-addressed store of chunk embeddings
+
+Embeddings are keyed by (model, sha256 of the whitespace-normalized text),
+independently of any MongoDB collection. Re-chunking experiments,
+collection rebuilds and disaster recovery re-embed only text the model
+has never seen.
+
+Backed by a SQLite file (WAL mode, one connection per thread), like the
+shared cache tier. Vectors are stored as raw float32 bytes.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+from app.config import get_settings
+
+
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_BATCH = 500
+
+
+def text_key(text: str) -> str:
+    """Content address of a chunk: whitespace-insensitive, case-sensitive"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """(model, text hash) -> float32 embedding, persisted in SQLite"""
+
+    def __init__(self, path: str = ".cache/embeddings.sqlite3"):
+        """
+        Args:
+            path: SQLite file; created with its parent directory if missing
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["EmbeddingStore"]:
+        """Store configured in Settings, or None when it is disabled"""
+        settings = get_settings()
+        return cls(settings.EMBEDDING_STORE_PATH) if settings.EMBEDDING_STORE_ENABLED else None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Bulk lookup.
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            Mapping of position in `texts` to its stored float32 vector;
+            positions without a stored embedding are absent
+        """
+        keys = [text_key(text) for text in texts]
+        positions: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+
+        found: Dict[int, np.ndarray] = {}
+        conn = self._connection()
+        unique = list(positions)
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                f"AND text_hash IN ({','.join('?' * len(batch))})",
+                (model, *batch)
+            ).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                for i in positions[key]:
+                    found[i] = vector
+
+            hit_keys = [key for key, _ in rows]
+            if hit_keys:
+                # last_used drives evict(); one statement per batch
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(hit_keys))})",
+                    (time.time(), model, *hit_keys)
+                )
+
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """
+        Store embeddings for texts, one row of `vectors` per text.
+
+        Args:
+            model: Embedding model name
+            texts: Embedded texts
+            vectors: (len(texts), dim) float32 array
+        """
+        now = time.time()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, text_key(text), row.tobytes(), now) for text, row in zip(texts, vectors)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def evict(self, older_than_s: Optional[float] = None, model: Optional[str] = None) -> int:
+        """
+        Delete embeddings not used recently and/or of one model.
+
+        Args:
+            older_than_s: Delete rows whose last use is older than this
+            model: Restrict deletion to this model (all of it if older_than_s is None)
+
+        Returns:
+            Number of rows deleted
+        """
+        clauses, params = [], []
+        if older_than_s is not None:
+            clauses.append("last_used < ?")
+            params.append(time.time() - older_than_s)
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        if not clauses:
+            raise ValueError("evict() needs older_than_s and/or model")
+        cursor = self._connection().execute(
+            f"DELETE FROM embeddings WHERE {' AND '.join(clauses)}", params
+        )
+        return cursor.rowcount
+
+    def compact(self):
+        """Reclaim the space of deleted rows and fold the WAL into the main file"""
+        conn = self._connection()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> Dict:
+        """Rows per model, file size and this process's hit counters"""
+        rows = self._connection().execute(
+            "SELECT model, COUNT(*) FROM embeddings GROUP BY model"
+        ).fetchall()
+        return {
+            "models": dict(rows),
+            "file_bytes": Path(self.path).stat().st_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -1,17 +1,23 @@
-from huggingface_hub import InferenceClient
-from typing import List
+from typing import List, Optional
+import numpy as np
 import os
 
+from app.services.quantization import normalize
+from app.services.resilience import get_upstream
+from app.services.embedding_store import EmbeddingStore
+
 class EmbeddingService:
-    def __init__(self, model_name: str, api_key: str = None):
+    def __init__(self, model_name: str, api_key: str = None, store: Optional[EmbeddingStore] = None):
         """
         Initialize embedding service using HuggingFace Inference API.
         
         Args:
             model_name: HuggingFace model ID (e.g., 'sentence-transformers/all-MiniLM-L6-v2')
             api_key: HuggingFace API token (if not provided, uses HF_TOKEN env var)
+            store: Persistent embedding store consulted by generate_embeddings()
         """
         self.model_name = model_name
+        self.store = store
         self.api_key = api_key or os.getenv("HUGGINGFACE_API_KEY")
         
         if not self.api_key:
@@ -20,41 +26,71 @@ class EmbeddingService:
                 "Set HUGGINGFACE_API_KEY in .env or pass api_key parameter."
             )
         
-        # Initialize HuggingFace Inference Client
-        self.client = InferenceClient(token=self.api_key)
+        # Initialize HuggingFace Inference Client; retries, hedging and
+        # circuit breaking (and rate-limit admission) are handled by the
+        # shared upstream wrapper
+        self.upstream = get_upstream("huggingface")
+        # Imported here: huggingface_hub's inference client is slow to import
+        # and only needed once a service is built
+        from huggingface_hub import InferenceClient
+        self.client = InferenceClient(token=self.api_key, timeout=self.upstream.timeout_s)
         
         # Dimension for all-MiniLM-L6-v2 is 384
         # Update this if using a different model
         self.dimension = 384
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         """
         Generate embeddings for a list of texts using HuggingFace API.
         
+        Each batch is sent as one request. Rows are written into one
+        preallocated float32 buffer and L2-normalized in place, so no
+        per-element Python floats are created. With a store attached,
+        only texts it does not already hold are sent to the API.
+        
         Args:
             texts: List of strings to embed
+            batch_size: Texts per API request
             
         Returns:
-            List of embedding vectors (each is a list of floats)
+            Contiguous float32 array of shape (len(texts), dimension)
         """
-        embeddings = []
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        
+        # Stored rows are already normalized; only the rest is embedded
+        missing = list(range(len(texts)))
+        if self.store is not None and texts:
+            stored = self.store.get_many(self.model_name, texts)
+            for i, vector in stored.items():
+                embeddings[i] = vector
+            missing = [i for i in missing if i not in stored]
+        if not missing:
+            return embeddings
+        
+        pending = [texts[i] for i in missing]
+        computed = np.empty((len(pending), self.dimension), dtype=np.float32)
         
         # Process in batches to respect API rate limits
-        batch_size = 10
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
             
-            for text in batch:
-                # Call HuggingFace Inference API
-                embedding = self.client.feature_extraction(
-                    text=text,
-                    model=self.model_name
-                )
-                embeddings.append(embedding)
+            # The feature-extraction endpoint accepts a list of inputs and
+            # returns one row per input
+            computed[i:i + len(batch)] = self.upstream.call(
+                self.client.feature_extraction,
+                text=batch,
+                model=self.model_name,
+                admit_tokens=sum(len(t) for t in batch) // 4
+            )
+        
+        normalize(computed, inplace=True)
+        if self.store is not None:
+            self.store.put_many(self.model_name, pending, computed)
         
+        embeddings[missing] = computed
         return embeddings
     
-    def generate_single_embedding(self, text: str) -> List[float]:
+    def generate_single_embedding(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text using HuggingFace API.
         
@@ -62,10 +98,12 @@ class EmbeddingService:
             text: String to embed
             
         Returns:
-            Embedding vector as a list of floats
+            L2-normalized float32 embedding vector
         """
-        embedding = self.client.feature_extraction(
+        embedding = self.upstream.call(
+            self.client.feature_extraction,
             text=text,
-            model=self.model_name
+            model=self.model_name,
+            admit_tokens=len(text) // 4
         )
-        return embedding
\ No newline at end of file
+        return normalize(embedding, inplace=True)
@@ -0,0 +1,171 @@
+"""
+Content-addressed PDF text extraction cache
+
+Extracted page texts are stored on disk under the hash of what produced
+them:
+    files/<sha256 of the PDF bytes>.json   page hashes of an extracted file
+    pages/<ab>/<sha256 of the page>.z      zlib-compressed page text
+
+An unchanged file is served from its manifest without opening the PDF.
+A changed file is opened once to hash its pages (content streams and
+resources, which is cheap compared to text extraction); only pages whose
+hash is new are extracted, in parallel across a process pool.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import IndirectObject, StreamObject
+
+from app.config import get_settings
+
+
+# Below this many pages a process pool costs more than it saves
+MIN_PARALLEL_PAGES = 8
+
+
+def _canonical(obj, digest, depth: int = 0):
+    """
+    Feed a PDF object into a hash independently of object numbering, so
+    the same page copied into another file hashes the same.
+    """
+    if depth > 8:
+        return
+    if isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        digest.update(b"S" + hashlib.sha256(obj.get_data()).digest())
+        obj = {k: v for k, v in obj.items() if k not in ("/Length", "/Filter", "/DecodeParms")}
+    if isinstance(obj, dict):
+        for key in sorted(obj):
+            if key != "/Parent":
+                digest.update(f"K{key}".encode())
+                _canonical(obj[key], digest, depth + 1)
+    elif isinstance(obj, list):
+        digest.update(b"[")
+        for item in obj:
+            _canonical(item, digest, depth + 1)
+        digest.update(b"]")
+    else:
+        digest.update(f"V{obj!r}".encode())
+
+
+def _page_hash(page) -> str:
+    """Hash of everything that determines a page's extracted text"""
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    # Fonts (and form XObjects) decide how content-stream bytes map to characters
+    resources = page.get("/Resources")
+    if resources is not None:
+        resources = resources.get_object()
+        for name in ("/Font", "/XObject"):
+            if name in resources:
+                _canonical(resources[name], digest)
+    digest.update(f"R{page.get('/Rotate', 0)}".encode())
+    return digest.hexdigest()
+
+
+def _extract_pages(pdf_path: str, indexes: List[int]) -> List[str]:
+    """Process-pool worker: extract the text of some pages of a PDF"""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() for i in indexes]
+
+
+class PageExtractionCache:
+    """Per-page extracted text, keyed by file and page content hashes"""
+
+    def __init__(self, cache_dir: str = ".cache/extraction", max_workers: int = 0):
+        """
+        Args:
+            cache_dir: Directory for manifests and compressed page texts
+            max_workers: Extraction processes (0 = one per CPU)
+        """
+        self.root = Path(cache_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        (self.root / "files").mkdir(parents=True, exist_ok=True)
+        (self.root / "pages").mkdir(parents=True, exist_ok=True)
+
+        # Outcome of the last extract() call, for the ingestion scripts to report
+        self.last_stats: Dict = {}
+
+    @classmethod
+    def from_settings(cls) -> "PageExtractionCache":
+        settings = get_settings()
+        return cls(settings.EXTRACTION_CACHE_DIR, settings.EXTRACTION_WORKERS)
+
+    def _manifest_path(self, file_hash: str) -> Path:
+        return self.root / "files" / f"{file_hash}.json"
+
+    def _page_path(self, page_hash: str) -> Path:
+        return self.root / "pages" / page_hash[:2] / f"{page_hash}.z"
+
+    def _read_page(self, page_hash: str) -> Optional[str]:
+        path = self._page_path(page_hash)
+        if not path.exists():
+            return None
+        return zlib.decompress(path.read_bytes()).decode("utf-8")
+
+    def _write(self, path: Path, data: bytes):
+        """Atomic write, so concurrent ingestions never see partial files"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def extract(self, pdf_path: str) -> List[Tuple[int, str]]:
+        """
+        Per-page text of a PDF, extracting only what is not cached.
+
+        Args:
+            pdf_path: Path to the PDF file
+
+        Returns:
+            (0-based page number, text) pairs in page order
+        """
+        data = Path(pdf_path).read_bytes()
+        file_hash = hashlib.sha256(data).hexdigest()
+
+        # Step 1: Unchanged file -> no parsing at all
+        manifest = self._manifest_path(file_hash)
+        if manifest.exists():
+            page_hashes = json.loads(manifest.read_text())["pages"]
+            texts = [self._read_page(h) for h in page_hashes]
+            if all(text is not None for text in texts):
+                self.last_stats = {"pages": len(texts), "file_hit": True, "extracted": 0}
+                return list(enumerate(texts))
+
+        # Step 2: Hash pages and reuse every page seen before (in any file)
+        reader = PdfReader(BytesIO(data))
+        page_hashes = [_page_hash(page) for page in reader.pages]
+        texts = [self._read_page(h) for h in page_hashes]
+        missing = [i for i, text in enumerate(texts) if text is None]
+
+        # Step 3: Extract the remaining pages, in parallel when worthwhile
+        for i, text in zip(missing, self._extract(pdf_path, reader, missing)):
+            texts[i] = text
+            self._write(self._page_path(page_hashes[i]), zlib.compress(text.encode("utf-8"), 6))
+
+        self._write(manifest, json.dumps({"source": str(pdf_path), "pages": page_hashes}).encode())
+        self.last_stats = {"pages": len(texts), "file_hit": False, "extracted": len(missing)}
+        return list(enumerate(texts))
+
+    def _extract(self, pdf_path: str, reader: PdfReader, indexes: List[int]) -> List[str]:
+        workers = min(self.max_workers, len(indexes))
+        if workers <= 1 or len(indexes) < MIN_PARALLEL_PAGES:
+            return [reader.pages[i].extract_text() for i in indexes]
+
+        # Contiguous slices: each worker parses the file once for its share
+        size = -(-len(indexes) // workers)
+        slices = [indexes[start:start + size] for start in range(0, len(indexes), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_extract_pages, [pdf_path] * len(slices), slices)
+            return [text for texts in results for text in texts]
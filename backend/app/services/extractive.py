@@ -0,0 +1,97 @@
+"""
+Extractive fast path for lookup questions
+
+Questions like "what is the minimum CGPA" are usually answered verbatim
+by one sentence of the top chunk. The sentences of the top chunks are
+already embedded for context compression, so one matrix product against
+the query embedding finds the best match. When that sentence clearly
+beats every other candidate, it is returned with its citation number and
+the LLM is not called; otherwise the question goes to Groq as usual.
+"""
+
+from typing import List, Optional
+import numpy as np
+
+from app.config import get_settings
+
+
+class ExtractiveAnswer:
+    """Sentence picked as the answer and how confidently"""
+    __slots__ = ("text", "citation", "score", "margin")
+
+    def __init__(self, text: str, citation: int, score: float, margin: float):
+        self.text = text
+        self.citation = citation
+        self.score = score
+        self.margin = margin
+
+    def format(self) -> str:
+        """The sentence with its citation, as the LLM would cite it"""
+        return f"{self.text} [{self.citation}]"
+
+
+class ExtractiveAnswerer:
+    """Answers lookup questions with the best-matching retrieved sentence"""
+
+    def __init__(self, top_chunks: int = 2, min_score: float = 0.8, min_margin: float = 0.08):
+        """
+        Args:
+            top_chunks: Leading retrieved chunks whose sentences are candidates
+            min_score: Query-sentence similarity the best sentence must reach
+            min_margin: How far the best sentence must score above the runner-up
+        """
+        self.top_chunks = top_chunks
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    @classmethod
+    def from_settings(cls) -> "ExtractiveAnswerer":
+        settings = get_settings()
+        return cls(
+            top_chunks=settings.EXTRACTIVE_TOP_CHUNKS,
+            min_score=settings.EXTRACTIVE_MIN_SCORE,
+            min_margin=settings.EXTRACTIVE_MIN_MARGIN
+        )
+
+    def answer(self, query_embedding: np.ndarray, results: List) -> Optional[ExtractiveAnswer]:
+        """
+        Pick the answer sentence if the match is confident and unambiguous.
+
+        Args:
+            query_embedding: Normalized query vector computed during retrieval
+            results: Retrieved chunks in rank order, with sentence embeddings
+                where available (citation i+1 = results[i])
+
+        Returns:
+            The answer, or None if the question should go to the LLM
+        """
+        owners = []
+        blocks = []
+        for index, result in enumerate(results[:self.top_chunks]):
+            if result.sentence_embeddings is not None and result.sentences:
+                owners.extend((index, position) for position in range(len(result.sentences)))
+                blocks.append(result.sentence_embeddings)
+        if not owners:
+            return None
+
+        scores = np.concatenate(blocks) @ np.asarray(query_embedding, dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")
+        index, position = owners[order[0]]
+        text = results[index].sentences[position]
+        score = float(scores[order[0]])
+        if score < self.min_score:
+            return None
+
+        # Overlapping chunks repeat sentences; the runner-up is the best
+        # different sentence (none means nothing to be confused with)
+        runner_up = -1.0
+        for flat_index in order[1:]:
+            other_index, other_position = owners[flat_index]
+            if results[other_index].sentences[other_position] != text:
+                runner_up = float(scores[flat_index])
+                break
+        margin = score - runner_up
+        if margin < self.min_margin:
+            return None
+
+        return ExtractiveAnswer(text=text, citation=index + 1, score=score, margin=margin)
@@ -0,0 +1,135 @@
+"""
+Zero-downtime blue/green rebuilds of the vector collection
+
+A rebuild never touches the live collection. It is written to a shadow
+version, which gets its own Atlas vector index and is validated:
+    - the document and parent counts match what was ingested
+    - a smoke-query recall check: a sample of the ingested vectors, used
+      as queries, must find their own chunk in the top results
+
+Only then is the active pointer switched, in one document update. API
+workers follow the pointer the next time they check the corpus version.
+Earlier versions are kept for rollback.
+"""
+
+from typing import Dict, List, Optional
+import numpy as np
+
+from app.services.vector_store import VectorStore
+
+
+class RebuildValidationError(Exception):
+    """The shadow version failed validation and was not activated"""
+
+
+def validate_shadow(
+    shadow: VectorStore,
+    documents: List[Dict],
+    embeddings: np.ndarray,
+    parents: Optional[List[Dict]] = None,
+    smoke_queries: int = 20,
+    top_k: int = 5,
+    min_recall: float = 0.9
+) -> Dict:
+    """
+    Check a freshly built shadow version before it goes live.
+
+    Args:
+        shadow: Store bound to the shadow collection
+        documents: Documents that were inserted
+        embeddings: Their (n, dim) embeddings, row-aligned with documents
+        parents: Parent clauses that were inserted, if any
+        smoke_queries: Number of ingested vectors replayed as queries
+        top_k: A smoke query passes if its own chunk is in the top_k
+        min_recall: Minimum fraction of passing smoke queries
+
+    Returns:
+        Validation report (counts and recall)
+
+    Raises:
+        RebuildValidationError: If a count differs or recall is too low
+    """
+    count = shadow.collection.count_documents({})
+    if count != len(documents):
+        raise RebuildValidationError(f"{shadow.physical_name} holds {count} documents, expected {len(documents)}")
+
+    parent_count = shadow.parents.count_documents({})
+    if parents is not None and parent_count != len({p["parent_id"] for p in parents}):
+        raise RebuildValidationError(f"{shadow.physical_name} holds {parent_count} parents, expected {len(parents)}")
+
+    # Evenly spaced sample, so reruns check the same chunks
+    sample = np.unique(np.linspace(0, len(documents) - 1, num=min(smoke_queries, len(documents))).astype(int))
+    found = 0
+    for i in sample:
+        results = shadow.search_similar(embeddings[i], top_k=top_k)
+        if documents[i]["chunk_id"] in {r.get("chunk_id") for r in results}:
+            found += 1
+
+    recall = found / len(sample) if len(sample) else 1.0
+    if recall < min_recall:
+        raise RebuildValidationError(
+            f"Smoke-query recall@{top_k} of {shadow.physical_name} is {recall:.2f} (< {min_recall:.2f})"
+        )
+
+    return {"documents": count, "parents": parent_count, "smoke_queries": len(sample), "recall": recall}
+
+
+def blue_green_rebuild(
+    live: VectorStore,
+    documents: List[Dict],
+    embeddings: np.ndarray,
+    parents: Optional[List[Dict]] = None,
+    groups: Optional[List[Dict]] = None,
+    embedding_dimension: Optional[int] = None,
+    smoke_queries: int = 20,
+    min_recall: float = 0.9,
+    keep_versions: int = 3,
+    index_timeout_s: float = 600.0,
+    version: Optional[str] = None
+) -> Dict:
+    """
+    Build, index and validate a new collection version, then activate it.
+
+    Args:
+        live: Store for the logical collection (bound to the active version)
+        documents: Child/flat chunk documents without embeddings
+        embeddings: (n, dim) float32 embeddings, one row per document
+        parents: Parent clauses for small-to-big retrieval
+        groups: Centroids for coarse-to-fine search (see centroids.build_groups)
+        embedding_dimension: Index dimension (from the embeddings if omitted)
+        smoke_queries: Ingested vectors replayed as validation queries
+        min_recall: Minimum smoke-query recall for activation
+        keep_versions: Versions kept for rollback, counting the new one
+        index_timeout_s: How long to wait for the shadow index to become queryable
+        version: Version label (UTC timestamp if omitted)
+
+    Returns:
+        Report with the activated collection, the validation results and
+        the collections dropped by retention
+
+    Raises:
+        RebuildValidationError: If validation fails; the shadow is dropped
+            and the live version stays active
+    """
+    # Step 1: Write the shadow version; the live collection is not touched
+    shadow = live.create_shadow(version)
+    shadow.insert_parents(parents or [])
+    shadow.insert_groups(groups or [])
+    shadow.insert_documents(documents, embeddings=embeddings)
+
+    try:
+        # Step 2: Its own vector index, queryable before validation
+        shadow.create_search_index(embedding_dimension or embeddings.shape[1], timeout_s=index_timeout_s)
+
+        # Step 3: Validate counts and smoke-query recall
+        report = validate_shadow(
+            shadow, documents, embeddings, parents,
+            smoke_queries=smoke_queries, min_recall=min_recall
+        )
+    except Exception:
+        live.drop_version(shadow.physical_name)
+        raise
+
+    # Step 4: Atomic pointer swap; older versions beyond retention are dropped
+    dropped = live.activate(shadow.physical_name, keep_versions=keep_versions)
+    return {"collection": shadow.physical_name, "validation": report, "dropped": dropped}
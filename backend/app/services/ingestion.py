@@ -0,0 +1,472 @@
+"""
+Background ingestion jobs for uploaded PDFs
+
+POST /api/documents stores the upload and queues a job. A small thread
+pool, separate from the event loop serving queries, runs the same
+pipeline as scripts/ingest_pdf.py in three stages:
+    1. parsing: page text (through the extraction cache) and chunking
+    2. embedding: chunk embeddings, then the sentence embeddings used by
+       context compression, one slice at a time so progress is reported
+       and cancellation is checked between upstream calls
+    3. writing: parents, chunks, then centroids into the tenant's collection
+
+Jobs run at "batch" priority, so their embedding calls queue behind
+interactive traffic in the HuggingFace admission scheduler, and at most
+INGEST_MAX_CONCURRENT_JOBS run at once. A job can be cancelled until it
+starts writing; nothing reaches the collection before that.
+
+Writes are not transactional: chunks become searchable as their batches
+land. Centroids are written after the last chunk, so the coarse stage
+never selects a group whose chunks are missing, and the corpus version
+(which keys caches and the centroid index) changes once at the end. Every
+chunk and centroid is tagged with its job id, and a job failing while
+writing deletes what it wrote. They are also tagged with the PDF's content
+hash: re-ingesting the same file replaces the earlier copy (removed after
+the new chunks are written) instead of duplicating it.
+"""
+
+import hashlib
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import TenantConfig, get_settings
+from app.services.centroids import build_groups
+from app.services.compression import embed_chunk_sentences, sentence_fields
+from app.services.embedding_store import EmbeddingStore
+from app.services.embeddings import EmbeddingService
+from app.services.scheduler import priority
+from app.services.vector_store import VectorStore, shared_client
+
+
+# Texts per embedding call; progress and cancellation are checked between slices
+EMBED_SLICE = 128
+# Chunks per insert
+WRITE_BATCH = 500
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """The job was cancelled before it started writing"""
+
+
+class JobQueueFull(Exception):
+    """Too many ingestion jobs are already waiting"""
+
+
+class IngestionJob:
+    """One PDF ingestion: status, per-stage progress and cancellation"""
+
+    def __init__(
+        self,
+        pdf_path: str,
+        tenant: TenantConfig,
+        filename: Optional[str] = None,
+        cleanup_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            pdf_path: PDF to ingest (also its "source" in chunk metadata)
+            tenant: Tenant whose collection receives the documents
+            filename: Name reported to clients (the file name of pdf_path if omitted)
+            cleanup_dir: Directory removed unless the job succeeds (the upload's)
+        """
+        self.job_id = uuid.uuid4().hex
+        self.pdf_path = pdf_path
+        self.tenant = tenant
+        self.filename = filename or Path(pdf_path).name
+        self.cleanup_dir = cleanup_dir
+        self.status = "queued"
+        self.stage = "queued"
+        self.error: Optional[str] = None
+        self.progress = {
+            "pages_parsed": 0,
+            "pages_extracted": 0,  # Pages not served by the extraction cache
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "contexts_total": 0,  # Texts the LLM sees (parent clauses when structured)
+            "contexts_embedded": 0,
+            "docs_written": 0,
+            "docs_replaced": 0  # Chunks of an earlier ingestion of the same PDF
+        }
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def cancel(self) -> bool:
+        """
+        Request cancellation.
+
+        Returns:
+            False if the job has finished or is already writing
+        """
+        with self._lock:
+            if self.finished or self.stage == "writing":
+                return False
+            self._cancel.set()
+            return True
+
+    def check_cancelled(self):
+        """
+        Raises:
+            JobCancelled: If cancellation was requested
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(self.job_id)
+
+    def enter_stage(self, stage: str):
+        """Start a stage, unless the job was cancelled in the meantime"""
+        # Under the lock, so cancel() cannot slip in once writing has begun
+        with self._lock:
+            self.check_cancelled()
+            self.stage = stage
+
+    def advance(self, **counts):
+        """Update progress counters"""
+        with self._lock:
+            self.progress.update(counts)
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            if status == "succeeded":
+                self.stage = "done"
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict:
+        """Job state matching JobResponse"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "tenant_id": self.tenant.tenant_id,
+                "filename": self.filename,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+
+
+def tenant_vector_store(tenant: TenantConfig) -> VectorStore:
+    """
+    Store bound to a tenant's collection.
+
+    Raises:
+        ValueError: If the tenant is sharded (ingest into a shard's collection instead)
+    """
+    if tenant.shards:
+        raise ValueError(
+            f"Tenant '{tenant.tenant_id}' is sharded; ingest into one of its shard collections instead"
+        )
+    settings = get_settings()
+    uri = tenant.mongodb_uri or settings.MONGODB_URI
+    return VectorStore(
+        uri,
+        tenant.db_name or settings.MONGODB_DB_NAME,
+        tenant.collection,
+        storage=settings.EMBEDDING_STORAGE,
+        rescore_factor=settings.RESCORE_FACTOR,
+        client=shared_client(uri)
+    )
+
+
+def run_ingestion(job: IngestionJob, embedding_service: EmbeddingService) -> Dict:
+    """
+    Parse, embed and store one PDF in its tenant's collection.
+
+    Args:
+        job: Job to run; its stage and progress are updated as it goes
+        embedding_service: Embedding client (with a persistent store, chunks
+            embedded by earlier runs are not sent to the API again)
+
+    Returns:
+        Final progress counters
+
+    Raises:
+        JobCancelled: If the job was cancelled before writing started
+        ValueError: If the PDF has no extractable text
+        Exception: A write error, after this job's chunks and centroids were removed
+    """
+    # Imported here: langchain's splitters and pypdf are only needed to ingest
+    from app.services.pdf_processor import PDFProcessor
+
+    settings = get_settings()
+    vector_store = tenant_vector_store(job.tenant)
+
+    # Step 1: Page text and chunks
+    job.enter_stage("parsing")
+    document_hash = hashlib.sha256(Path(job.pdf_path).read_bytes()).hexdigest()
+    processor = PDFProcessor()
+    pages = processor.load_pages(job.pdf_path)
+    extracted = len(pages)
+    if processor.extraction_cache is not None:
+        extracted = processor.extraction_cache.last_stats["extracted"]
+    job.advance(pages_parsed=len(pages), pages_extracted=extracted)
+
+    if settings.CHUNKING_STRATEGY == "structured":
+        parents, chunks = processor.process_pdf_structured(job.pdf_path, pages=pages)
+    else:
+        parents, chunks = [], processor.process_pdf(job.pdf_path, pages=pages)
+    if not chunks:
+        raise ValueError(f"No text could be extracted from {job.filename}")
+    contexts = parents or chunks
+    job.advance(chunks_total=len(chunks), contexts_total=len(contexts))
+
+    # Step 2: Chunk embeddings, then sentence embeddings for compression
+    job.enter_stage("embedding")
+    embeddings = np.empty((len(chunks), embedding_service.dimension), dtype=np.float32)
+    for start in range(0, len(chunks), EMBED_SLICE):
+        job.check_cancelled()
+        batch = chunks[start:start + EMBED_SLICE]
+        embeddings[start:start + len(batch)] = embedding_service.generate_embeddings([c["text"] for c in batch])
+        job.advance(chunks_embedded=start + len(batch))
+
+    for start in range(0, len(contexts), EMBED_SLICE):
+        job.check_cancelled()
+        batch = contexts[start:start + EMBED_SLICE]
+        for item, (sentences, sentence_embeddings) in zip(
+            batch, embed_chunk_sentences([c["text"] for c in batch], embedding_service)
+        ):
+            item.update(sentence_fields(sentences, sentence_embeddings))
+        job.advance(contexts_embedded=start + len(batch))
+
+    # Step 3: Parents before the chunks referencing them, centroids after
+    # the chunks they cover (build_groups also tags each chunk with its
+    # group_id), earlier copies of the same PDF removed once this one is
+    # complete, and one corpus version change at the end
+    job.enter_stage("writing")
+    groups = build_groups(chunks, embeddings, level=settings.CENTROID_GROUP_LEVEL)
+    for item in chunks + groups:
+        item["ingest_job_id"] = job.job_id
+        item["document_hash"] = document_hash
+    try:
+        vector_store.insert_parents(parents)
+        for start in range(0, len(chunks), WRITE_BATCH):
+            vector_store.insert_documents(
+                chunks[start:start + WRITE_BATCH],
+                embeddings=embeddings[start:start + WRITE_BATCH],
+                bump_version=False
+            )
+            job.advance(docs_written=min(start + WRITE_BATCH, len(chunks)))
+        vector_store.insert_groups(groups)
+        job.advance(docs_replaced=vector_store.delete_superseded(document_hash, job.job_id))
+    except Exception:
+        # Leave no half-written document behind
+        try:
+            vector_store.delete_ingested(job.job_id)
+        except Exception as cleanup_error:
+            print(f"⚠ Could not remove the partial writes of job {job.job_id}: {cleanup_error}")
+        raise
+    vector_store.touch_corpus_version()
+
+    return job.to_dict()["progress"]
+
+
+class IngestionJobManager:
+    """Bounded worker pool running ingestion jobs, with a short job history"""
+
+    def __init__(self, max_workers: int = 1, max_queued: int = 20, history: int = 100):
+        """
+        Args:
+            max_workers: Jobs running at once
+            max_queued: Jobs allowed to wait; more are rejected
+            history: Finished jobs kept for polling
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._embedding_service: Optional[EmbeddingService] = None
+
+        self.submitted = 0
+        self.counts = {status: 0 for status in FINISHED}
+
+    @classmethod
+    def from_settings(cls) -> "IngestionJobManager":
+        settings = get_settings()
+        return cls(
+            max_workers=settings.INGEST_MAX_CONCURRENT_JOBS,
+            max_queued=settings.INGEST_MAX_QUEUED_JOBS,
+            history=settings.INGEST_JOB_HISTORY
+        )
+
+    def _embeddings(self) -> EmbeddingService:
+        """Embedding client of the ingestion workers, with the persistent store"""
+        with self._lock:
+            if self._embedding_service is None:
+                settings = get_settings()
+                self._embedding_service = EmbeddingService(
+                    settings.EMBEDDING_MODEL,
+                    api_key=settings.HUGGINGFACE_API_KEY,
+                    store=EmbeddingStore.from_settings()
+                )
+            return self._embedding_service
+
+    def submit(
+        self,
+        pdf_path: str,
+        tenant: TenantConfig,
+        filename: Optional[str] = None,
+        cleanup_dir: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a PDF for ingestion.
+
+        Args:
+            pdf_path: PDF to ingest
+            tenant: Tenant whose collection receives it
+            filename: Name reported to clients
+            cleanup_dir: Directory removed unless the job succeeds
+
+        Raises:
+            ValueError: If the tenant cannot be ingested into (sharded)
+            JobQueueFull: If max_queued jobs are already waiting
+        """
+        if tenant.shards:
+            raise ValueError(
+                f"Tenant '{tenant.tenant_id}' is sharded; ingest into one of its shard collections instead"
+            )
+
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} ingestion jobs are already waiting")
+            job = IngestionJob(pdf_path, tenant, filename=filename, cleanup_dir=cleanup_dir)
+            self._jobs[job.job_id] = job
+            self.submitted += 1
+            job.future = self._executor.submit(self._run, job)
+            self._trim()
+        return job
+
+    def _run(self, job: IngestionJob):
+        job.start()
+        try:
+            with priority("batch"):
+                run_ingestion(job, self._embeddings())
+            self._finish(job, "succeeded")
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            print(f"⚠ Ingestion job {job.job_id} ({job.filename}) failed: {e}")
+            self._finish(job, "failed", error=str(e))
+
+    def _finish(self, job: IngestionJob, status: str, error: Optional[str] = None):
+        job.finish(status, error)
+        if status != "succeeded" and job.cleanup_dir:
+            shutil.rmtree(job.cleanup_dir, ignore_errors=True)
+        with self._lock:
+            self.counts[status] += 1
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history size (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> IngestionJob:
+        """
+        Raises:
+            KeyError: If the job is unknown or no longer kept
+        """
+        with self._lock:
+            return self._jobs[job_id]
+
+    def jobs(self, tenant_id: Optional[str] = None) -> List[IngestionJob]:
+        """Known jobs, newest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [
+            job for job in reversed(jobs)
+            if tenant_id is None or job.tenant.tenant_id == tenant_id
+        ]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        A running job stops at its next check, before it writes anything.
+
+        Returns:
+            False if the job has finished or is already writing
+
+        Raises:
+            KeyError: If the job is unknown
+        """
+        job = self.get(job_id)
+        if not job.cancel():
+            return False
+        if job.future is not None and job.future.cancel():
+            # Never started
+            self._finish(job, "cancelled")
+        return True
+
+    def shutdown(self):
+        """Cancel every unfinished job and stop the workers without waiting"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if not job.finished:
+                self.cancel(job.job_id)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        with self._lock:
+            states = [job.status for job in self._jobs.values()]
+            return {
+                "max_workers": self.max_workers,
+                "queued": states.count("queued"),
+                "running": states.count("running"),
+                "submitted": self.submitted,
+                **self.counts
+            }
+
+
+_manager: Optional[IngestionJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> IngestionJobManager:
+    """Shared ingestion job manager, created on first use"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IngestionJobManager.from_settings()
+        return _manager
+
+
+def ingestion_stats() -> Optional[Dict]:
+    """Job manager counters, or None if no job was ever submitted"""
+    return _manager.stats() if _manager is not None else None
+
+
+def shutdown_ingestion():
+    """Stop the job manager, if it was started"""
+    if _manager is not None:
+        _manager.shutdown()
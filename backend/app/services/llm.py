@@ -2,39 +2,86 @@
 LLM Service using official Groq Python SDK (Llama 3.3 70B)
 """
 
-from groq import Groq
-from app.config import get_settings
+from typing import List, Optional
+from app.config import TenantConfig, get_settings
+from app.services.resilience import get_upstream
+from app.services.scheduler import get_scheduler
+from app.services.tracing import annotate
+
+
+SYSTEM_PROMPT_TEMPLATE = (
+    "You are a helpful assistant that answers questions about {institute}'s placement policies. "
+    "Answer based only on the provided context. "
+    "If the answer is not in the context, say 'I don't have enough information to answer this.' "
+    "Common abbreviations used in the documents: "
+    "SPC = Student Placement Coordinator, T&P = Training and Placement Cell, "
+    "PPO = Pre-Placement Offer, CGPA = Cumulative Grade Point Average, "
+    "NOC = No Objection Certificate. "
+    "Be concise and well-structured. Use bullet points or numbered lists when listing multiple items."
+)
+
+
+def system_prompt_for(tenant: TenantConfig) -> str:
+    """The tenant's system prompt (its own template or the default one) for its institute"""
+    return (tenant.system_prompt or SYSTEM_PROMPT_TEMPLATE).format(institute=tenant.institute)
 
 
 class LLMService:
     def __init__(self, model_name: str = None, api_key: str = None):
         settings = get_settings()
         self.model_name = model_name or settings.LLM_MODEL
+        # Retries, hedging and circuit breaking are handled by the shared
+        # upstream wrapper, so the SDK's own retries are disabled
+        self.upstream = get_upstream("groq")
+        self.scheduler = get_scheduler("groq")
         # Groq client reads GROQ_API_KEY from env automatically,
-        # but we can also pass it explicitly
-        self.client = Groq(api_key=api_key or settings.GROQ_API_KEY)
-
-    def generate_answer(self, query: str, context: str, max_length: int = 512) -> str:
-        """Generate answer using Groq (Llama 3.3 70B)"""
-
-        system_prompt = (
-            "You are a helpful assistant that answers questions about IIIT Kota's placement policies. "
-            "Answer based only on the provided context. "
-            "If the answer is not in the context, say 'I don't have enough information to answer this.' "
-            "Common abbreviations used in the documents: "
-            "SPC = Student Placement Coordinator, T&P = Training and Placement Cell, "
-            "PPO = Pre-Placement Offer, CGPA = Cumulative Grade Point Average, "
-            "NOC = No Objection Certificate. "
-            "Be concise and well-structured. Use bullet points or numbered lists when listing multiple items."
+        # but we can also pass it explicitly. Imported here so that entry
+        # points that never generate (ingestion) do not load the SDK
+        from groq import Groq
+        self.client = Groq(
+            api_key=api_key or settings.GROQ_API_KEY,
+            timeout=self.upstream.timeout_s,
+            max_retries=0
         )
 
+    def generate_answer(
+        self,
+        query: str,
+        context: str,
+        max_length: int = 512,
+        model: str = None,
+        history: List[str] = None,
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """
+        Generate answer using Groq (Llama 3.3 70B unless another model is routed)
+
+        Args:
+            query: User question
+            context: Numbered context chunks
+            max_length: Completion token cap
+            model: Model override chosen by the router
+            history: Earlier questions of the conversation, oldest first
+            system_prompt: Tenant prompt (the default tenant's if omitted)
+        """
+        if system_prompt is None:
+            settings = get_settings()
+            system_prompt = system_prompt_for(settings.tenants()[settings.DEFAULT_TENANT])
+
         user_message = (
             f"Context:\n{context[:3000]}\n\n"
             f"Question: {query}"
         )
+        if history:
+            earlier = "\n".join(f"- {q}" for q in history)
+            user_message = f"Earlier questions in this conversation:\n{earlier}\n\n{user_message}"
 
-        completion = self.client.chat.completions.create(
-            model=self.model_name,
+        # Rate-limit budget charged for each request sent (~4 chars per token
+        # plus the completion cap)
+        estimated_tokens = (len(system_prompt) + len(user_message)) // 4 + max_length
+        completion = self.upstream.call(
+            self.client.chat.completions.create,
+            model=model or self.model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_message}
@@ -43,7 +90,16 @@ class LLMService:
             max_completion_tokens=max_length,
             top_p=1,
             stream=False,
-            stop=None
+            stop=None,
+            admit_tokens=estimated_tokens
+        )
+
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            self.scheduler.settle(estimated_tokens, usage.total_tokens)
+        annotate(
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None)
         )
 
         return completion.choices[0].message.content.strip()
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Latency-aware LLM model routing
+
+Sends simple lookups ("what does PPO stand for") to a fast small model
+and keeps the large model for multi-clause questions, low-confidence
+retrievals and long contexts.
+"""
+
+import re
+from typing import List, Optional
+
+from app.config import get_settings
+from app.services.retrieval import RetrievalResult
+
+
+class RoutingDecision:
+    """Model chosen for one request and why"""
+    __slots__ = ("model", "tier", "reason")
+
+    def __init__(self, model: str, tier: str, reason: str):
+        self.model = model
+        self.tier = tier
+        self.reason = reason
+
+
+class ModelRouter:
+    """Chooses between the fast and the large Groq model per request"""
+
+    def __init__(
+        self,
+        fast_model: str,
+        large_model: str,
+        max_query_words: int = 12,
+        min_top_score: float = 0.75,
+        min_score_margin: float = 0.03,
+        max_context_chars: int = 2500,
+        complex_markers: Optional[List[str]] = None,
+        enabled: bool = True
+    ):
+        """
+        Args:
+            fast_model: Small model for simple questions
+            large_model: Large model for everything else
+            max_query_words: Longer questions go to the large model
+            min_top_score: Retrievals whose best score is lower go to the large model
+            min_score_margin: Ambiguous retrievals (top-1 minus top-2 below this) go to the large model
+            max_context_chars: Longer contexts go to the large model
+            complex_markers: Words/phrases that signal multi-clause or reasoning questions
+            enabled: When False every request uses the large model
+        """
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self.max_query_words = max_query_words
+        self.min_top_score = min_top_score
+        self.min_score_margin = min_score_margin
+        self.max_context_chars = max_context_chars
+        self.enabled = enabled
+
+        markers = complex_markers or []
+        self._complex_pattern = (
+            re.compile(r"\b(" + "|".join(re.escape(m) for m in markers) + r")\b", re.IGNORECASE)
+            if markers else None
+        )
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        """Build the router from the routing table in Settings"""
+        settings = get_settings()
+        return cls(
+            fast_model=settings.LLM_FAST_MODEL,
+            large_model=settings.LLM_MODEL,
+            max_query_words=settings.ROUTER_MAX_QUERY_WORDS,
+            min_top_score=settings.ROUTER_MIN_TOP_SCORE,
+            min_score_margin=settings.ROUTER_MIN_SCORE_MARGIN,
+            max_context_chars=settings.ROUTER_MAX_CONTEXT_CHARS,
+            complex_markers=settings.ROUTER_COMPLEX_MARKERS,
+            enabled=settings.LLM_ROUTING_ENABLED
+        )
+
+    def route(self, query: str, results: List[RetrievalResult], context: str) -> RoutingDecision:
+        """
+        Pick a model from query features, retrieval confidence and context length.
+
+        Args:
+            query: User question
+            results: Retrieved chunks, sorted by score
+            context: Prompt context built from the chunks
+
+        Returns:
+            RoutingDecision with the model name and the deciding rule
+        """
+        if not self.enabled:
+            return self._large("routing disabled")
+
+        complexity = self.question_complexity(query)
+        if complexity is not None:
+            return self._large(complexity)
+
+        top_score = results[0].score if results else 0.0
+        if top_score < self.min_top_score:
+            return self._large("low retrieval confidence")
+
+        if len(results) > 1 and top_score - results[1].score < self.min_score_margin:
+            return self._large("ambiguous retrieval")
+
+        if len(context) > self.max_context_chars:
+            return self._large("long context")
+
+        return self.fast("simple question")
+
+    def question_complexity(self, query: str) -> Optional[str]:
+        """Why the question itself needs the large model, or None for a simple lookup"""
+        if len(query.split()) > self.max_query_words:
+            return "long question"
+
+        if self._complex_pattern is not None and self._complex_pattern.search(query):
+            return "multi-clause question"
+
+        if query.count("?") > 1:
+            return "multiple questions"
+
+        return None
+
+    def fast(self, reason: str) -> RoutingDecision:
+        """Route to the fast model regardless of the request (e.g. under a tight deadline)"""
+        return RoutingDecision(self.fast_model, "fast", reason)
+
+    def _large(self, reason: str) -> RoutingDecision:
+        return RoutingDecision(self.large_model, "large", reason)
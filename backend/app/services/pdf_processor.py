@@ -1,19 +1,31 @@
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import hashlib
 
+from app.services.chunking import StructureAwareChunker
+from app.services.extraction import PageExtractionCache
+from app.config import get_settings
+
 class PDFProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        extraction_cache: Optional[PageExtractionCache] = None
+    ):
         """
         Initialize PDF processor with LangChain components.
         
         Args:
             chunk_size: Maximum size of each text chunk (in characters, not words)
             chunk_overlap: Number of overlapping characters between chunks
+            extraction_cache: Page text cache (configured from Settings if omitted)
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        if extraction_cache is None and get_settings().EXTRACTION_CACHE_ENABLED:
+            extraction_cache = PageExtractionCache.from_settings()
+        self.extraction_cache = extraction_cache
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -22,23 +34,45 @@ class PDFProcessor:
         )
 
 
+    def load_pages(self, pdf_path: str) -> List[Tuple[Optional[int], str]]:
+        """
+        Extract per-page text, reusing cached pages when possible.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Returns:
+            (page number, text) pairs in page order
+        """
+        if self.extraction_cache is not None:
+            return self.extraction_cache.extract(pdf_path)
+        
+        # Uncached fallback; langchain_community is heavy, so it is only
+        # imported when the extraction cache is disabled
+        from langchain_community.document_loaders import PyPDFLoader
+        documents = PyPDFLoader(pdf_path).load()
+        return [(doc.metadata.get("page", None), doc.page_content) for doc in documents]
     
-    def process_pdf(self, pdf_path: str) -> List[Dict]:
+    def process_pdf(self, pdf_path: str, pages: Optional[List[Tuple[Optional[int], str]]] = None) -> List[Dict]:
         """
         Main processing pipeline: load PDF and split into chunks.
         
         Args:
             pdf_path: Path to the PDF file
+            pages: Pages already returned by load_pages() (loaded if omitted)
             
         Returns:
             List of dictionaries containing chunked documents with metadata
         """
-        # Load PDF using LangChain
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
+        # Load PDF pages (cached extraction)
+        if pages is None:
+            pages = self.load_pages(pdf_path)
         
         # Split documents into chunks
-        split_docs = self.text_splitter.split_documents(documents)
+        split_docs = self.text_splitter.create_documents(
+            [text for _, text in pages],
+            metadatas=[{"source": pdf_path, "page": page} for page, _ in pages]
+        )
         
         # Convert to our format
         chunks = []
@@ -54,4 +88,27 @@ class PDFProcessor:
                 }
             })
         
-        return chunks
\ No newline at end of file
+        return chunks
+
+    def process_pdf_structured(
+        self,
+        pdf_path: str,
+        chunker: Optional[StructureAwareChunker] = None,
+        pages: Optional[List[Tuple[Optional[int], str]]] = None
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Load a PDF and chunk it along its sections and clauses.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            chunker: Chunker to use (configured from Settings if omitted)
+            pages: Pages already returned by load_pages() (loaded if omitted)
+            
+        Returns:
+            (parents, children): whole clauses stored once, and the small
+            child chunks that are embedded and point to them via parent_id
+        """
+        chunker = chunker or StructureAwareChunker.from_settings()
+        if pages is None:
+            pages = self.load_pages(pdf_path)
+        return chunker.split(pages, source=pdf_path)
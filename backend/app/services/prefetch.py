@@ -0,0 +1,147 @@
+"""
+Speculative retrieval for questions that are still being typed
+
+The chat UI posts the text of its input box whenever the user pauses
+typing. The prefetcher embeds and retrieves that text in the background
+at the lowest admission priority, so when the question is sent unchanged
+the embedding and retrieval caches are already warm and only generation
+is left on the request path.
+
+Each client has at most one prefetch in flight. A newer prefetch, or a
+question submitted with different text, cancels it; a question submitted
+with the same text waits for it instead of repeating its work.
+"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.services.scheduler import AdmissionRejected, priority
+from app.utils.helpers import normalize_query
+
+
+class Prefetcher:
+    """One cancellable background prefetch per client"""
+
+    def __init__(self, max_in_flight: int = 32):
+        """
+        Args:
+            max_in_flight: Prefetches running at once across all clients;
+                more are skipped
+        """
+        self.max_in_flight = max_in_flight
+        # client key -> (normalized query, task)
+        self._tasks: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+        self.started = 0
+        self.skipped = 0
+        self.superseded = 0
+        self.completed = 0
+        self.shed = 0
+        self.failed = 0
+        self.used = 0
+
+    def submit(self, client_key: str, query: str, func: Callable, *args) -> bool:
+        """
+        Start a prefetch, cancelling the client's previous one.
+
+        Args:
+            client_key: Identifies the client (and tenant) typing
+            query: Partial question
+            func: Coroutine function doing the prefetch
+            *args: Arguments for func
+
+        Returns:
+            False if the prefetch was skipped because too many are running
+        """
+        self._cancel(client_key)
+        if len(self._tasks) >= self.max_in_flight:
+            self.skipped += 1
+            return False
+
+        task = asyncio.ensure_future(self._run(func, *args))
+        self._tasks[client_key] = (normalize_query(query), task)
+        task.add_done_callback(lambda done: self._forget(client_key, done))
+        self.started += 1
+        return True
+
+    async def _run(self, func: Callable, *args):
+        with priority("prefetch"):
+            try:
+                await func(*args)
+            except AdmissionRejected:
+                # The upstream is busy with real traffic
+                self.shed += 1
+                return
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠ Prefetch failed: {e}")
+                return
+        self.completed += 1
+
+    def _cancel(self, client_key: str):
+        entry = self._tasks.pop(client_key, None)
+        if entry is not None and not entry[1].done():
+            entry[1].cancel()
+            self.superseded += 1
+
+    def _forget(self, client_key: str, task: asyncio.Task):
+        entry = self._tasks.get(client_key)
+        if entry is not None and entry[1] is task:
+            del self._tasks[client_key]
+
+    async def supersede(self, client_key: str, query: str) -> bool:
+        """
+        Settle the client's prefetch once it submits a question.
+
+        A prefetch of a different question is cancelled; one of the same
+        question is waited for, so the request finds its results cached.
+
+        Returns:
+            True if a prefetch of this question was in flight
+        """
+        entry = self._tasks.get(client_key)
+        if entry is None:
+            return False
+        prefetched, task = entry
+        if prefetched != normalize_query(query):
+            self._cancel(client_key)
+            return False
+
+        self.used += 1
+        # wait() leaves the task running if this request is cancelled, and
+        # never raises: _run() handles the prefetch's own errors
+        await asyncio.wait({task})
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for the metrics endpoint"""
+        return {
+            "started": self.started,
+            "skipped": self.skipped,
+            "superseded": self.superseded,
+            "completed": self.completed,
+            "shed": self.shed,
+            "failed": self.failed,
+            "used": self.used,
+            "in_flight": len(self._tasks)
+        }
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Shared prefetcher, created on first use"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(max_in_flight=get_settings().PREFETCH_MAX_IN_FLIGHT)
+        return _prefetcher
+
+
+def prefetch_stats() -> Optional[Dict[str, int]]:
+    """Prefetcher counters, or None if nothing was ever prefetched"""
+    return _prefetcher.stats() if _prefetcher is not None else None
@@ -0,0 +1,254 @@
+"""
+On-demand per-request sampling profiler
+
+A request is profiled when it carries the admin header
+(X-Profile: <PROFILING_ADMIN_TOKEN>) or wins a 1-in-N draw. A sampler
+thread then reads the stacks of the threads working for that request
+every PROFILING_INTERVAL_MS:
+    - the event-loop thread, while the request's task is the one running
+    - worker threads running a callable submitted with asyncio.to_thread()
+      from the request (identified through the context copied into them)
+
+Stacks are written as speedscope JSON or collapsed stacks (flamegraph.pl,
+speedscope and most flamegraph tools read both). When profiling is
+disabled the middleware is not installed at all.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+
+
+PROFILE_HEADER = b"x-profile"
+
+# Set for the duration of a profiled request; copied into its worker threads
+_profile_session: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+_sequence = itertools.count()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> tuple:
+    """Frame labels from the outermost call to the innermost"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+def _worker_context(frame) -> Optional[contextvars.Context]:
+    """Context a to_thread() worker is running in, found on its stack"""
+    while frame is not None:
+        if frame.f_code.co_name == "run" and frame.f_code.co_filename.endswith(os.path.join("futures", "thread.py")):
+            fn = getattr(frame.f_locals.get("self"), "fn", None)
+            # asyncio.to_thread submits functools.partial(context.run, func, ...)
+            if isinstance(fn, functools.partial):
+                owner = getattr(fn.func, "__self__", None)
+                if isinstance(owner, contextvars.Context):
+                    return owner
+            return None
+        frame = frame.f_back
+    return None
+
+
+class ProfileSession:
+    """Samples the threads working for one request"""
+
+    def __init__(self, name: str, route: str, loop: asyncio.AbstractEventLoop, interval_s: float):
+        self.name = name
+        self.route = route
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.task = asyncio.current_task()
+        self.interval_s = interval_s
+        self.samples: Counter = Counter()
+        self.started = time.time()
+        self.duration_s = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration_s = time.time() - self.started
+
+    def _belongs(self, thread_id: int, frame) -> bool:
+        if thread_id == self.loop_thread:
+            return asyncio.current_task(self.loop) is self.task
+        context = _worker_context(frame)
+        return context is not None and context.get(_profile_session) is self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own and self._belongs(thread_id, frame):
+                    label = "event-loop" if thread_id == self.loop_thread else "worker"
+                    self.samples[(label,) + _stack(frame)] += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one stack per line"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self) -> Dict:
+        """speedscope "sampled" profile with weights in seconds"""
+        frames: List[Dict] = []
+        index: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            samples.append(ids)
+            weights.append(count * self.interval_s)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.route} {self.name}",
+            "exporter": "placement-rag-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.route,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration_s,
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests to the given paths"""
+
+    def __init__(
+        self,
+        app,
+        paths: List[str],
+        output_dir: str,
+        admin_token: str = "",
+        sample_every: int = 0,
+        interval_ms: float = 5.0,
+        output_format: str = "speedscope",
+        max_files: int = 200
+    ):
+        """
+        Args:
+            app: Wrapped ASGI app
+            paths: Request paths that may be profiled
+            output_dir: Directory for profile files
+            admin_token: Value of X-Profile that forces profiling ("" disables the header)
+            sample_every: Also profile 1 in N requests at random (0 = never)
+            interval_ms: Sampling interval
+            output_format: "speedscope" or "collapsed"
+            max_files: Oldest files beyond this are deleted
+        """
+        if output_format not in ("speedscope", "collapsed"):
+            raise ValueError(f"Unknown PROFILING_FORMAT '{output_format}'. Choose one of: speedscope, collapsed")
+        self.app = app
+        self.paths = set(paths)
+        self.output_dir = Path(output_dir)
+        self.admin_token = admin_token.encode()
+        self.sample_every = sample_every
+        self.interval_s = interval_ms / 1000.0
+        self.output_format = output_format
+        self.max_files = max_files
+
+    def _selected(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return False
+        if self.admin_token and dict(scope["headers"]).get(PROFILE_HEADER) == self.admin_token:
+            return True
+        return self.sample_every > 0 and random.random() < 1.0 / self.sample_every
+
+    async def __call__(self, scope, receive, send):
+        if not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(_sequence)}"
+        session = ProfileSession(name, scope["path"], asyncio.get_running_loop(), self.interval_s)
+        token = _profile_session.set(session)
+        session.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.stop()
+            _profile_session.reset(token)
+            # File I/O stays off the event loop
+            await asyncio.to_thread(self._write, session)
+
+    def _write(self, session: ProfileSession):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.output_format == "speedscope":
+            path = self.output_dir / f"{session.name}.speedscope.json"
+            path.write_text(json.dumps(session.speedscope()))
+        else:
+            path = self.output_dir / f"{session.name}.collapsed.txt"
+            path.write_text(session.collapsed())
+
+        files = sorted(self.output_dir.glob("*.*"), key=lambda p: p.stat().st_mtime)
+        for old in files[:max(0, len(files) - self.max_files)]:
+            old.unlink(missing_ok=True)
+
+
+def list_profiles(output_dir: str, limit: int = 50) -> List[Dict]:
+    """Most recent profile files, newest first"""
+    directory = Path(output_dir)
+    if not directory.exists():
+        return []
+    files = sorted(
+        (p for p in directory.iterdir() if p.name.endswith((".speedscope.json", ".collapsed.txt"))),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+    return [
+        {
+            "name": p.name,
+            "size_bytes": p.stat().st_size,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(p.stat().st_mtime))
+        }
+        for p in files[:limit]
+    ]
+
+
+def install_profiling(app):
+    """Add the profiling middleware when PROFILING_ENABLED (otherwise nothing is added)"""
+    settings = get_settings()
+    if not settings.PROFILING_ENABLED:
+        return
+    app.add_middleware(
+        ProfilingMiddleware,
+        paths=["/api/query", "/api/chat"],
+        output_dir=settings.PROFILING_DIR,
+        admin_token=settings.PROFILING_ADMIN_TOKEN,
+        sample_every=settings.PROFILING_SAMPLE_EVERY,
+        interval_ms=settings.PROFILING_INTERVAL_MS,
+        output_format=settings.PROFILING_FORMAT,
+        max_files=settings.PROFILING_MAX_FILES
+    )
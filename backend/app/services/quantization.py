@@ -0,0 +1,149 @@
+"""
+Embedding quantization helpers for compact vector storage
+
+Embeddings can be stored either as the legacy BSON array of doubles
+("float") or as BSON binary vectors:
+    - "float32": packed little-endian float32 (4 bytes / dim)
+    - "int8":    per-vector scaled int8 (1 byte / dim)
+    - "binary":  sign bits packed 8 per byte (1 bit / dim)
+
+For "int8" and "binary" the quantized vector is what gets indexed and
+searched, while a float32 copy is kept in a side collection (see
+VectorStore) for rescoring the top candidates with full precision. The
+chunk documents and the index shrink; total storage does not, since the
+copy still takes 4 bytes / dim.
+"""
+
+from typing import List, Union
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+
+
+STORAGE_FORMATS = ("float", "float32", "int8", "binary")
+
+# Formats whose search results should be rescored with the float32 copy
+RESCORED_FORMATS = ("int8", "binary")
+
+
+def validate_storage(storage: str) -> str:
+    """Return the storage format or raise if it is not supported"""
+    if storage not in STORAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported embedding storage '{storage}'. "
+            f"Choose one of: {', '.join(STORAGE_FORMATS)}"
+        )
+    return storage
+
+
+def normalize(vectors: np.ndarray, inplace: bool = False) -> np.ndarray:
+    """
+    L2-normalize one vector or a batch of row vectors.
+
+    Args:
+        vectors: 1-D vector or 2-D array of row vectors
+        inplace: Divide a float32 array in place instead of allocating a copy
+
+    Returns:
+        float32 array of the same shape with unit-length rows
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    if inplace:
+        vectors /= norms
+        return vectors
+    return vectors / norms
+
+
+def _to_binary(payload: bytes, dtype: BinaryVectorDtype, padding: int = 0) -> Binary:
+    """Wrap raw vector bytes in a BSON binary vector (subtype 9)"""
+    return Binary(dtype.value + bytes([padding]) + payload, VECTOR_SUBTYPE)
+
+
+def encode_vector(vector, storage: str) -> Union[Binary, List[float]]:
+    """
+    Encode a single embedding for storage or querying.
+
+    Args:
+        vector: Embedding as a list or 1-D array
+        storage: One of STORAGE_FORMATS
+
+    Returns:
+        BSON binary vector, or a list of floats for the legacy "float" format
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+
+    if storage == "float":
+        return vector.tolist()
+
+    if storage == "float32":
+        return _to_binary(vector.astype("<f4", copy=False).tobytes(), BinaryVectorDtype.FLOAT32)
+
+    if storage == "int8":
+        # Per-vector scaling keeps the full int8 range; cosine similarity
+        # is invariant to it, so queries are encoded the same way
+        max_abs = float(np.abs(vector).max()) or 1.0
+        quantized = np.rint(vector * (127.0 / max_abs)).astype(np.int8)
+        return _to_binary(quantized.tobytes(), BinaryVectorDtype.INT8)
+
+    if storage == "binary":
+        bits = np.packbits(vector > 0)
+        padding = (-len(vector)) % 8
+        return _to_binary(bits.tobytes(), BinaryVectorDtype.PACKED_BIT, padding)
+
+    validate_storage(storage)
+
+
+def decode_vector(value) -> np.ndarray:
+    """
+    Decode a stored embedding back into a float32 array.
+
+    float32 binary vectors are decoded without copying the payload.
+
+    Args:
+        value: BSON binary vector or list of floats
+
+    Returns:
+        1-D float32 array
+    """
+    if not isinstance(value, (bytes, bytearray)):
+        return np.asarray(value, dtype=np.float32)
+
+    dtype = bytes(value[:1])
+    padding = value[1]
+
+    if dtype == BinaryVectorDtype.FLOAT32.value:
+        return np.frombuffer(value, dtype="<f4", offset=2)
+
+    if dtype == BinaryVectorDtype.INT8.value:
+        return np.frombuffer(value, dtype=np.int8, offset=2).astype(np.float32) / 127.0
+
+    if dtype == BinaryVectorDtype.PACKED_BIT.value:
+        bits = np.unpackbits(np.frombuffer(value, dtype=np.uint8, offset=2))
+        if padding:
+            bits = bits[:-padding]
+        return bits.astype(np.float32) * 2.0 - 1.0
+
+    raise ValueError(f"Unknown binary vector dtype: {dtype!r}")
+
+
+def rescore(query_embedding, candidates: List) -> np.ndarray:
+    """
+    Score candidates against the query with full-precision cosine similarity.
+
+    Scores are mapped to [0, 1] the same way Atlas reports cosine scores,
+    so existing similarity thresholds keep their meaning.
+
+    Args:
+        query_embedding: Query vector
+        candidates: Stored full-precision vectors (binary or lists)
+
+    Returns:
+        1-D array of scores, one per candidate
+    """
+    if not candidates:
+        return np.empty(0, dtype=np.float32)
+
+    query = normalize(query_embedding)
+    matrix = normalize(np.stack([decode_vector(c) for c in candidates]), inplace=True)
+    return (1.0 + matrix @ query) / 2.0
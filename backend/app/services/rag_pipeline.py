@@ -2,41 +2,260 @@
 RAG Pipeline Service — combines retrieval + LLM generation
 """
 
+import asyncio
 from typing import List, Dict, Optional
+import numpy as np
 from app.services.retrieval import RetrievalService, RetrievalResult
-from app.services.llm import LLMService
+from app.services.llm import LLMService, system_prompt_for
+from app.services.model_router import ModelRouter
+from app.services.singleflight import SingleFlight
+from app.services.cache import cache_serializable
+from app.services.compression import ContextCompressor
+from app.services.extractive import ExtractiveAnswerer
+from app.services.deadlines import (
+    DeadlineExceeded, applied_degradations, apply_degradation, deadline_bucket, degrade
+)
+from app.services.sessions import Session, SessionStore, score_pool
+from app.services.sharding import is_partial
+from app.services.tracing import annotate, record_cache, stage
+from app.utils.helpers import make_key, normalize_query
 from app.config import get_settings
 
 
+@cache_serializable
 class RAGResponse:
-    def __init__(self, answer: str, sources: List[Dict], query: str):
+    __slots__ = ("answer", "sources", "query", "model", "session_id", "degradations", "answer_path")
+
+    def __init__(
+        self,
+        answer: Optional[str],
+        sources: List[Dict],
+        query: str,
+        model: Optional[str] = None,
+        session_id: Optional[str] = None,
+        degradations: Optional[List[str]] = None,
+        answer_path: str = "llm"
+    ):
+        # answer is None when the deadline left no time to generate one
         self.answer = answer
         self.sources = sources
         self.query = query
+        self.model = model
+        self.session_id = session_id
+        self.degradations = degradations or []
+        # "llm", "extractive", "sources_only" or "no_results"
+        self.answer_path = answer_path
+
+    def to_dict(self) -> Dict:
+        """Convert to dictionary matching ChatResponse"""
+        return {
+            "query": self.query,
+            "answer": self.answer,
+            "sources": self.sources,
+            "model": self.model,
+            "session_id": self.session_id,
+            "degradations": self.degradations,
+            "answer_path": self.answer_path
+        }
 
 
 class RAGPipeline:
-    def __init__(self):
+    def __init__(
+        self,
+        retrieval_service: Optional[RetrievalService] = None,
+        llm_service: Optional[LLMService] = None
+    ):
+        """
+        Args:
+            retrieval_service: Retrieval for one tenant (the default tenant's if omitted)
+            llm_service: Groq client to share (one is created if omitted)
+        """
         settings = get_settings()
-        self.retrieval_service = RetrievalService()
-        self.llm_service = LLMService(
+        self.retrieval_service = retrieval_service or RetrievalService()
+        self.tenant = self.retrieval_service.tenant
+        self.system_prompt = system_prompt_for(self.tenant)
+        self.llm_service = llm_service or LLMService(
             model_name=settings.LLM_MODEL,
             api_key=settings.GROQ_API_KEY
         )
+        self.router = ModelRouter.from_settings()
+        self.flights = SingleFlight()
+        # Same tenant namespace as the retrieval cache
+        self.cache = self.retrieval_service.cache
+        self.cache_ttl = settings.CACHE_TTL_S
+        self.compressor = (
+            ContextCompressor(
+                self.retrieval_service.embedding_service,
+                self.cache,
+                max_sentences=settings.COMPRESSION_MAX_SENTENCES,
+                cache_ttl_s=settings.CACHE_EMBEDDING_TTL_S
+            )
+            if settings.CONTEXT_COMPRESSION_ENABLED else None
+        )
+        # Matches the query against the sentence embeddings compression uses
+        self.extractive = (
+            ExtractiveAnswerer.from_settings()
+            if settings.EXTRACTIVE_ANSWERS_ENABLED and self.compressor is not None else None
+        )
+        self.sessions = SessionStore(
+            ttl_s=settings.SESSION_TTL_S,
+            memory_budget_bytes=settings.SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+            max_turns=settings.SESSION_MAX_TURNS,
+            pool_size=settings.SESSION_POOL_SIZE
+        )
+        self.session_reuse_min_score = settings.SESSION_REUSE_MIN_SCORE
+        self.session_context_weight = settings.SESSION_CONTEXT_WEIGHT
+        self.follow_up_min_similarity = settings.SESSION_FOLLOW_UP_MIN_SIMILARITY
+
+    def memory_bytes(self) -> int:
+        """Approximate in-memory footprint of this tenant (index state and sessions); O(1)"""
+        return self.retrieval_service.memory_bytes() + self.sessions.memory_bytes()
+
+    def close(self):
+        self.retrieval_service.close()
+
+    def _answer_key(self, corpus_version: str, query: str, top_k: int, min_score: Optional[float]) -> str:
+        """Answers depend on the corpus, the prompt, both routed models and the retrieval settings"""
+        return self.cache.key(
+            "answer",
+            corpus_version,
+            self.system_prompt,
+            self.retrieval_service.embedding_service.model_name,
+            self.router.large_model,
+            self.router.fast_model if self.router.enabled else "",
+            self.compressor.max_sentences if self.compressor else 0,
+            (self.extractive.min_score, self.extractive.min_margin) if self.extractive else None,
+            normalize_query(query),
+            top_k,
+            min_score
+        )
+
+    async def aanswer(
+        self,
+        query: str,
+        top_k: int = 3,
+        min_score: Optional[float] = None,
+        session: Optional[Session] = None
+    ) -> RAGResponse:
+        """
+        Async variant of answer() for request handlers.
+
+        Concurrent requests for the same normalized question share one
+        retrieval + generation round trip. Follow-ups within a session
+        depend on the conversation, so they are neither coalesced nor
+        cached; a question on a new topic is, session or not.
+        """
+        query_embedding = None
+        if session is not None and session.turns:
+            # Cached, so the retrieval below does not embed the query again
+            query_embedding = await self.retrieval_service.aembed_query(query)
+            if session.refers_back(query_embedding, self.follow_up_min_similarity):
+                return await asyncio.to_thread(
+                    self._follow_up, session, query, query_embedding, top_k, min_score
+                )
+
+        # The shared round trip runs under the first caller's deadline and
+        # degrades for it, so only callers with similar budgets share it
+        key = make_key("answer", query, top_k, min_score, deadline_bucket())
+        result = await self.flights.do(key, self._aanswer, query, top_k, min_score)
+
+        # Coalesced callers may have phrased the query differently
+        response = RAGResponse(
+            answer=result.answer,
+            sources=result.sources,
+            query=query,
+            model=result.model,
+            degradations=result.degradations,
+            answer_path=result.answer_path
+        )
+        if session is not None:
+            # Both lookups hit the caches filled by the turn just answered
+            results = await self.retrieval_service.aretrieve(query=query, top_k=top_k, min_score=min_score)
+            if query_embedding is None:
+                query_embedding = await self.retrieval_service.aembed_query(query)
+            # A follow-up of the same session may hold the lock while it generates
+            await asyncio.to_thread(self._locked_record_turn, session, query, query_embedding, response, results)
+        return response
+
+    async def _aanswer(
+        self,
+        query: str,
+        top_k: int,
+        min_score: Optional[float]
+    ) -> RAGResponse:
+        """Async retrieval (batched, coalesced) followed by generation in a worker thread"""
+        corpus_version = await self.retrieval_service.acorpus_version()
+        key = self._answer_key(corpus_version, query, top_k, min_score)
+        cached = await self.cache.aget(key)
+        record_cache("answer", cached is not None)
+        if cached is not None:
+            return cached
+
+        results = await self.retrieval_service.aretrieve(
+            query=query,
+            top_k=top_k,
+            min_score=min_score
+        )
+        # Compression scores sentences against the (cached) query embedding
+        query_embedding = None
+        if self.compressor is not None and results:
+            query_embedding = await self.retrieval_service.aembed_query(query)
+
+        response = await asyncio.to_thread(self.generate, query, results, query_embedding)
+        # An answer built without some shards, or degraded by the deadline, is not reused
+        if not is_partial(results) and not response.degradations:
+            await self.cache.aset(key, response, self.cache_ttl)
+        return response
 
     def answer(
         self,
         query: str,
         top_k: int = 3,
-        min_score: Optional[float] = None
+        min_score: Optional[float] = None,
+        session: Optional[Session] = None
     ) -> RAGResponse:
         """
         Full RAG pipeline:
         1. Retrieve relevant chunks
         2. Build context
-        3. Generate answer with FLAN-T5
+        3. Generate answer with the routed Groq model
         4. Return answer + sources
+
+        Args:
+            query: User question
+            top_k: Chunks passed to the LLM
+            min_score: Similarity threshold (service default if omitted)
+            session: Conversation this question belongs to, if any; only
+                questions that refer back to the previous one are answered
+                from it
         """
+        query_embedding = None
+        if session is not None and session.turns:
+            query_embedding = self.retrieval_service.embed_query(query)
+            if session.refers_back(query_embedding, self.follow_up_min_similarity):
+                return self._follow_up(session, query, query_embedding, top_k, min_score)
+
+        response = self._answer(query, top_k, min_score)
+        if session is not None:
+            # The cached response is shared; the session id belongs to this caller
+            response = RAGResponse(
+                response.answer, response.sources, query, response.model,
+                degradations=response.degradations,
+                answer_path=response.answer_path
+            )
+            results = self.retrieval_service.retrieve(query=query, top_k=top_k, min_score=min_score)
+            if query_embedding is None:
+                query_embedding = self.retrieval_service.embed_query(query)
+            self._locked_record_turn(session, query, query_embedding, response, results)
+        return response
+
+    def _answer(self, query: str, top_k: int, min_score: Optional[float]) -> RAGResponse:
+        """Stateless answer() path with the answer cache"""
+        key = self._answer_key(self.retrieval_service.corpus_version(), query, top_k, min_score)
+        cached = self.cache.get(key)
+        record_cache("answer", cached is not None)
+        if cached is not None:
+            return cached
 
         # Step 1: Retrieve
         results: List[RetrievalResult] = self.retrieval_service.retrieve(
@@ -45,23 +264,117 @@ class RAGPipeline:
             min_score=min_score
         )
 
-        if not results:
-            return RAGResponse(
-                answer="I couldn't find relevant information to answer your question.",
-                sources=[],
-                query=query
+        response = self.generate(query, results)
+        if not is_partial(results) and not response.degradations:
+            self.cache.set(key, response, self.cache_ttl)
+        return response
+
+    def _follow_up(
+        self,
+        session: Session,
+        query: str,
+        query_embedding: np.ndarray,
+        top_k: int,
+        min_score: Optional[float]
+    ) -> RAGResponse:
+        """
+        Answer a follow-up from the session's chunk pool.
+
+        The question is embedded together with the previous one, the pooled
+        chunks are re-scored locally, and a vector search runs only when
+        fewer than top_k pooled chunks are relevant enough.
+        """
+        with session.lock:
+            vector = session.context_vector(query_embedding, self.session_context_weight)
+            results = self._session_candidates(session, vector, top_k, min_score)
+            response = self.generate(query, results, vector, history=session.history())
+            self._record_turn(session, query, query_embedding, response, results)
+        return response
+
+    def _session_candidates(
+        self,
+        session: Session,
+        vector: np.ndarray,
+        top_k: int,
+        min_score: Optional[float]
+    ) -> List[RetrievalResult]:
+        """Best pooled chunks for the follow-up vector, searching only on a pool miss"""
+        min_score = min_score if min_score is not None else self.retrieval_service.similarity_threshold
+
+        pool = list(session.pool.values())
+        if self.compressor is not None:
+            pool = self._fill_pool(session, pool)
+        scored = [
+            (score, result) for score, result in score_pool(pool, vector)
+            if score >= self.session_reuse_min_score
+        ]
+
+        self.sessions.count_follow_up(reused_pool=len(scored) >= top_k)
+        if len(scored) < top_k:
+            fresh = self.retrieval_service.search(vector, top_k=top_k, min_score=min_score)
+            session.extend_pool(fresh)
+            pool = list(session.pool.values())
+            if self.compressor is None:
+                # Without sentence embeddings the pool cannot be re-scored
+                return fresh
+            pool = self._fill_pool(session, pool)
+            scored = score_pool(pool, vector)
+
+        # Copies carry this turn's scores; pooled results stay untouched
+        return [
+            RetrievalResult(
+                text=result.text,
+                chunk_id=result.chunk_id,
+                score=score,
+                metadata=result.metadata,
+                sentences=result.sentences,
+                sentence_embeddings=result.sentence_embeddings
             )
+            for score, result in scored[:top_k]
+            if score >= min_score
+        ]
 
-        # Step 2: Build context
-        context = "\n\n".join(
-            f"[{i+1}] {r.text}" for i, r in enumerate(results)
-        )
+    def _fill_pool(self, session: Session, pool: List[RetrievalResult]) -> List[RetrievalResult]:
+        """
+        Pooled chunks with sentence embeddings, kept in the session.
 
-        # Step 3: Generate answer
-        answer = self.llm_service.generate_answer(query=query, context=context)
+        Pooled results may be shared with the retrieval cache, so the
+        session keeps the filled-in copies instead of modifying them.
+        """
+        filled = self.compressor.with_sentence_embeddings(pool)
+        for result in filled:
+            if result.chunk_id in session.pool:
+                session.pool[result.chunk_id] = result
+        return filled
 
-        # Step 4: Build sources list
-        sources = [
+    def _locked_record_turn(
+        self,
+        session: Session,
+        query: str,
+        query_embedding: np.ndarray,
+        response: RAGResponse,
+        results: List[RetrievalResult]
+    ):
+        """_record_turn() for callers not already holding the session's lock"""
+        with session.lock:
+            self._record_turn(session, query, query_embedding, response, results)
+
+    def _record_turn(
+        self,
+        session: Session,
+        query: str,
+        query_embedding: np.ndarray,
+        response: RAGResponse,
+        results: List[RetrievalResult]
+    ):
+        """Remember a turn; the caller holds session.lock (follow-ups read the state under it)"""
+        session.record(query, query_embedding, response.answer, results)
+        response.session_id = session.session_id
+        self.sessions.enforce_budget(changed=session)
+
+    @staticmethod
+    def _sources(results: List[RetrievalResult]) -> List[Dict]:
+        return [
             {
                 "chunk_id": r.chunk_id,
                 "score": round(r.score, 4),
@@ -70,4 +383,125 @@ class RAGPipeline:
             for r in results
         ]
 
-        return RAGResponse(answer=answer, sources=sources, query=query)
+    def _sources_only(self, query: str, results: List[RetrievalResult]) -> RAGResponse:
+        """Response for a request whose deadline leaves no time to generate"""
+        return RAGResponse(
+            answer=None,
+            sources=self._sources(results),
+            query=query,
+            degradations=applied_degradations(),
+            answer_path="sources_only"
+        )
+
+    def _extract(
+        self,
+        query: str,
+        results: List[RetrievalResult],
+        query_embedding: np.ndarray
+    ) -> Optional[RAGResponse]:
+        """Answer a simple lookup with one retrieved sentence, or None to generate"""
+        complexity = self.router.question_complexity(query)
+        if complexity is not None:
+            annotate(extractive=complexity)
+            return None
+
+        with stage("extractive"):
+            scored = self.compressor.with_sentence_embeddings(results, compute=not degrade("skip_optional"))
+            extracted = self.extractive.answer(query_embedding, scored)
+        if extracted is None:
+            annotate(extractive="low confidence")
+            return None
+
+        annotate(extractive_score=round(extracted.score, 4), extractive_margin=round(extracted.margin, 4))
+        return RAGResponse(
+            answer=extracted.format(),
+            sources=self._sources(results),
+            query=query,
+            degradations=applied_degradations(),
+            answer_path="extractive"
+        )
+
+    def generate(
+        self,
+        query: str,
+        results: List[RetrievalResult],
+        query_embedding: Optional[np.ndarray] = None,
+        history: Optional[List[str]] = None
+    ) -> RAGResponse:
+        """
+        Steps 2-4 of the pipeline for already retrieved chunks.
+
+        A simple question answered verbatim by one sentence of the top
+        chunks gets that sentence back without calling the LLM. Under a
+        request deadline, generation switches to the fast model or
+        is skipped altogether as the remaining budget shrinks; the response
+        lists the degradations applied.
+
+        Args:
+            query: User question
+            results: Retrieved chunks
+            query_embedding: Query vector for compression (looked up from the cache if omitted)
+            history: Earlier questions of the conversation, oldest first
+        """
+        if not results:
+            return RAGResponse(
+                answer="I couldn't find relevant information to answer your question.",
+                sources=[],
+                query=query,
+                degradations=applied_degradations(),
+                answer_path="no_results"
+            )
+
+        if self.compressor is not None and query_embedding is None:
+            query_embedding = self.retrieval_service.embed_query(query)
+
+        # Step 2a: Answer from a single confidently matching sentence (milliseconds,
+        # so it is tried even when the deadline leaves no time to generate);
+        # follow-ups depend on the conversation and always go to the LLM
+        if self.extractive is not None and not history:
+            extracted = self._extract(query, results, query_embedding)
+            if extracted is not None:
+                return extracted
+
+        if degrade("no_generation"):
+            return self._sources_only(query, results)
+
+        # Step 2b: Build context, keeping only the most relevant sentences
+        with stage("prompt_build"):
+            if self.compressor is not None:
+                context = self.compressor.compress(query_embedding, results)
+            else:
+                context = "\n\n".join(
+                    f"[{i+1}] {r.text}" for i, r in enumerate(results)
+                )
+
+        # Step 3: Route to a model (the fast one when short of time) and generate answer
+        if degrade("no_generation"):
+            return self._sources_only(query, results)
+        if degrade("fast_model"):
+            decision = self.router.fast("deadline")
+        else:
+            decision = self.router.route(query, results, context)
+        annotate(model=decision.model, routing_reason=decision.reason, context_chars=len(context))
+        try:
+            with stage("llm"):
+                answer = self.llm_service.generate_answer(
+                    query=query,
+                    context=context,
+                    model=decision.model,
+                    history=history,
+                    system_prompt=self.system_prompt
+                )
+        except DeadlineExceeded:
+            # The sources are still worth returning
+            apply_degradation("no_generation")
+            return self._sources_only(query, results)
+
+        # Step 4: Build sources list
+        return RAGResponse(
+            answer=answer,
+            sources=self._sources(results),
+            query=query,
+            model=decision.model,
+            degradations=applied_degradations()
+        )
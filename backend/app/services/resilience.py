@@ -0,0 +1,394 @@
+"""
+Resilient upstream calls for HuggingFace and Groq
+
+Wraps each blocking SDK call with:
+    - a per-call deadline covering all attempts, capped at the remaining
+      budget of the request making the call
+    - jittered exponential retries on retryable errors (timeouts, 429, 5xx)
+    - hedging: a duplicate request once the first one is slower than the
+      observed p95 latency, taking whichever finishes first
+    - a circuit breaker that fails fast while the provider is down
+    - admission through the provider's scheduler for every request sent,
+      so retries and hedges count against its rate limits too
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.services.deadlines import DeadlineExceeded, remaining_s
+from app.services.scheduler import UpstreamScheduler, get_scheduler
+from app.services.tracing import annotate
+
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Base class for failures raised by the resilience layer"""
+
+
+class UpstreamTimeoutError(UpstreamError, TimeoutError):
+    """The call did not complete within its deadline"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open and the call was not attempted"""
+
+
+def status_code_of(exc: Exception) -> Optional[int]:
+    """Extract an HTTP status code from SDK exceptions, if any"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether an upstream failure is worth retrying"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+
+    status = status_code_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    # SDK-specific transport errors (requests/httpx/groq) are not builtin subclasses
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout_s: Time the circuit stays open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_thread: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go through; lets one probe through when half-open"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                return False
+            if self._probing:
+                return False
+            self._state = self.HALF_OPEN
+            self._probing = True
+            self._probe_thread = threading.get_ident()
+            return True
+
+    def release(self):
+        """
+        Give back the half-open probe held by this thread without a verdict.
+
+        For probes that ended in a way that says nothing about the upstream's
+        health (a non-retryable error, the request's own deadline); the next
+        call may probe again. A no-op for any other thread or state.
+        """
+        with self._lock:
+            if self._probing and self._probe_thread == threading.get_ident():
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ResilientClient:
+    """Deadline, retry, hedging and circuit-breaking wrapper for one upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        timeout_s: float = 20.0,
+        max_retries: int = 2,
+        backoff_base_s: float = 0.25,
+        backoff_max_s: float = 4.0,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        scheduler: Optional[UpstreamScheduler] = None,
+        max_workers: int = 32
+    ):
+        """
+        Args:
+            name: Upstream name used in metrics and health output
+            timeout_s: Deadline for a whole call, including retries
+            max_retries: Retries after the first attempt
+            backoff_base_s: Base delay of the exponential backoff
+            backoff_max_s: Cap on a single backoff delay
+            hedge: Whether to send hedged duplicate requests
+            hedge_percentile: Latency percentile after which a hedge is sent
+            hedge_min_samples: Latency samples needed before hedging starts
+            breaker: Circuit breaker (a default one is created if omitted)
+            scheduler: Admission queue every request goes through (none if omitted)
+            max_workers: Threads available for in-flight attempts
+        """
+        self.name = name
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-upstream")
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.deadline_cuts = 0
+
+    def call(self, func: Callable, *args, admit_tokens: float = 0, **kwargs) -> Any:
+        """
+        Call a blocking upstream function with deadline, retries and hedging.
+
+        Args:
+            func: SDK function to call
+            *args, **kwargs: Arguments for func
+            admit_tokens: Estimated tokens per request, charged to the
+                scheduler for every request sent (retries and hedges included)
+
+        Returns:
+            Result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            UpstreamTimeoutError: If the deadline passes
+            DeadlineExceeded: If the request's own deadline passes first
+            AdmissionRejected: If the scheduler sheds an attempt
+            Exception: The last upstream error if it is not retryable or retries ran out
+        """
+        # Checked before allow(), which may hand this call the half-open probe
+        if remaining_s() <= 0:
+            raise DeadlineExceeded(f"No time left for a {self.name} call")
+
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open; failing fast")
+
+        self.calls += 1
+        try:
+            return self._call_with_retries(func, args, kwargs, admit_tokens)
+        finally:
+            # A probe not settled by a success or a retryable failure must not
+            # stay taken, or the circuit would never let another call through
+            self.breaker.release()
+
+    def _call_with_retries(self, func: Callable, args, kwargs, admit_tokens: float) -> Any:
+        """Attempts with jittered backoff until success, a final error or the deadline"""
+        queue_wait_s = 0.0
+        deadline = None
+        for attempt in range(self.max_retries + 1):
+            # Every attempt waits for admission; the call's deadline starts
+            # once the first one is admitted, so queueing does not eat it
+            queue_wait_s += self._admit(admit_tokens, None if deadline is None else deadline - time.monotonic())
+            if deadline is None:
+                budget = remaining_s()
+                if budget <= 0:
+                    raise DeadlineExceeded(f"No time left for a {self.name} call")
+                cut_by_request = budget < self.timeout_s
+                deadline = time.monotonic() + min(self.timeout_s, budget)
+
+            try:
+                result = self._attempt(func, args, kwargs, deadline, admit_tokens)
+            except Exception as e:
+                if cut_by_request and isinstance(e, UpstreamTimeoutError):
+                    # The request ran out of time, which says nothing about the
+                    # upstream: a probe is released (in call()), not failed
+                    self.deadline_cuts += 1
+                    raise DeadlineExceeded(f"{self.name} call cut off at the request deadline") from e
+
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+
+                delay = min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.0)
+
+                out_of_time = time.monotonic() + delay >= deadline
+                if not retryable or attempt == self.max_retries or out_of_time or not self.breaker.allow():
+                    self.failures += 1
+                    if isinstance(e, UpstreamTimeoutError):
+                        self.timeouts += 1
+                    raise
+
+                self.retries += 1
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                if self.scheduler is not None:
+                    annotate(**{f"{self.name}_queue_wait_ms": round(queue_wait_s * 1000.0, 2)})
+                return result
+
+    def _admit(self, tokens: float, max_wait_s: Optional[float]) -> float:
+        """
+        Wait for the scheduler to admit one request (no-op without a scheduler).
+
+        Args:
+            tokens: Estimated tokens of the request
+            max_wait_s: Time left before the call's deadline, for retries
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        if self.scheduler is None:
+            return 0.0
+        if max_wait_s is not None and max_wait_s <= 0:
+            raise UpstreamTimeoutError(f"{self.name} call exceeded its {self.timeout_s}s deadline")
+        return self.scheduler.acquire(tokens=tokens, max_wait_s=max_wait_s)
+
+    def _attempt(self, func: Callable, args, kwargs, deadline: float, admit_tokens: float = 0) -> Any:
+        """One logical attempt: the primary request plus an optional hedge"""
+        started = time.monotonic()
+        pending = {self._executor.submit(func, *args, **kwargs)}
+        hedged = None
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            done, pending = wait(pending, timeout=min(hedge_delay, max(0.0, deadline - started)))
+            # A hedge is only sent if the scheduler can admit it without queueing
+            if not done and time.monotonic() < deadline and (
+                self.scheduler is None or self.scheduler.try_acquire(admit_tokens)
+            ):
+                hedged = self._executor.submit(func, *args, **kwargs)
+                pending.add(hedged)
+                self.hedges += 1
+            pending |= done
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self.hedge_wins += 1
+                    self._record_latency(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            raise error
+        raise UpstreamTimeoutError(f"{self.name} call exceeded its {self.timeout_s}s deadline")
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Observed latency percentile, once enough samples exist"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return ordered[index]
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def stats(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        hedge_delay = self._hedge_delay()
+        return {
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "deadline_cuts": self.deadline_cuts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": round(hedge_delay * 1000, 1) if hedge_delay is not None else None
+        }
+
+
+_clients: Dict[str, ResilientClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> ResilientClient:
+    """
+    Shared ResilientClient for an upstream, configured from Settings.
+
+    Every service instance talking to the same provider shares one
+    client, so they share latency statistics, the circuit breaker and
+    the provider's admission scheduler.
+
+    Args:
+        name: "huggingface" or "groq"
+    """
+    with _clients_lock:
+        if name not in _clients:
+            settings = get_settings()
+            _clients[name] = ResilientClient(
+                name,
+                timeout_s=settings.UPSTREAM_TIMEOUT_S,
+                max_retries=settings.UPSTREAM_MAX_RETRIES,
+                backoff_base_s=settings.UPSTREAM_BACKOFF_BASE_S,
+                backoff_max_s=settings.UPSTREAM_BACKOFF_MAX_S,
+                hedge=settings.UPSTREAM_HEDGE_ENABLED,
+                hedge_percentile=settings.UPSTREAM_HEDGE_PERCENTILE,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+                    reset_timeout_s=settings.BREAKER_RESET_S
+                ),
+                scheduler=get_scheduler(name)
+            )
+        return _clients[name]
+
+
+def upstream_stats() -> Dict[str, Dict]:
+    """Stats for every upstream client created so far"""
+    return {name: client.stats() for name, client in _clients.items()}
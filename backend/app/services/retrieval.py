@@ -3,19 +3,45 @@ Retrieval Service for RAG System
 Handles query processing and semantic search
 """
 
+import asyncio
+import time
 from typing import List, Dict, Optional
+import numpy as np
 from app.services.embeddings import EmbeddingService
-from app.services.vector_store import VectorStore
-from app.config import get_settings
+from app.services.vector_store import VectorStore, shared_client
+from app.services.centroids import CentroidIndex
+from app.services.sharding import ShardedVectorStore, ShardResults, is_partial
+from app.services.singleflight import SingleFlight
+from app.services.batching import MicroBatcher
+from app.services.cache import cache_serializable, get_cache
+from app.services.compression import decode_sentence_embeddings
+from app.services.deadlines import applied_degradations, deadline_bucket, degrade, within_deadline
+from app.services.tracing import annotate, record_cache, stage
+from app.utils.helpers import make_key, normalize_query
+from app.config import TenantConfig, get_settings
 
 
+@cache_serializable
 class RetrievalResult:
     """Represents a single retrieval result"""
-    def __init__(self, text: str, chunk_id: str, score: float, metadata: Dict = None):
+    __slots__ = ("text", "chunk_id", "score", "metadata", "sentences", "sentence_embeddings")
+
+    def __init__(
+        self,
+        text: str,
+        chunk_id: str,
+        score: float,
+        metadata: Dict = None,
+        sentences: Optional[List[str]] = None,
+        sentence_embeddings: Optional[np.ndarray] = None
+    ):
         self.text = text
         self.chunk_id = chunk_id
         self.score = score
         self.metadata = metadata or {}
+        # Used by context compression; not part of the API response
+        self.sentences = sentences
+        self.sentence_embeddings = sentence_embeddings
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization"""
@@ -27,29 +53,220 @@ class RetrievalResult:
         }
 
 
+def _trace_results(results: List[RetrievalResult]):
+    """Record the returned chunks on the current request's trace"""
+    annotate(results=[{"chunk_id": r.chunk_id, "score": round(r.score, 4)} for r in results])
+
+
 class RetrievalService:
     """Service for retrieving relevant document chunks based on queries"""
     
-    def __init__(self):
-        """Initialize retrieval service with embeddings and vector store"""
+    def __init__(
+        self,
+        tenant: Optional[TenantConfig] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        query_batcher: Optional[MicroBatcher] = None
+    ):
+        """
+        Initialize retrieval service with embeddings and vector store.
+        
+        Args:
+            tenant: Whose collection to search (the default tenant if omitted)
+            embedding_service: Query encoder to share (one is created if omitted)
+            query_batcher: Micro-batcher to share; it must wrap embedding_service
+        """
         settings = get_settings()
+        self.tenant = tenant or settings.tenants()[settings.DEFAULT_TENANT]
         
         # Initialize embedding service for query encoding
-        self.embedding_service = EmbeddingService(
+        self.embedding_service = embedding_service or EmbeddingService(
             model_name=settings.EMBEDDING_MODEL,
             api_key=settings.HUGGINGFACE_API_KEY
         )
         
-        # Initialize vector store for similarity search
-        self.vector_store = VectorStore(
-            mongodb_uri=settings.MONGODB_URI,
-            db_name=settings.MONGODB_DB_NAME,
-            collection_name=settings.MONGODB_COLLECTION
-        )
+        # Initialize vector store for similarity search (several shards
+        # searched in parallel when the tenant has shards)
+        if self.tenant.shards:
+            self.vector_store = ShardedVectorStore.from_specs(self.tenant.shards)
+        else:
+            mongodb_uri = self.tenant.mongodb_uri or settings.MONGODB_URI
+            self.vector_store = VectorStore(
+                mongodb_uri=mongodb_uri,
+                db_name=self.tenant.db_name or settings.MONGODB_DB_NAME,
+                collection_name=self.tenant.collection,
+                storage=settings.EMBEDDING_STORAGE,
+                rescore_factor=settings.RESCORE_FACTOR,
+                client=shared_client(mongodb_uri)
+            )
         
         # Default retrieval parameters
         self.default_top_k = settings.TOP_K
         self.similarity_threshold = settings.SIMILARITY_THRESHOLD
+        
+        # Fetch precomputed sentence embeddings for context compression
+        self.include_sentences = settings.CONTEXT_COMPRESSION_ENABLED
+        
+        # Small-to-big: search child chunks, return their parent clauses
+        self.small_to_big = settings.CHUNKING_STRATEGY == "structured"
+        self.parent_fetch_factor = max(1, settings.PARENT_FETCH_FACTOR)
+        
+        # Coarse-to-fine: search only the chunks of the best page/section
+        # groups (collections ingested without centroids are searched flat)
+        self.coarse_top_groups = settings.COARSE_TOP_GROUPS
+        self.coarse_top_documents = settings.COARSE_TOP_DOCUMENTS
+        self._centroids: Optional[CentroidIndex] = None
+        self._centroids_key = None
+        
+        # ANN candidates per result when a request's deadline calls for a cheaper search
+        self.degraded_candidates_factor = max(1, settings.DEGRADED_CANDIDATES_FACTOR)
+        
+        # Coalesces identical concurrent queries into one upstream call
+        self.flights = SingleFlight()
+        
+        # Groups concurrent query embeddings into batched calls
+        self.query_batcher = query_batcher or MicroBatcher(
+            self.embedding_service.generate_embeddings,
+            max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBED_BATCH_MAX_WAIT_MS
+        )
+        
+        # Two-level cache for query embeddings and retrieval results;
+        # result keys include the corpus version so re-ingestion invalidates
+        # them, and live under the tenant's namespace
+        self.cache = get_cache().namespaced(f"tenant={self.tenant.tenant_id}")
+        self.cache_ttl = settings.CACHE_TTL_S
+        self.embedding_cache_ttl = settings.CACHE_EMBEDDING_TTL_S
+        self.corpus_version_ttl = settings.CORPUS_VERSION_TTL_S
+        self._corpus_version = None
+        self._corpus_version_checked = 0.0
+    
+    def memory_bytes(self) -> int:
+        """Approximate size of the in-memory index state (centroids)"""
+        return self._centroids.nbytes if self._centroids is not None else 0
+    
+    def close(self):
+        """Release what the vector store holds (shard fan-out threads)"""
+        if hasattr(self.vector_store, "close"):
+            self.vector_store.close()
+    
+    def corpus_version(self) -> str:
+        """Corpus version from the vector store, re-read at most every CORPUS_VERSION_TTL_S"""
+        if self._corpus_version_stale():
+            self._corpus_version = self.vector_store.corpus_version()
+            self._corpus_version_checked = time.monotonic()
+        return self._corpus_version
+    
+    async def acorpus_version(self) -> str:
+        """corpus_version() that only leaves the event loop when a refresh is due"""
+        if self._corpus_version_stale():
+            return await asyncio.to_thread(self.corpus_version)
+        return self._corpus_version
+    
+    def _corpus_version_stale(self) -> bool:
+        return (
+            self._corpus_version is None
+            or time.monotonic() - self._corpus_version_checked > self.corpus_version_ttl
+        )
+    
+    def _cacheable(self, results: List[RetrievalResult]) -> bool:
+        """Results missing shards or found with a reduced search are not reused"""
+        return not is_partial(results) and "reduced_search" not in applied_degradations()
+    
+    def _embedding_key(self, query: str) -> str:
+        return self.cache.key("embedding", self.embedding_service.model_name, normalize_query(query))
+    
+    def _results_key(self, corpus_version: str, query: str, top_k: Optional[int], min_score: Optional[float]) -> str:
+        return self.cache.key(
+            "retrieval",
+            corpus_version,
+            self.embedding_service.model_name,
+            self.vector_store.storage,
+            self.small_to_big,
+            normalize_query(query),
+            top_k or self.default_top_k,
+            min_score or self.similarity_threshold
+        )
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Query embedding, served from the cache when possible"""
+        key = self._embedding_key(query)
+        embedding = self.cache.get(key)
+        record_cache("embedding", embedding is not None)
+        if embedding is None:
+            with stage("embed"):
+                embedding = self.embedding_service.generate_single_embedding(query)
+            self.cache.set(key, embedding, self.embedding_cache_ttl)
+        return embedding
+    
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async embed_query() that goes through the micro-batcher on a miss"""
+        key = self._embedding_key(query)
+        embedding = await self.cache.aget(key)
+        record_cache("embedding", embedding is not None)
+        if embedding is None:
+            with stage("embed"):
+                # The batch is shared, so this request stops waiting at its deadline
+                embedding = await within_deadline(self.query_batcher.submit(query))
+            await self.cache.aset(key, embedding, self.embedding_cache_ttl)
+        return embedding
+    
+    async def aprefetch(
+        self,
+        query: str,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None
+    ):
+        """
+        Warm the embedding and retrieval caches for a question being typed.
+        
+        The embedding is computed at the caller's admission priority
+        instead of in a micro-batch shared with interactive requests.
+        Cancelling stops it before the search; a search that has started
+        still completes, is cached and is shared with an identical request.
+        """
+        key = self._embedding_key(query)
+        if await self.cache.aget(key) is None:
+            embedding = await asyncio.to_thread(self.embedding_service.generate_single_embedding, query)
+            await self.cache.aset(key, embedding, self.embedding_cache_ttl)
+        await self.aretrieve(query, top_k, min_score)
+    
+    async def aretrieve(
+        self, 
+        query: str, 
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None
+    ) -> List[RetrievalResult]:
+        """
+        Async variant of retrieve() for request handlers.
+        
+        Concurrent calls with the same normalized query and parameters
+        share a single computation, and the query embedding goes through
+        the micro-batcher so different concurrent queries share one
+        embedding call. The shared computation runs under the first
+        caller's deadline, so only callers with similar budgets share it.
+        """
+        key = make_key("retrieve", query, top_k, min_score, deadline_bucket())
+        return await self.flights.do(key, self._aretrieve, query, top_k, min_score)
+    
+    async def _aretrieve(
+        self, 
+        query: str, 
+        top_k: Optional[int],
+        min_score: Optional[float]
+    ) -> List[RetrievalResult]:
+        """Cached or batched embedding followed by a search in a worker thread"""
+        key = self._results_key(await self.acorpus_version(), query, top_k, min_score)
+        results = await self.cache.aget(key)
+        record_cache("retrieval", results is not None)
+        if results is not None:
+            _trace_results(results)
+            return results
+        
+        query_embedding = await self.aembed_query(query)
+        results = await asyncio.to_thread(self.search, query_embedding, top_k, min_score)
+        if self._cacheable(results):
+            await self.cache.aset(key, results, self.cache_ttl)
+        return results
     
     def retrieve(
         self, 
@@ -68,28 +285,148 @@ class RetrievalService:
         Returns:
             List of RetrievalResult objects sorted by relevance
         """
+        key = self._results_key(self.corpus_version(), query, top_k, min_score)
+        results = self.cache.get(key)
+        record_cache("retrieval", results is not None)
+        if results is not None:
+            _trace_results(results)
+            return results
+        
+        # Step 1: Generate embedding for the query (float32 array, encoded by the store)
+        query_embedding = self.embed_query(query)
+        
+        # Steps 2-3: Search and filter
+        results = self.search(query_embedding, top_k, min_score)
+        if self._cacheable(results):
+            self.cache.set(key, results, self.cache_ttl)
+        return results
+    
+    def search(
+        self, 
+        query_embedding: np.ndarray, 
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None
+    ) -> List[RetrievalResult]:
+        """
+        Search with an already computed query embedding.
+        
+        Args:
+            query_embedding: Normalized query vector
+            top_k: Number of results to return (default from config)
+            min_score: Minimum similarity score threshold (default from config)
+            
+        Returns:
+            List of RetrievalResult objects sorted by relevance (a
+            ShardResults listing the missing shards if some did not answer)
+        """
         # Use defaults if not specified
         top_k = top_k or self.default_top_k
         min_score = min_score or self.similarity_threshold
         
-        # Step 1: Generate embedding for the query
-        query_embedding = self.embedding_service.generate_single_embedding(query)
+        # Step 2a: Coarse stage, pick the groups worth searching
+        with stage("coarse_search"):
+            group_ids = self._coarse_groups(query_embedding)
         
-        # Convert numpy array to list if needed (MongoDB requires list format)
-        if hasattr(query_embedding, 'tolist'):
-            query_embedding = query_embedding.tolist()
-        
-        # Step 2: Perform vector similarity search
-        raw_results = self.vector_store.search_similar(
-            query_embedding=query_embedding,
-            top_k=top_k
-        )
+        # Step 2b: Perform vector similarity search (over children when
+        # small-to-big, fetching extra because siblings share a parent),
+        # with fewer ANN candidates when the request is short of time
+        with stage("vector_search"):
+            raw_results = self.vector_store.search_similar(
+                query_embedding=query_embedding,
+                top_k=top_k * self.parent_fetch_factor if self.small_to_big else top_k,
+                include_sentences=self.include_sentences and not self.small_to_big,
+                group_ids=group_ids,
+                candidates_factor=self.degraded_candidates_factor if degrade("reduced_search") else 10
+            )
+        missing_shards = getattr(raw_results, "missing", None)
+        if self.small_to_big:
+            with stage("parent_lookup"):
+                raw_results = self._expand_to_parents(raw_results, top_k)
         
         # Step 3: Format and filter results
-        results = self._format_results(raw_results, min_score)
+        with stage("filter"):
+            results = self._format_results(raw_results, min_score)
+        annotate(
+            min_score=min_score,
+            dropped_below_min_score=len(raw_results) - len(results)
+        )
+        _trace_results(results)
         
+        if missing_shards:
+            return ShardResults(results, missing=missing_shards)
         return results
     
+    def _coarse_groups(self, query_embedding: np.ndarray) -> Optional[List[str]]:
+        """
+        Groups the fine search is restricted to, or None for a flat search.
+        
+        The centroids are reloaded whenever the corpus version or the
+        active collection changes. A corpus with chunks outside any group
+        (ingested before centroids existed) has no centroids and is searched
+        flat, as is one with no more groups than the fan-out, since
+        filtering would not narrow it.
+        """
+        if self.coarse_top_groups <= 0:
+            return None
+        
+        key = (self.vector_store.physical_name, self._corpus_version)
+        if self._centroids is None or self._centroids_key != key:
+            self._centroids = self.vector_store.load_centroids()
+            self._centroids_key = key
+        
+        if len(self._centroids) <= self.coarse_top_groups:
+            return None
+        group_ids, documents = self._centroids.top_groups(
+            query_embedding, self.coarse_top_groups, self.coarse_top_documents
+        )
+        annotate(coarse_groups=len(group_ids), coarse_documents=documents, total_groups=len(self._centroids))
+        return group_ids
+    
+    def _expand_to_parents(self, raw_results: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Replace matched children by their parent clauses.
+        
+        Each parent appears once, ranked and scored by its best child.
+        Results without a parent_id (chunks from a flat ingestion) are
+        kept as they are.
+        
+        Args:
+            raw_results: Child chunks from the vector search, best first
+            top_k: Number of distinct results to keep
+            
+        Returns:
+            Raw result dicts in the shape _format_results() expects
+        """
+        best = []
+        seen = set()
+        for result in raw_results:
+            key = result.get("parent_id") or result.get("chunk_id")
+            if key in seen:
+                continue
+            seen.add(key)
+            best.append(result)
+            if len(best) == top_k:
+                break
+        
+        parents = self.vector_store.get_parents(
+            [r["parent_id"] for r in best if r.get("parent_id")],
+            include_sentences=self.include_sentences
+        )
+        
+        expanded = []
+        for result in best:
+            parent = parents.get(result.get("parent_id"))
+            if parent is None:
+                expanded.append(result)
+                continue
+            expanded.append({
+                **parent,
+                "chunk_id": parent["parent_id"],
+                "score": result["score"],
+                "metadata": {**parent.get("metadata", {}), "matched_chunk_id": result.get("chunk_id")}
+            })
+        return expanded
+    
     def _format_results(
         self, 
         raw_results: List[Dict],
@@ -113,6 +450,7 @@ class RetrievalService:
             chunk_id = result.get("chunk_id", "")
             score = result.get("score", 0.0)
             metadata = result.get("metadata", {})
+            sentences = result.get("sentences")
             
             # Filter by minimum score
             if score >= min_score:
@@ -120,7 +458,11 @@ class RetrievalService:
                     text=text,
                     chunk_id=chunk_id,
                     score=score,
-                    metadata=metadata
+                    metadata=metadata,
+                    sentences=sentences,
+                    sentence_embeddings=decode_sentence_embeddings(
+                        result.get("sentence_embeddings"), len(sentences or [])
+                    )
                 )
                 formatted_results.append(retrieval_result)
         
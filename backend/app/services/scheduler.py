@@ -0,0 +1,295 @@
+"""
+Admission control for rate-limited upstreams
+
+Token buckets model a provider's requests-per-minute and tokens-per-minute
+limits. Callers wait in a bounded priority queue (interactive chat ahead
+of batch and eval traffic, speculative prefetches last) and are shed with
+a Retry-After hint when their expected queue wait would exceed the
+deadline, instead of being sent upstream to fail with a 429.
+"""
+
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.config import get_settings
+from app.services.deadlines import DeadlineExceeded, remaining_s
+
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "batch": 1, "eval": 2, "prefetch": 3}
+
+_request_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "request_priority", default="batch"
+)
+
+
+@contextmanager
+def priority(name: str):
+    """
+    Run the enclosed code (and worker threads started from it) at a priority.
+
+    Example:
+        with priority("interactive"):
+            await pipeline.aanswer(query)
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{name}'. Choose one of: {', '.join(PRIORITIES)}")
+    token = _request_priority.set(name)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority of the current request context"""
+    return _request_priority.get()
+
+
+class AdmissionRejected(Exception):
+    """The request was shed because the upstream is saturated"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(
+            f"{upstream} is at its rate limit; retry after {math.ceil(retry_after)}s"
+        )
+
+
+class TokenBucket:
+    """Continuous-refill token bucket sized for a per-minute limit"""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: Limit per minute; 0 or less disables the bucket
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # A single request larger than the bucket is allowed once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def backlog_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens will have accrued, without the capacity cap"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Return (positive) or charge (negative) tokens after the fact"""
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class UpstreamScheduler:
+    """Priority admission queue in front of one rate-limited provider"""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float = 0,
+        max_queue: int = 100,
+        max_wait_s: float = 10.0,
+        max_wait_by_priority: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            name: Upstream name used in errors and metrics
+            requests_per_minute: Provider RPM limit (0 = unlimited)
+            tokens_per_minute: Provider TPM limit (0 = unlimited)
+            max_queue: Maximum number of waiting callers
+            max_wait_s: Callers expected to wait longer than this are shed
+            max_wait_by_priority: Tighter max_wait_s for some priorities
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.max_wait_by_priority = max_wait_by_priority or {}
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, seq, tokens)
+        self._seq = itertools.count()
+
+        self.admitted = 0
+        self.shed = 0
+        self.queue_wait_total = 0.0
+
+    def _time_until(self, tokens: float) -> float:
+        return max(self.requests.time_until(1), self.tokens.time_until(tokens))
+
+    def acquire(self, tokens: float = 0, max_wait_s: Optional[float] = None) -> float:
+        """
+        Block until the request may be sent upstream.
+
+        Args:
+            tokens: Estimated tokens the request will use
+            max_wait_s: Tighter cap on the wait than the priority's own
+                (e.g. the time left before a retry's call deadline)
+
+        Returns:
+            Seconds spent waiting in the queue
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait would exceed max_wait_s
+            DeadlineExceeded: If the wait would outlast the request's deadline
+        """
+        name = current_priority()
+        rank = PRIORITIES[name]
+        limit = self.max_wait_by_priority.get(name, self.max_wait_s)
+        if max_wait_s is not None:
+            limit = min(limit, max_wait_s)
+        # Waiting past the request's deadline is pointless
+        budget = remaining_s()
+        cut_by_request = budget < limit
+        max_wait_s = min(limit, budget)
+        started = time.monotonic()
+
+        with self._cond:
+            # Estimate the wait from everything queued at the same or higher priority
+            ahead = [entry for entry in self._waiting if entry[0] <= rank]
+            estimate = max(
+                self.requests.backlog_time(1 + len(ahead)),
+                self.tokens.backlog_time(tokens + sum(entry[2] for entry in ahead))
+            )
+            if len(self._waiting) >= self.max_queue or estimate > max_wait_s:
+                self.shed += 1
+                if cut_by_request and len(self._waiting) < self.max_queue:
+                    raise DeadlineExceeded(f"{self.name} admission would outlast the request deadline")
+                raise AdmissionRejected(self.name, max(estimate, 1.0))
+
+            entry = (rank, next(self._seq), tokens)
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = self._time_until(tokens)
+                    if self._waiting[0] is entry and wait == 0:
+                        break
+
+                    remaining = started + max_wait_s - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        if cut_by_request:
+                            raise DeadlineExceeded(f"{self.name} admission outlasted the request deadline")
+                        raise AdmissionRejected(self.name, max(wait, 1.0))
+                    self._cond.wait(timeout=min(remaining, wait) if wait else remaining)
+
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.queue_wait_total += waited
+        return waited
+
+    def try_acquire(self, tokens: float = 0) -> bool:
+        """
+        Admit a request only if it can be sent right away.
+
+        For speculative duplicates such as hedges, which are not worth
+        queueing for, nor worth holding up callers already waiting.
+
+        Args:
+            tokens: Estimated tokens the request will use
+
+        Returns:
+            Whether the request was admitted (and charged)
+        """
+        with self._cond:
+            if self._waiting or self._time_until(tokens) > 0:
+                return False
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.admitted += 1
+        return True
+
+    def settle(self, estimated: float, actual: float):
+        """Correct the token bucket once the real usage is known"""
+        with self._cond:
+            self.tokens.adjust(estimated - actual)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        return {
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queued": len(self._waiting),
+            "mean_queue_wait_ms": round(1000 * self.queue_wait_total / self.admitted, 1) if self.admitted else 0.0
+        }
+
+
+_schedulers: Dict[str, UpstreamScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> UpstreamScheduler:
+    """
+    Shared scheduler for an upstream, configured from Settings.
+
+    Args:
+        name: "huggingface" or "groq"
+    """
+    with _schedulers_lock:
+        if name not in _schedulers:
+            settings = get_settings()
+            limits = {
+                "huggingface": (settings.HF_REQUESTS_PER_MINUTE, settings.HF_TOKENS_PER_MINUTE),
+                "groq": (settings.GROQ_REQUESTS_PER_MINUTE, settings.GROQ_TOKENS_PER_MINUTE)
+            }
+            rpm, tpm = limits[name]
+            _schedulers[name] = UpstreamScheduler(
+                name,
+                requests_per_minute=rpm,
+                tokens_per_minute=tpm,
+                max_queue=settings.SCHEDULER_MAX_QUEUE,
+                max_wait_s=settings.SCHEDULER_MAX_WAIT_S,
+                # Speculative work is dropped rather than queued
+                max_wait_by_priority={"prefetch": settings.PREFETCH_MAX_WAIT_S}
+            )
+        return _schedulers[name]
+
+
+def scheduler_stats() -> Dict[str, Dict]:
+    """Stats for every scheduler created so far"""
+    return {name: scheduler.stats() for name, scheduler in _schedulers.items()}
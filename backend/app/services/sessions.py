@@ -0,0 +1,214 @@
+"""
+Conversation sessions for multi-turn chat
+
+Each session keeps a compact server-side state: the last few questions
+(and a short answer preview), their query embeddings, and the pool of
+chunks already retrieved. Questions close to the previous one are
+follow-ups, answered from that pool and extended with a search only when
+the pool does not cover them; other questions start a new topic and are
+answered like stateless ones.
+
+Sessions expire after a TTL and are evicted least-recently-used once the
+store exceeds its memory budget.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.services.quantization import normalize
+
+
+class Session:
+    """State for one conversation"""
+
+    def __init__(self, session_id: str, max_turns: int = 6, pool_size: int = 30):
+        """
+        Args:
+            session_id: Client-visible identifier
+            max_turns: Questions remembered for context
+            pool_size: Maximum chunks kept in the candidate pool
+        """
+        self.session_id = session_id
+        self.turns: deque = deque(maxlen=max_turns)  # (query, answer preview)
+        self.query_embeddings: deque = deque(maxlen=max_turns)
+        self.pool: "OrderedDict[str, object]" = OrderedDict()  # chunk_id -> RetrievalResult
+        self.pool_size = pool_size
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # Size last counted in the store's total (see SessionStore.enforce_budget)
+        self.accounted_bytes = 0
+
+    def context_vector(self, query_embedding: np.ndarray, weight: float) -> np.ndarray:
+        """
+        Blend the new question with the previous one so that elliptical
+        follow-ups ("and what about PPOs?") keep their topic.
+        """
+        if not self.query_embeddings or weight <= 0:
+            return query_embedding
+        return normalize(query_embedding + weight * self.query_embeddings[-1])
+
+    def refers_back(self, query_embedding: np.ndarray, min_similarity: float) -> bool:
+        """
+        Whether a question continues the previous one rather than starting
+        a new topic (cosine similarity of the normalized query embeddings).
+        """
+        if not self.query_embeddings:
+            return False
+        return float(self.query_embeddings[-1] @ query_embedding) >= min_similarity
+
+    def extend_pool(self, results: List):
+        """Add chunks to the pool, most recently used last"""
+        for result in results:
+            self.pool[result.chunk_id] = result
+            self.pool.move_to_end(result.chunk_id)
+        while len(self.pool) > self.pool_size:
+            self.pool.popitem(last=False)
+
+    def record(self, query: str, query_embedding: np.ndarray, answer: Optional[str], results: List):
+        """Remember a completed turn"""
+        self.turns.append((query, (answer or "")[:200]))
+        self.query_embeddings.append(np.asarray(query_embedding, dtype=np.float32))
+        self.extend_pool(results)
+        self.last_used = time.monotonic()
+
+    def history(self) -> List[str]:
+        """Earlier questions, oldest first"""
+        return [query for query, _ in self.turns]
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by this session (bounded by max_turns and pool_size)"""
+        size = sum(len(q) + len(a) for q, a in self.turns)
+        size += sum(e.nbytes for e in self.query_embeddings)
+        for result in self.pool.values():
+            size += len(result.text)
+            if result.sentence_embeddings is not None:
+                size += result.sentence_embeddings.nbytes
+        return size
+
+
+class SessionStore:
+    """In-memory session registry with TTL expiry and a memory cap"""
+
+    def __init__(
+        self,
+        ttl_s: float = 1800.0,
+        memory_budget_bytes: int = 64 * 1024 * 1024,
+        max_turns: int = 6,
+        pool_size: int = 30
+    ):
+        """
+        Args:
+            ttl_s: Idle time after which a session expires
+            memory_budget_bytes: LRU sessions are evicted above this total
+            max_turns: Turns remembered per session
+            pool_size: Chunks kept per session
+        """
+        self.ttl_s = ttl_s
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_turns = max_turns
+        self.pool_size = pool_size
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Sum of accounted_bytes over live sessions, kept as sessions change
+        self._total_bytes = 0
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.pool_reuses = 0  # Follow-ups answered from the pool alone
+        self.pool_searches = 0  # Follow-ups that needed a vector search
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """
+        Return a live session, creating it if it is unknown or expired.
+
+        Args:
+            session_id: Client-supplied id; a new one is generated if omitted
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, self.max_turns, self.pool_size)
+                self._sessions[session.session_id] = session
+                self.created += 1
+            self._sessions.move_to_end(session.session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def enforce_budget(self, changed: Optional[Session] = None):
+        """
+        Evict least-recently-used sessions until the store fits its budget.
+
+        Args:
+            changed: Session that just recorded a turn; only its size is
+                recounted, the store keeps a running total of the others
+        """
+        with self._lock:
+            if changed is not None and self._sessions.get(changed.session_id) is changed:
+                size = changed.size_bytes()
+                self._total_bytes += size - changed.accounted_bytes
+                changed.accounted_bytes = size
+            while self._total_bytes > self.memory_budget_bytes and len(self._sessions) > 1:
+                _, session = self._sessions.popitem(last=False)
+                self._total_bytes -= session.accounted_bytes
+                self.evicted += 1
+
+    def count_follow_up(self, reused_pool: bool):
+        """Count a follow-up answered from the pool alone or after a search"""
+        with self._lock:
+            if reused_pool:
+                self.pool_reuses += 1
+            else:
+                self.pool_searches += 1
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by all live sessions"""
+        return self._total_bytes
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_s
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._total_bytes -= session.accounted_bytes
+            self.expired += 1
+
+    def stats(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "pool_reuses": self.pool_reuses,
+                "pool_searches": self.pool_searches,
+                "memory_bytes": self._total_bytes
+            }
+
+
+def score_pool(pool: List, vector: np.ndarray) -> List[Tuple[float, object]]:
+    """
+    Score pooled chunks against a query vector without a vector search.
+
+    A chunk scores as its best-matching sentence, mapped to [0, 1] like
+    Atlas cosine scores. Chunks without sentence embeddings are skipped.
+
+    Returns:
+        (score, result) pairs, best first
+    """
+    scored = []
+    for result in pool:
+        if result.sentence_embeddings is None or not len(result.sentence_embeddings):
+            continue
+        best = float((result.sentence_embeddings @ vector).max())
+        scored.append(((1.0 + best) / 2.0, result))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return scored
@@ -0,0 +1,289 @@
+"""
+Sharded vector search with parallel fan-out
+
+The corpus can be split across several vector stores: one collection
+per academic year or document family, or collections on separate
+MongoDB clusters. ShardedVectorStore offers the VectorStore interface
+RetrievalService uses, and for each search it:
+    1. sends the query to every shard concurrently
+    2. waits for each shard until its own deadline (SHARD_TIMEOUT_MS
+       unless the shard sets "timeout_ms", and never past the request's
+       deadline); late or failing shards are left out and the results are
+       marked partial, so they are not cached
+    3. applies each shard's configured score adjustment and merges the
+       global top-k with a heap
+
+Shards are configured with VECTOR_SHARDS (JSON), e.g.
+    [{"name": "2024", "collection": "documents_2024"},
+     {"name": "archive", "collection": "documents", "mongodb_uri": "mongodb+srv://...", "timeout_ms": 2000}]
+"""
+
+import hashlib
+import heapq
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.centroids import CentroidIndex
+from app.services.deadlines import remaining_s
+from app.services.tracing import annotate
+from app.services.vector_store import VectorStore, shared_client
+
+
+class ShardResults(list):
+    """Search results that may be missing the shards listed in `missing`"""
+
+    def __init__(self, results=(), missing: Optional[List[str]] = None):
+        super().__init__(results)
+        self.missing = missing or []
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing)
+
+
+def is_partial(results) -> bool:
+    """Whether results came from an incomplete fan-out (and should not be cached)"""
+    return getattr(results, "partial", False)
+
+
+class Shard:
+    """One vector store and how to put its scores on the common scale"""
+
+    def __init__(
+        self,
+        name: str,
+        store: VectorStore,
+        timeout_ms: float = 1000.0,
+        score_scale: float = 1.0,
+        score_offset: float = 0.0
+    ):
+        """
+        Args:
+            name: Shard name used in logs and metrics
+            store: Vector store of the shard
+            timeout_ms: Deadline for this shard's part of a request
+            score_scale: Multiplier for this shard's scores
+            score_offset: Added after scaling (for shards embedded or indexed differently)
+        """
+        self.name = name
+        self.store = store
+        self.timeout_s = timeout_ms / 1000.0
+        self.score_scale = score_scale
+        self.score_offset = score_offset
+        self.requests = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def calibrate(self, score: float) -> float:
+        """
+        Map a shard score to the common scale.
+
+        Every store already reports cosine similarity as (1 + cos) / 2
+        (Atlas vectorSearchScore, and rescored quantized results alike),
+        so only the configured adjustment is applied.
+        """
+        return score * self.score_scale + self.score_offset
+
+
+class ShardedVectorStore:
+    """VectorStore-compatible front for several shards searched in parallel"""
+
+    def __init__(self, shards: List[Shard], max_workers: Optional[int] = None):
+        """
+        Args:
+            shards: Shards to fan out to (at least one)
+            max_workers: Fan-out threads (4 per shard if omitted)
+        """
+        if not shards:
+            raise ValueError("ShardedVectorStore needs at least one shard")
+        self.shards = shards
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or 4 * len(shards), thread_name_prefix="vector-shard"
+        )
+        self._lock = threading.Lock()
+        # Which shard holds each group, from the last load_centroids()
+        self._group_shards: Dict[str, str] = {}
+
+    @classmethod
+    def from_specs(cls, specs: List[Dict]) -> "ShardedVectorStore":
+        """Build shards from VECTOR_SHARDS-style specs, sharing one client per URI"""
+        settings = get_settings()
+        shards = []
+        for spec in specs:
+            uri = spec.get("mongodb_uri", settings.MONGODB_URI)
+            store = VectorStore(
+                mongodb_uri=uri,
+                db_name=spec.get("db_name", settings.MONGODB_DB_NAME),
+                collection_name=spec["collection"],
+                storage=spec.get("storage", settings.EMBEDDING_STORAGE),
+                rescore_factor=settings.RESCORE_FACTOR,
+                client=shared_client(uri)
+            )
+            shards.append(Shard(
+                spec.get("name", spec["collection"]),
+                store,
+                timeout_ms=spec.get("timeout_ms", settings.SHARD_TIMEOUT_MS),
+                score_scale=spec.get("score_scale", 1.0),
+                score_offset=spec.get("score_offset", 0.0)
+            ))
+        return cls(shards)
+
+    @property
+    def storage(self) -> str:
+        return "+".join(sorted({shard.store.storage for shard in self.shards}))
+
+    @property
+    def physical_name(self) -> str:
+        return "+".join(shard.store.physical_name for shard in self.shards)
+
+    def _fan_out(self, shards: List[Shard], call) -> Dict[str, object]:
+        """
+        Run call(shard) on every shard, each until its own deadline.
+
+        Returns:
+            Results by shard name; shards that timed out or failed are absent
+        """
+        started = time.monotonic()
+        # No shard is waited for past the request's own deadline
+        budget = remaining_s()
+        with self._lock:
+            for shard in shards:
+                shard.requests += 1
+        futures = {self._executor.submit(call, shard): shard for shard in shards}
+        timeouts = {future: min(shard.timeout_s, budget) for future, shard in futures.items()}
+
+        answered = {}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            expired = {f for f in pending if started + timeouts[f] <= now}
+            with self._lock:
+                for future in expired:
+                    # Left running; its result is discarded when it arrives
+                    futures[future].timeouts += 1
+            pending -= expired
+            if not pending:
+                break
+
+            next_deadline = min(started + timeouts[f] for f in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = futures[future]
+                if future.exception() is None:
+                    answered[shard.name] = future.result()
+                else:
+                    with self._lock:
+                        shard.errors += 1
+                    print(f"⚠ Shard {shard.name} failed: {future.exception()}")
+        return answered
+
+    def search_similar(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 3,
+        include_sentences: bool = False,
+        group_ids: Optional[List[str]] = None,
+        candidates_factor: int = 10
+    ) -> ShardResults:
+        """
+        Search every shard concurrently and merge the global top_k.
+
+        Args:
+            query_embedding: Normalized query vector
+            top_k: Number of results
+            include_sentences: Also return precomputed per-sentence embeddings
+            group_ids: Coarse-stage groups; shards holding none of them are skipped
+            candidates_factor: ANN candidates per result, passed to every shard
+
+        Returns:
+            Results best first, each tagged with its "shard"; `missing`
+            lists the shards that did not answer in time
+
+        Raises:
+            TimeoutError: If no shard answered
+        """
+        shards = self.shards
+        if group_ids is not None:
+            wanted = {self._group_shards.get(group_id) for group_id in group_ids}
+            shards = [shard for shard in shards if shard.name in wanted]
+
+        def search(shard: Shard) -> List[Dict]:
+            return shard.store.search_similar(
+                query_embedding, top_k=top_k, include_sentences=include_sentences,
+                group_ids=group_ids, candidates_factor=candidates_factor
+            )
+
+        started = time.perf_counter()
+        answered = self._fan_out(shards, search)
+        missing = [shard.name for shard in shards if shard.name not in answered]
+        annotate(
+            shards_queried=len(shards),
+            shards_missing=missing,
+            shard_fan_out_ms=round((time.perf_counter() - started) * 1000.0, 2)
+        )
+        if shards and not answered:
+            raise TimeoutError(f"No vector shard answered in time ({', '.join(missing)})")
+
+        # Calibrate, then keep the best copy of each chunk (a chunk may live in two shards)
+        by_name = {shard.name: shard for shard in shards}
+        best: Dict[str, Dict] = {}
+        for name, results in answered.items():
+            for result in results:
+                result = {**result, "score": by_name[name].calibrate(result["score"]), "shard": name}
+                key = result.get("chunk_id") or id(result)
+                if key not in best or result["score"] > best[key]["score"]:
+                    best[key] = result
+
+        return ShardResults(heapq.nlargest(top_k, best.values(), key=lambda r: r["score"]), missing=missing)
+
+    def get_parents(self, parent_ids: List[str], include_sentences: bool = False) -> Dict[str, Dict]:
+        """Parent clauses from whichever shards hold them (same deadlines as searches)"""
+        if not parent_ids:
+            return {}
+        answered = self._fan_out(
+            self.shards, lambda shard: shard.store.get_parents(parent_ids, include_sentences=include_sentences)
+        )
+        parents: Dict[str, Dict] = {}
+        for found in answered.values():
+            parents.update(found)
+        return parents
+
+    def load_centroids(self) -> CentroidIndex:
+        """
+        Centroids of all shards combined.
+
+        Empty unless every shard has centroids for all its chunks: a coarse
+        stage over some shards only would never search the others.
+        """
+        groups, group_shards = [], {}
+        for shard in self.shards:
+            shard_groups = shard.store.load_groups()
+            if not shard_groups:
+                self._group_shards = {}
+                return CentroidIndex([])
+            groups.extend(shard_groups)
+            group_shards.update({g["group_id"]: shard.name for g in shard_groups})
+        self._group_shards = group_shards
+        return CentroidIndex(groups)
+
+    def corpus_version(self) -> str:
+        """Changes whenever any shard's corpus version changes"""
+        versions = [f"{shard.name}={shard.store.corpus_version()}" for shard in self.shards]
+        return hashlib.md5("|".join(versions).encode()).hexdigest()
+
+    def close(self):
+        """Stop the fan-out threads (searches in flight still finish)"""
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Requests, timeouts and errors per shard"""
+        with self._lock:
+            return {
+                shard.name: {"requests": shard.requests, "timeouts": shard.timeouts, "errors": shard.errors}
+                for shard in self.shards
+            }
@@ -0,0 +1,68 @@
+"""
+Single-flight request coalescing
+
+Concurrent callers asking for the same key share one in-flight
+computation instead of each hitting the upstream services.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict
+
+from app.services.deadlines import within_deadline
+from app.services.tracing import annotate
+
+
+class SingleFlight:
+    """De-duplicates concurrent calls that share a key"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a function once per key among concurrent callers.
+
+        The computation runs as its own task (blocking functions in a
+        worker thread), so a caller that is cancelled (e.g. client
+        disconnect) does not cancel it for the others waiting on it. It
+        runs under the first caller's request deadline; later callers
+        wait no longer than their own.
+
+        Args:
+            key: Normalized key identifying identical requests
+            func: Blocking function or coroutine function to run
+            *args, **kwargs: Arguments for func
+
+        Returns:
+            The shared result of func (exceptions are shared too)
+
+        Raises:
+            DeadlineExceeded: If a later caller's deadline passes while waiting
+        """
+        task = self._in_flight.get(key)
+
+        if task is None:
+            self.calls += 1
+            if asyncio.iscoroutinefunction(func):
+                task = asyncio.ensure_future(func(*args, **kwargs))
+            else:
+                task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            # Stages run in the leader's request; this trace only waits
+            annotate(coalesced=True)
+            return await within_deadline(asyncio.shield(task))
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for the metrics endpoint"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
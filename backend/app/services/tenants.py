@@ -0,0 +1,255 @@
+"""
+Multi-tenant serving
+
+Each tenant (institute) has its own collection or shards and system
+prompt (TenantConfig in Settings). Its services (retrieval with the
+centroid index, sessions, coalescing, a cache namespace) are built
+the first time a request names it, and kept in an LRU:
+when the resident tenants' in-memory state exceeds
+TENANT_MEMORY_BUDGET_MB, the least recently used ones are unloaded
+and rebuilt on their next request. Requests lease the pipeline they
+use, and an unloaded pipeline is closed only once its last lease is
+released.
+
+The clients that do not depend on the tenant (embedding model, Groq,
+the query micro-batcher, MongoDB connection pools) are shared.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.config import TenantConfig, get_settings
+from app.services.batching import MicroBatcher
+from app.services.embeddings import EmbeddingService
+from app.services.llm import LLMService
+from app.services.rag_pipeline import RAGPipeline
+from app.services.retrieval import RetrievalService
+
+
+class UnknownTenantError(KeyError):
+    """The request names a tenant that is not configured"""
+
+
+class TenantRegistry:
+    """Lazily built per-tenant pipelines, evicted LRU under a memory budget"""
+
+    def __init__(self, tenants: Dict[str, TenantConfig], default_tenant: str, memory_budget_bytes: int):
+        """
+        Args:
+            tenants: Configured tenants by id
+            default_tenant: Tenant of requests that do not name one
+            memory_budget_bytes: Combined in-memory state of resident tenants
+        """
+        self.tenants = tenants
+        self.default_tenant = default_tenant
+        self.memory_budget_bytes = memory_budget_bytes
+
+        self._resident: "OrderedDict[str, RAGPipeline]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One build lock per tenant: a slow build does not block other tenants
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._shared = None
+        # Leases per pipeline in use; unloaded pipelines wait in _retired for their last release
+        self._leases: Dict[RAGPipeline, int] = {}
+        self._retired = set()
+
+        self.loads = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls) -> "TenantRegistry":
+        settings = get_settings()
+        return cls(
+            settings.tenants(),
+            default_tenant=settings.DEFAULT_TENANT,
+            memory_budget_bytes=int(settings.TENANT_MEMORY_BUDGET_MB * 1024 * 1024)
+        )
+
+    def resolve(self, tenant_id: Optional[str]) -> TenantConfig:
+        """
+        Raises:
+            UnknownTenantError: If tenant_id is not configured
+        """
+        tenant_id = tenant_id or self.default_tenant
+        if tenant_id not in self.tenants:
+            raise UnknownTenantError(tenant_id)
+        return self.tenants[tenant_id]
+
+    def pipeline(self, tenant_id: Optional[str] = None) -> RAGPipeline:
+        """
+        The tenant's pipeline, built on first use.
+
+        The pipeline may be unloaded and closed at any time afterwards;
+        code using it across awaits or in the background should lease it
+        (acquire()/release() or lease()) instead.
+
+        Args:
+            tenant_id: Tenant named by the request (the default tenant if None)
+
+        Raises:
+            UnknownTenantError: If tenant_id is not configured
+        """
+        return self._get(tenant_id, lease=False, build=True)
+
+    def acquire(self, tenant_id: Optional[str] = None, build: bool = True) -> Optional[RAGPipeline]:
+        """
+        Lease the tenant's pipeline; it is not closed before release().
+
+        Args:
+            tenant_id: Tenant named by the request (the default tenant if None)
+            build: Build the pipeline if the tenant is not resident; if False
+                None is returned instead
+
+        Raises:
+            UnknownTenantError: If tenant_id is not configured
+        """
+        return self._get(tenant_id, lease=True, build=build)
+
+    def release(self, pipeline: RAGPipeline):
+        """End a lease; the last one closes a pipeline that was unloaded meanwhile"""
+        with self._lock:
+            self._leases[pipeline] -= 1
+            if self._leases[pipeline] > 0:
+                return
+            del self._leases[pipeline]
+            if pipeline not in self._retired:
+                return
+            self._retired.discard(pipeline)
+        pipeline.close()
+
+    @contextmanager
+    def lease(self, tenant_id: Optional[str] = None):
+        """
+        Use the tenant's pipeline for the enclosed block.
+
+        Example:
+            with registry.lease(tenant_id) as pipeline:
+                response = pipeline.answer(query)
+        """
+        pipeline = self.acquire(tenant_id)
+        try:
+            yield pipeline
+        finally:
+            self.release(pipeline)
+
+    def _get(self, tenant_id: Optional[str], lease: bool, build: bool) -> Optional[RAGPipeline]:
+        tenant = self.resolve(tenant_id)
+        with self._lock:
+            pipeline = self._resident.get(tenant.tenant_id)
+            if pipeline is not None:
+                self._resident.move_to_end(tenant.tenant_id)
+                if lease:
+                    self._leases[pipeline] = self._leases.get(pipeline, 0) + 1
+            build_lock = self._build_locks.setdefault(tenant.tenant_id, threading.Lock())
+
+        if pipeline is None:
+            if not build:
+                return None
+            with build_lock:
+                with self._lock:
+                    pipeline = self._resident.get(tenant.tenant_id)
+                    if pipeline is not None and lease:
+                        self._leases[pipeline] = self._leases.get(pipeline, 0) + 1
+                if pipeline is None:
+                    pipeline = self._build(tenant)
+                    with self._lock:
+                        self._resident[tenant.tenant_id] = pipeline
+                        self.loads += 1
+                        if lease:
+                            self._leases[pipeline] = 1
+
+        self.enforce_budget(keep=tenant.tenant_id)
+        return pipeline
+
+    def _build(self, tenant: TenantConfig) -> RAGPipeline:
+        embedding_service, query_batcher, llm_service = self._shared_services()
+        retrieval_service = RetrievalService(
+            tenant,
+            embedding_service=embedding_service,
+            query_batcher=query_batcher
+        )
+        return RAGPipeline(retrieval_service, llm_service=llm_service)
+
+    def _shared_services(self):
+        """Embedding service, query micro-batcher and LLM client shared by all tenants"""
+        with self._lock:
+            if self._shared is None:
+                settings = get_settings()
+                embedding_service = EmbeddingService(
+                    model_name=settings.EMBEDDING_MODEL,
+                    api_key=settings.HUGGINGFACE_API_KEY
+                )
+                query_batcher = MicroBatcher(
+                    embedding_service.generate_embeddings,
+                    max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+                    max_wait_ms=settings.EMBED_BATCH_MAX_WAIT_MS
+                )
+                llm_service = LLMService(model_name=settings.LLM_MODEL, api_key=settings.GROQ_API_KEY)
+                self._shared = (embedding_service, query_batcher, llm_service)
+            return self._shared
+
+    def enforce_budget(self, keep: Optional[str] = None):
+        """
+        Unload least recently used tenants until the resident ones fit the budget.
+
+        Runs on every request, so it only reads each resident tenant's
+        running byte counters (centroids, session total), never walks sessions.
+
+        Args:
+            keep: Tenant that stays resident regardless (the one being served)
+        """
+        with self._lock:
+            sizes = {tenant_id: pipeline.memory_bytes() for tenant_id, pipeline in self._resident.items()}
+            total = sum(sizes.values())
+            evicted = []
+            for tenant_id in list(self._resident):
+                if total <= self.memory_budget_bytes:
+                    break
+                if tenant_id == keep:
+                    continue
+                pipeline = self._resident.pop(tenant_id)
+                total -= sizes[tenant_id]
+                self.evictions += 1
+                if self._leases.get(pipeline):
+                    # Requests still holding it finish with it; the last release closes it
+                    self._retired.add(pipeline)
+                else:
+                    evicted.append(pipeline)
+
+        for pipeline in evicted:
+            pipeline.close()
+
+    def is_resident(self, tenant_id: Optional[str]) -> bool:
+        with self._lock:
+            return (tenant_id or self.default_tenant) in self._resident
+
+    def resident(self) -> Dict[str, RAGPipeline]:
+        """Resident pipelines, least recently used first"""
+        with self._lock:
+            return dict(self._resident)
+
+    def stats(self) -> Dict:
+        """Residency and memory for the metrics endpoint"""
+        resident = self.resident()
+        return {
+            "configured": len(self.tenants),
+            "resident": {tenant_id: pipeline.memory_bytes() for tenant_id, pipeline in resident.items()},
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
+
+
+_registry: Optional[TenantRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_tenant_registry() -> TenantRegistry:
+    """Process-wide tenant registry configured from Settings"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TenantRegistry.from_settings()
+        return _registry
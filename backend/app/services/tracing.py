@@ -0,0 +1,191 @@
+"""
+Per-request retrieval traces and the slow-query log
+
+Each API request gets a RequestTrace in a context variable (so it follows
+the request into asyncio.to_thread workers). Services add stage timings
+and facts to it via stage() and annotate(); both are no-ops outside a
+traced request.
+
+Requests slower than SLOW_QUERY_THRESHOLD_MS write their trace as one
+JSON line. The logger hands records to a QueueHandler, so the request
+never waits on disk; a QueueListener thread writes them to a rotating
+file.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+
+class RequestTrace:
+    """Timings and retrieval facts for one request"""
+
+    def __init__(self, route: str, query: str):
+        self.trace_id = uuid.uuid4().hex
+        self.route = route
+        self.query = query
+        self.started = time.time()
+        self.stages: Dict[str, float] = {}  # stage -> milliseconds (summed if repeated)
+        self.cache: Dict[str, str] = {}  # cache kind -> "hit" / "miss"
+        self.fields: Dict[str, Any] = {}
+        self.duration_ms = 0.0
+        self.error: Optional[str] = None
+
+    def add_stage(self, name: str, elapsed_ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started)) + "Z",
+            "route": self.route,
+            "query": self.query,
+            "duration_ms": round(self.duration_ms, 2),
+            "stages_ms": {name: round(ms, 2) for name, ms in self.stages.items()},
+            "cache": self.cache,
+            **self.fields,
+            "error": self.error
+        }
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Trace of the current request, if it is traced"""
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the enclosed block as a stage of the current request.
+
+    Example:
+        with stage("vector_search"):
+            results = collection.aggregate(pipeline)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, (time.perf_counter() - started) * 1000.0)
+
+
+def annotate(**fields):
+    """Attach facts (candidates, token counts, ...) to the current request's trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+def record_cache(kind: str, hit: bool):
+    """
+    Record a cache outcome ("embedding", "retrieval", "answer", ...) for the current request.
+
+    The first lookup of a kind is kept: a later lookup of the value the
+    request itself just stored would always report a hit.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache.setdefault(kind, "hit" if hit else "miss")
+
+
+class SlowQueryLog:
+    """Writes traces above a latency threshold as JSON lines, off the request path"""
+
+    def __init__(self, path: str, threshold_ms: float, max_bytes: int = 10_000_000, backups: int = 5):
+        """
+        Args:
+            path: Log file; rotated at max_bytes
+            threshold_ms: Requests at least this slow are logged (0 logs every request)
+            max_bytes: Size at which the file is rotated
+            backups: Rotated files kept
+        """
+        self.threshold_ms = threshold_ms
+        self.logged = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self._queue, file_handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+        self.logger = logging.getLogger("rag.slow_queries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(logging.handlers.QueueHandler(self._queue))
+
+    def submit(self, trace: RequestTrace):
+        """Log the trace if it crossed the threshold (never blocks on I/O)"""
+        if trace.duration_ms >= self.threshold_ms:
+            self.logged += 1
+            self.logger.info(json.dumps(trace.to_dict(), default=str))
+
+
+_slow_log: Optional[SlowQueryLog] = None
+_slow_log_lock = threading.Lock()
+
+
+def get_slow_query_log() -> Optional[SlowQueryLog]:
+    """Process-wide slow-query log, or None when it is disabled"""
+    global _slow_log
+    settings = get_settings()
+    if not settings.SLOW_QUERY_LOG_ENABLED:
+        return None
+    with _slow_log_lock:
+        if _slow_log is None:
+            _slow_log = SlowQueryLog(
+                settings.SLOW_QUERY_LOG_PATH,
+                threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+                max_bytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                backups=settings.SLOW_QUERY_LOG_BACKUPS
+            )
+        return _slow_log
+
+
+@contextmanager
+def request_trace(route: str, query: str):
+    """
+    Trace a request and submit it to the slow-query log when it ends.
+
+    Example:
+        with request_trace("/api/chat", request.query) as trace:
+            ...
+    """
+    trace = RequestTrace(route, query)
+    token = _current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.duration_ms = (time.perf_counter() - started) * 1000.0
+        _current_trace.reset(token)
+        slow_log = get_slow_query_log()
+        if slow_log is not None:
+            slow_log.submit(trace)
@@ -1,61 +1,599 @@
-from pymongo import MongoClient
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
+from datetime import datetime, timezone
 import numpy as np
+import threading
+import time
+import uuid
+
+from app.services.quantization import (
+    RESCORED_FORMATS, validate_storage, normalize, encode_vector, rescore
+)
+from app.services.centroids import CentroidIndex
+from app.services.tracing import annotate
+
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+
+
+_clients: Dict[str, "MongoClient"] = {}
+_clients_lock = threading.Lock()
+
+
+# Collections stored next to each versioned chunk collection
+SIDE_COLLECTIONS = ("_parents", "_groups", "_vectors")
+
+
+def shared_client(mongodb_uri: str) -> "MongoClient":
+    """One MongoClient (and connection pool) per URI for the whole process"""
+    with _clients_lock:
+        if mongodb_uri not in _clients:
+            from pymongo import MongoClient
+            _clients[mongodb_uri] = MongoClient(mongodb_uri)
+        return _clients[mongodb_uri]
 
 class VectorStore:
-    def __init__(self, mongodb_uri: str, db_name: str, collection_name: str):
-        self.client = MongoClient(mongodb_uri)
+    def __init__(
+        self,
+        mongodb_uri: str,
+        db_name: str,
+        collection_name: str,
+        storage: str = "float",
+        rescore_factor: int = 4,
+        client: Optional["MongoClient"] = None,
+        physical_name: Optional[str] = None
+    ):
+        """
+        Args:
+            mongodb_uri: MongoDB connection string
+            db_name: Database name
+            collection_name: Logical collection name (base of the versioned collections)
+            storage: Embedding storage format ("float", "float32", "int8", "binary")
+            rescore_factor: Candidates fetched per result when rescoring quantized vectors
+            client: Existing client to share (used for shadow builds)
+            physical_name: Pin a specific versioned collection instead of the active one
+        """
+        if client is None:
+            # pymongo is imported on first use so importing the app stays cheap
+            from pymongo import MongoClient
+            client = MongoClient(mongodb_uri)
+        self.client = client
         self.db = self.client[db_name]
-        self.collection = self.db[collection_name]
-    
+        self.base_name = collection_name
+        # Small side collection for bookkeeping such as the corpus version
+        # and the active-collection pointer
+        self.meta = self.db[f"{collection_name}_meta"]
+        self.storage = validate_storage(storage)
+        self.rescore_factor = max(1, rescore_factor)
+        
+        # A shadow store writes to a version that is not live yet, so it
+        # leaves the corpus version (and every cache keyed on it) alone
+        self.is_shadow = physical_name is not None
+        self._bind(physical_name or self._active_name(self._pointer()))
+
+    def _bind(self, physical_name: str):
+        """Point this store at one physical collection (and its parents)"""
+        self.physical_name = physical_name
+        self.collection = self.db[physical_name]
+        # Parent clauses of structure-aware chunks, stored once and looked up by parent_id
+        self.parents = self.db[f"{physical_name}_parents"]
+        # Page/section and document centroids for coarse-to-fine search
+        self.groups = self.db[f"{physical_name}_groups"]
+        # Full-precision copies of quantized embeddings, keyed by chunk_id and
+        # read only to rescore candidates, so chunk documents stay compact
+        self.full_vectors = self.db[f"{physical_name}_vectors"]
+        # Cleared when the vector index rejects the group_id filter
+        # (an index created before group_id was declared as a filter field)
+        self.group_filter = True
+
+    def _pointer(self) -> Optional[Dict]:
+        return self.meta.find_one({"_id": "active"})
+
+    def _active_name(self, pointer: Optional[Dict]) -> str:
+        """Physical collection an active pointer names (the unversioned base if there is none)"""
+        return pointer["collection"] if pointer else self.base_name
+
+    @property
+    def rescores(self) -> bool:
+        """Whether searches run on quantized vectors and need rescoring"""
+        return self.storage in RESCORED_FORMATS
+
+    def vector_index_definition(self, embedding_dimension: int) -> Dict:
+        """Atlas Vector Search index definition (packed bit vectors only support euclidean)"""
+        return {
+            "fields": [
+                {
+                    "type": "vector",
+                    "path": "embedding",
+                    "numDimensions": embedding_dimension,
+                    "similarity": "euclidean" if self.storage == "binary" else "cosine"
+                },
+                # Restricts the fine search to the groups picked by the coarse stage
+                {
+                    "type": "filter",
+                    "path": "group_id"
+                }
+            ]
+        }
+
     def create_vector_index(self, embedding_dimension: int):
         """Create Atlas Vector Search index (run once)"""
         # This needs to be done via Atlas UI or API
-        # Index definition for Atlas:
-        index_definition = {
-            "mappings": {
-                "dynamic": True,
-                "fields": {
-                    "embedding": {
-                        "type": "knnVector",
-                        "dimensions": embedding_dimension,
-                        "similarity": "cosine"
-                    }
-                }
-            }
-        }
         print("Create this index in MongoDB Atlas UI:")
-        print(index_definition)
-    
-    def insert_documents(self, documents: List[Dict]):
-        """Insert documents with embeddings"""
-        if documents:
-            self.collection.insert_many(documents)
-    
-    def search_similar(self, query_embedding: List[float], top_k: int = 3) -> List[Dict]:
-        """Vector similarity search using MongoDB Atlas"""
+        print(self.vector_index_definition(embedding_dimension))
+
+    def create_search_index(self, embedding_dimension: int, timeout_s: float = 600.0, poll_s: float = 5.0):
+        """
+        Create "vector_index" on this store's collection through the Atlas
+        API and wait until it is queryable.
+
+        Raises:
+            TimeoutError: If the index is not queryable within timeout_s
+        """
+        from pymongo.operations import SearchIndexModel
+        self.collection.create_search_index(SearchIndexModel(
+            definition=self.vector_index_definition(embedding_dimension),
+            name="vector_index",
+            type="vectorSearch"
+        ))
+
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            indexes = list(self.collection.list_search_indexes("vector_index"))
+            if indexes and indexes[0].get("queryable"):
+                return
+            time.sleep(poll_s)
+        raise TimeoutError(f"vector_index on {self.physical_name} not queryable after {timeout_s:.0f}s")
+
+    def insert_documents(
+        self,
+        documents: List[Dict],
+        embeddings: Optional[np.ndarray] = None,
+        bump_version: bool = True
+    ):
+        """
+        Insert documents with embeddings.
+
+        Embeddings are encoded according to the storage format. Quantized
+        formats also keep a float32 copy for rescoring, in the side
+        collection of full vectors (keyed by chunk_id, so re-ingesting a
+        chunk replaces its copy).
+
+        Args:
+            documents: Documents to insert
+            embeddings: Optional (n, dim) float32 array of L2-normalized
+                embeddings, one row per document. Rows are encoded straight
+                from the buffer; otherwise each document's own "embedding"
+                field is used.
+            bump_version: Change the corpus version; multi-batch writers pass
+                False and call touch_corpus_version() once they are done
+        """
+        if not documents:
+            return
+
+        if embeddings is not None:
+            documents = [
+                self._encode_document(doc, row)
+                for doc, row in zip(documents, embeddings)
+            ]
+        elif self.storage != "float":
+            documents = [
+                self._encode_document(doc, normalize(doc["embedding"]))
+                if "embedding" in doc else doc
+                for doc in documents
+            ]
+
+        if self.rescores:
+            documents = self._insert_full_vectors(documents)
+        self.collection.insert_many(documents)
+        if bump_version and not self.is_shadow:
+            self._bump_corpus_version()
+
+    def insert_parents(self, parents: List[Dict]):
+        """
+        Store parent clauses referenced by child chunks.
+
+        Parents are keyed by their content-derived parent_id, so
+        re-ingesting the same document replaces them instead of
+        duplicating them. Insert parents before their children; the
+        corpus version is bumped by insert_documents().
+        """
+        if not parents:
+            return
+        from pymongo import ReplaceOne
+        self.parents.create_index("parent_id", unique=True)
+        self.parents.bulk_write([
+            ReplaceOne({"parent_id": parent["parent_id"]}, parent, upsert=True)
+            for parent in parents
+        ])
+
+    def insert_groups(self, groups: List[Dict]):
+        """
+        Store the centroids computed by centroids.build_groups().
+
+        Groups are keyed by group_id (derived from source and page or
+        section), so re-ingesting a document replaces its centroids.
+        """
+        if not groups:
+            return
+        from pymongo import ReplaceOne
+        self.groups.create_index("group_id", unique=True)
+        self.groups.bulk_write([
+            ReplaceOne({"group_id": group["group_id"]}, group, upsert=True)
+            for group in groups
+        ])
+
+    def load_groups(self) -> List[Dict]:
+        """
+        Group documents of this collection version, for the coarse stage.
+
+        Empty unless every chunk belongs to a group: chunks ingested before
+        centroids existed have no group_id, and a group filter would
+        silently exclude them. Checked once per corpus version by callers.
+        """
+        if not self.group_filter:
+            return []
+        if self.collection.find_one({"group_id": None}, {"_id": 1}) is not None:
+            return []
+        return list(self.groups.find({}, {"_id": 0}))
+
+    def load_centroids(self) -> CentroidIndex:
+        """All centroids of this collection version (empty if the coarse stage cannot be used)"""
+        return CentroidIndex(self.load_groups())
+
+    def get_parents(self, parent_ids: List[str], include_sentences: bool = False) -> Dict[str, Dict]:
+        """
+        Fetch parent clauses by id in one round trip.
+
+        Args:
+            parent_ids: Ids referenced by retrieved children
+            include_sentences: Also return precomputed per-sentence embeddings
+
+        Returns:
+            Mapping of parent_id to parent document (missing ids are omitted)
+        """
+        if not parent_ids:
+            return {}
+        projection = {"_id": 0, "parent_id": 1, "text": 1, "metadata": 1}
+        if include_sentences:
+            projection["sentences"] = 1
+            projection["sentence_embeddings"] = 1
+        cursor = self.parents.find({"parent_id": {"$in": list(set(parent_ids))}}, projection)
+        return {parent["parent_id"]: parent for parent in cursor}
+
+    def _insert_full_vectors(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Move the float32 copies of quantized documents to the side collection.
+
+        Returns:
+            The documents without the copies that were moved (documents
+            without a chunk_id keep theirs inline)
+        """
+        full = [doc for doc in documents if "embedding_full" in doc and doc.get("chunk_id")]
+        if not full:
+            return documents
+        from pymongo import ReplaceOne
+        self.full_vectors.create_index("chunk_id", unique=True)
+        self.full_vectors.bulk_write([
+            ReplaceOne(
+                {"chunk_id": doc["chunk_id"]},
+                {"chunk_id": doc["chunk_id"], "embedding_full": doc["embedding_full"]},
+                upsert=True
+            )
+            for doc in full
+        ])
+        return [
+            {key: value for key, value in doc.items() if key != "embedding_full"}
+            if doc.get("chunk_id") else doc
+            for doc in documents
+        ]
+
+    def _encode_document(self, document: Dict, embedding: np.ndarray) -> Dict:
+        """Attach the stored representation of a normalized embedding"""
+        encoded = {**document, "embedding": encode_vector(embedding, self.storage)}
+        if self.rescores:
+            encoded["embedding_full"] = encode_vector(embedding, "float32")
+        return encoded
+
+    def search_similar(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 3,
+        include_sentences: bool = False,
+        group_ids: Optional[List[str]] = None,
+        candidates_factor: int = 10
+    ) -> List[Dict]:
+        """
+        Vector similarity search using MongoDB Atlas.
+
+        With quantized storage the search runs on the compact vectors and
+        the top `top_k * rescore_factor` candidates are rescored with
+        their full-precision copies before the final cut.
+
+        Args:
+            query_embedding: Normalized query vector
+            top_k: Number of results
+            include_sentences: Also return precomputed per-sentence embeddings
+            group_ids: Only search chunks of these groups (coarse-stage result)
+            candidates_factor: ANN candidates (numCandidates) per result;
+                lower is faster and less accurate
+        """
+        limit = top_k * self.rescore_factor if self.rescores else top_k
+
+        projection = {
+            "text": 1,
+            "chunk_id": 1,
+            "parent_id": 1,
+            "score": {"$meta": "vectorSearchScore"}
+        }
+        if self.rescores:
+            # Only documents ingested before the copies moved to the side
+            # collection (or without a chunk_id) still carry one
+            projection["embedding_full"] = 1
+        if include_sentences:
+            projection["sentences"] = 1
+            projection["sentence_embeddings"] = 1
+
+        vector_search = {
+            "index": "vector_index",  # Name of your Atlas index
+            "path": "embedding",
+            "queryVector": encode_vector(query_embedding, self.storage),
+            "numCandidates": limit * candidates_factor,
+            "limit": limit
+        }
+        if group_ids is not None and self.group_filter:
+            vector_search["filter"] = {"group_id": {"$in": group_ids}}
+
         pipeline = [
             {
-                "$vectorSearch": {
-                    "index": "vector_index",  # Name of your Atlas index
-                    "path": "embedding",
-                    "queryVector": query_embedding,
-                    "numCandidates": top_k * 10,
-                    "limit": top_k
-                }
+                "$vectorSearch": vector_search
             },
             {
-                "$project": {
-                    "text": 1,
-                    "chunk_id": 1,
-                    "score": {"$meta": "vectorSearchScore"}
-                }
+                "$project": projection
             }
         ]
-        
-        results = list(self.collection.aggregate(pipeline))
+
+        from pymongo.errors import OperationFailure
+        try:
+            results = list(self.collection.aggregate(pipeline))
+        except OperationFailure as e:
+            if "filter" not in vector_search:
+                raise
+            # The index does not declare group_id as a filter field; search
+            # flat from now on (re-create the index to get the coarse stage)
+            print(f"⚠ Vector index rejected the group filter, searching flat: {e}")
+            self.group_filter = False
+            del vector_search["filter"]
+            results = list(self.collection.aggregate(pipeline))
+            annotate(group_filter_rejected=True)
+        annotate(num_candidates=limit * candidates_factor, vector_search_limit=limit, vector_search_hits=len(results))
+
+        if self.rescores:
+            results = self._rescore(query_embedding, results, top_k)
+
         return results
-    
+
+    def _rescore(self, query_embedding: np.ndarray, results: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Re-rank quantized candidates by full-precision cosine similarity.
+
+        The float32 copies are fetched in one round trip. Candidates without
+        one (documents ingested before copies were kept apart, or without
+        any) keep their index score.
+        """
+        vectors = [result.pop("embedding_full", None) for result in results]
+        chunk_ids = [r["chunk_id"] for r, v in zip(results, vectors) if v is None and r.get("chunk_id")]
+        if chunk_ids:
+            stored = {
+                doc["chunk_id"]: doc["embedding_full"]
+                for doc in self.full_vectors.find({"chunk_id": {"$in": chunk_ids}}, {"_id": 0})
+            }
+            vectors = [v if v is not None else stored.get(r.get("chunk_id")) for r, v in zip(results, vectors)]
+
+        rescorable = [i for i, vector in enumerate(vectors) if vector is not None]
+        if rescorable:
+            scores = rescore(query_embedding, [vectors[i] for i in rescorable])
+            for i, score in zip(rescorable, scores):
+                results[i]["score"] = float(score)
+        annotate(rescored=len(rescorable), rescore_missing=len(results) - len(rescorable))
+
+        scores = np.array([r["score"] for r in results], dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [results[i] for i in order]
+
     def clear_collection(self):
-        """Clear all documents"""
-        self.collection.delete_many({})
\ No newline at end of file
+        """Clear all documents (prefer a blue/green rebuild for the live collection)"""
+        self.collection.delete_many({})
+        self.parents.delete_many({})
+        self.groups.delete_many({})
+        self.full_vectors.delete_many({})
+        if not self.is_shadow:
+            self._bump_corpus_version()
+
+    def touch_corpus_version(self):
+        """Change the corpus version after writes made with bump_version=False"""
+        if not self.is_shadow:
+            self._bump_corpus_version()
+
+    def delete_ingested(self, job_id: str) -> int:
+        """
+        Remove the chunks and centroids an ingestion job wrote (after it failed).
+
+        Parents and full-precision vectors are left: they are keyed by
+        content and unreferenced ones are never read.
+
+        Returns:
+            Chunks deleted
+        """
+        deleted = self.collection.delete_many({"ingest_job_id": job_id}).deleted_count
+        self.groups.delete_many({"ingest_job_id": job_id})
+        if not self.is_shadow:
+            self._bump_corpus_version()
+        return deleted
+
+    def delete_superseded(self, document_hash: str, job_id: str) -> int:
+        """
+        Remove chunks and centroids of earlier ingestions of the same PDF.
+
+        Called once a re-ingestion has written its own documents, so the
+        document is never missing from the collection; the caller changes
+        the corpus version afterwards.
+
+        Args:
+            document_hash: Content hash of the PDF
+            job_id: The ingestion whose documents are kept
+
+        Returns:
+            Chunks deleted
+        """
+        stale = {"document_hash": document_hash, "ingest_job_id": {"$ne": job_id}}
+        deleted = self.collection.delete_many(stale).deleted_count
+        self.groups.delete_many(stale)
+        return deleted
+
+    def corpus_version(self) -> str:
+        """
+        Identifier of the currently ingested corpus.
+
+        Changes on every insert, clear or activation, so caches keyed on
+        it never serve results from a previous corpus. Also follows the
+        active pointer, so a store switches to a newly activated version
+        the next time its owner checks the corpus version.
+        """
+        docs = {doc["_id"]: doc for doc in self.meta.find({"_id": {"$in": ["corpus", "active"]}})}
+        if not self.is_shadow:
+            active = self._active_name(docs.get("active"))
+            if active != self.physical_name:
+                self._bind(active)
+        return docs["corpus"]["version"] if "corpus" in docs else "0"
+
+    # ----- Blue/green versions -----
+
+    def create_shadow(self, version: Optional[str] = None) -> "VectorStore":
+        """
+        Store bound to a new, not yet active collection version.
+
+        Args:
+            version: Version label (UTC timestamp if omitted)
+
+        Returns:
+            VectorStore writing to "<collection>__<version>"
+        """
+        version = version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        return VectorStore(
+            mongodb_uri=None,
+            db_name=self.db.name,
+            collection_name=self.base_name,
+            storage=self.storage,
+            rescore_factor=self.rescore_factor,
+            client=self.client,
+            physical_name=f"{self.base_name}__{version}"
+        )
+
+    def activate(self, physical_name: str, keep_versions: int = 3) -> List[str]:
+        """
+        Atomically make a collection version the live one.
+
+        The pointer is one document, so readers see either the old or
+        the new version. The replaced version is pushed onto a history
+        used by rollback(); versioned collections beyond the last
+        `keep_versions` are dropped.
+
+        Returns:
+            Names of the dropped collections
+        """
+        previous = self.meta.find_one_and_update(
+            {"_id": "active"},
+            {"$set": {"collection": physical_name, "activated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        old = self._active_name(previous)
+        if old != physical_name:
+            self.meta.update_one({"_id": "active"}, {"$push": {"history": old}})
+        self._bump_corpus_version()
+        if not self.is_shadow:
+            self._bind(physical_name)
+        return self.drop_old_versions(keep_versions)
+
+    def rollback(self) -> str:
+        """
+        Re-activate the version that was live before the current one.
+
+        The version rolled back from is dropped: it is in no history, so
+        retention would never reclaim it (the unversioned base collection
+        is kept, as in drop_old_versions()).
+
+        Returns:
+            Name of the re-activated collection
+
+        Raises:
+            RuntimeError: If there is no earlier version
+        """
+        pointer = self._pointer() or {}
+        history = pointer.get("history", [])
+        if not history:
+            raise RuntimeError("No earlier collection version to roll back to")
+        target = history[-1]
+        current = self._active_name(pointer)
+        self.meta.update_one(
+            {"_id": "active"},
+            {
+                "$set": {"collection": target, "activated_at": datetime.now(timezone.utc)},
+                "$pop": {"history": 1}
+            }
+        )
+        self._bump_corpus_version()
+        if not self.is_shadow:
+            self._bind(target)
+        if current != target and current.startswith(f"{self.base_name}__"):
+            self._drop(current)
+        return target
+
+    def list_versions(self) -> List[str]:
+        """Versioned collections of this logical collection, oldest first"""
+        prefix = f"{self.base_name}__"
+        return sorted(
+            name for name in self.db.list_collection_names()
+            if name.startswith(prefix) and not name.endswith(SIDE_COLLECTIONS)
+        )
+
+    def drop_old_versions(self, keep_versions: int = 3) -> List[str]:
+        """
+        Drop previously active versions beyond the last `keep_versions`
+        (counting the active one).
+
+        Versions that were never activated (builds in progress) and the
+        unversioned base collection are never dropped.
+        """
+        pointer = self._pointer()
+        active = self._active_name(pointer)
+        pointer = pointer or {}
+        history = pointer.get("history", [])
+        retained = set(history[-(keep_versions - 1):]) if keep_versions > 1 else set()
+        stale = [
+            name for name in dict.fromkeys(history)
+            if name.startswith(f"{self.base_name}__") and name != active and name not in retained
+        ]
+        for name in stale:
+            self._drop(name)
+        if stale:
+            self.meta.update_one({"_id": "active"}, {"$pull": {"history": {"$in": stale}}})
+        return stale
+
+    def drop_version(self, physical_name: str):
+        """Drop one version that is not active (e.g. a failed shadow build)"""
+        if physical_name == self._active_name(self._pointer()):
+            raise ValueError(f"{physical_name} is the active collection")
+        self._drop(physical_name)
+
+    def _drop(self, physical_name: str):
+        """Drop a versioned collection and its side collections"""
+        self.db.drop_collection(physical_name)
+        for suffix in SIDE_COLLECTIONS:
+            self.db.drop_collection(f"{physical_name}{suffix}")
+
+    def _bump_corpus_version(self):
+        self.meta.update_one(
+            {"_id": "corpus"},
+            {"$set": {"version": uuid.uuid4().hex}},
+            upsert=True
+        )
@@ -0,0 +1,25 @@
+"""
+Small shared helpers
+"""
+
+from typing import Any
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so equivalent queries compare equal"""
+    return " ".join(query.lower().split())
+
+
+def make_key(namespace: str, query: str, *params: Any) -> str:
+    """
+    Build a stable key for a query and its parameters.
+
+    Args:
+        namespace: Operation the key belongs to (e.g. "retrieve")
+        query: Raw user query, normalized before use
+        *params: Extra parameters that change the result (top_k, min_score, ...)
+
+    Returns:
+        Key string such as "retrieve|what is ppo|3|None"
+    """
+    return "|".join([namespace, normalize_query(query), *map(str, params)])
@@ -0,0 +1,142 @@
+"""
+Startup-time benchmark for the API and the ingestion entry points
+
+Each measurement runs in a fresh interpreter, so nothing is already
+imported or cached in memory:
+    - import time of app.main (API) and ETL (ingestion)
+    - heavy third-party packages each entry point loaded at import; an
+      entry point that loads a package it never uses fails the run
+    - API time to the first served request: uvicorn is started and
+      GET / and GET /api/health are polled until they answer
+
+Usage (from backend/):
+    python testing/benchmark_startup.py
+    python testing/benchmark_startup.py --runs 5 --query "What is the CGPA cutoff?"
+"""
+
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_PACKAGES = ["huggingface_hub", "groq", "pymongo", "langchain_community", "langchain_text_splitters", "pypdf"]
+
+# Packages an entry point must not load at import time
+FORBIDDEN = {
+    "app.main": ["langchain_community", "langchain_text_splitters", "pypdf", "huggingface_hub", "groq", "pymongo"],
+    "ETL": ["groq", "langchain_community"],
+}
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str) -> dict:
+    """Import time and heavy packages loaded, in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, started: float, timeout_s: float, data: bytes = None) -> float:
+    """Seconds from started until url answers 200"""
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        try:
+            request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=timeout_s) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError(f"{url} did not answer within {timeout_s}s")
+
+
+def measure_first_request(query: str = None, timeout_s: float = 60.0) -> dict:
+    """Seconds from process start to each first answered request (missing if it never answered)"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        timings = {"root": _wait_for(f"{base}/", started, timeout_s)}
+        try:
+            # Health builds the retrieval service, so it needs MongoDB
+            timings["health"] = _wait_for(f"{base}/api/health", started, timeout_s)
+            if query:
+                body = json.dumps({"query": query, "top_k": 3}).encode()
+                timings["query"] = _wait_for(f"{base}/api/query", started, timeout_s, data=body)
+        except TimeoutError as e:
+            print(f"   ⚠ {e}")
+        return timings
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _summary(values) -> str:
+    return f"median {statistics.median(values) * 1000:7.1f} ms   min {min(values) * 1000:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the API and ingestion entry points")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--query", help="Also time the first POST /api/query (needs live MongoDB and HuggingFace)")
+    parser.add_argument("--skip-server", action="store_true", help="Only measure imports")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each request")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("Startup Benchmark")
+    print("="*60)
+
+    failed = False
+    for module, forbidden in FORBIDDEN.items():
+        runs = [measure_import(module) for _ in range(args.runs)]
+        loaded = runs[-1]["loaded"]
+        print(f"\nimport {module}: {_summary([r['seconds'] for r in runs])}")
+        print(f"   heavy packages loaded: {', '.join(loaded) or 'none'}")
+        unexpected = [m for m in loaded if m in forbidden]
+        if unexpected:
+            failed = True
+            print(f"   ❌ loads packages it does not need at import: {', '.join(unexpected)}")
+
+    if not args.skip_server:
+        runs = [measure_first_request(args.query, args.timeout) for _ in range(args.runs)]
+        print("\nAPI time to first served request:")
+        for name in ("root", "health", "query"):
+            values = [r[name] for r in runs if name in r]
+            if values:
+                print(f"   {name:<7} {_summary(values)}")
+
+    print("\n" + "="*60)
+    if failed:
+        sys.exit(1)
+    print("✅ Startup benchmark complete")
+
+
+if __name__ == "__main__":
+    main()
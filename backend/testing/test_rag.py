@@ -35,6 +35,7 @@ def test_rag():
         print(f"{i}. Query: {query}")
         result = pipeline.answer(query, top_k=3)
         print(f"   Answer: {result.answer}")
+        print(f"   Path: {result.answer_path} ({result.model or 'no LLM call'})")
         print(f"   Sources used: {len(result.sources)}")
         for s in result.sources:
             print(f"      - Score: {s['score']:.3f} | {s['text_preview'][:60]}...")
@@ -12,10 +12,16 @@ const SUGGESTED_QUESTIONS = [
   "Can I participate in placements with a backlog?",
 ]
 
+// Identifies this tab to the backend, which pairs prefetches with the question sent
+const newClientId = () =>
+  crypto.randomUUID ? crypto.randomUUID() : Math.random().toString(36).slice(2)
+
 function App() {
   const [messages, setMessages] = useState([])
   const [loading, setLoading] = useState(false)
+  const [sessionId, setSessionId] = useState(null)
   const messagesEndRef = useRef(null)
+  const [clientId] = useState(newClientId)
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
@@ -37,7 +43,7 @@ function App() {
       const response = await fetch('/api/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query, top_k: 3 })
+        body: JSON.stringify({ query, top_k: 3, session_id: sessionId, client_id: clientId })
       })
 
       if (!response.ok) {
@@ -45,10 +51,12 @@ function App() {
       }
 
       const data = await response.json()
+      if (data.session_id) setSessionId(data.session_id)
 
       const botMsg = {
         role: 'assistant',
-        content: data.answer,
+        // No answer means the deadline only left time to find the sources
+        content: data.answer ?? "The answer couldn't be generated in time. These are the most relevant passages:",
         sources: data.sources,
         id: Date.now() + 1
       }
@@ -65,7 +73,10 @@ function App() {
     }
   }
 
-  const clearChat = () => setMessages([])
+  const clearChat = () => {
+    setMessages([])
+    setSessionId(null)
+  }
 
   return (
     <div className="app-layout">
@@ -84,7 +95,7 @@ function App() {
           />
         )}
       </main>
-      <InputBox onSend={sendMessage} loading={loading} />
+      <InputBox onSend={sendMessage} loading={loading} clientId={clientId} />
     </div>
   )
 }
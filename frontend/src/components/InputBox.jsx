@@ -1,11 +1,39 @@
-import { useState, useRef } from 'react'
+import { useState, useRef, useEffect } from 'react'
 
-export default function InputBox({ onSend, loading }) {
+// Typing pause after which the partial question is prefetched
+const PREFETCH_DELAY_MS = 400
+const PREFETCH_MIN_CHARS = 12
+
+export default function InputBox({ onSend, loading, clientId }) {
     const [value, setValue] = useState('')
     const textareaRef = useRef(null)
+    const prefetchTimer = useRef(null)
+    const lastPrefetched = useRef('')
+
+    useEffect(() => () => clearTimeout(prefetchTimer.current), [])
+
+    // Warm the backend caches while the user pauses; the server cancels
+    // this client's previous prefetch, so only the latest one keeps running
+    const schedulePrefetch = (text) => {
+        clearTimeout(prefetchTimer.current)
+        const query = text.trim()
+        if (!clientId || query.length < PREFETCH_MIN_CHARS) return
+
+        prefetchTimer.current = setTimeout(() => {
+            if (query === lastPrefetched.current) return
+            lastPrefetched.current = query
+            fetch('/api/prefetch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ query, top_k: 3, client_id: clientId })
+            }).catch(() => {})
+        }, PREFETCH_DELAY_MS)
+    }
 
     const handleSend = () => {
         if (!value.trim() || loading) return
+        clearTimeout(prefetchTimer.current)
+        lastPrefetched.current = ''
         onSend(value)
         setValue('')
         // Reset textarea height
@@ -23,6 +51,7 @@ export default function InputBox({ onSend, loading }) {
 
     const handleInput = (e) => {
         setValue(e.target.value)
+        schedulePrefetch(e.target.value)
         // Auto-resize textarea
         e.target.style.height = 'auto'
         e.target.style.height = Math.min(e.target.scrollHeight, 120) + 'px'
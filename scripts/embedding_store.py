@@ -0,0 +1,48 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from app.config import get_settings
+from app.services.embedding_store import EmbeddingStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the persistent chunk embedding store")
+    parser.add_argument("--path", help="SQLite file (default: EMBEDDING_STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("stats", help="Rows per model and file size")
+
+    evict = commands.add_parser("evict", help="Delete unused embeddings")
+    evict.add_argument("--older-than-days", type=float, help="Not used by any ingestion for this many days")
+    evict.add_argument("--model", help="Only this model (all of its rows if no age is given)")
+
+    commands.add_parser("compact", help="Reclaim space after evictions")
+
+    args = parser.parse_args()
+    store = EmbeddingStore(args.path or get_settings().EMBEDDING_STORE_PATH)
+
+    if args.command == "stats":
+        stats = store.stats()
+        for model, count in stats["models"].items():
+            print(f"{model}: {count} embeddings")
+        print(f"File size: {stats['file_bytes'] / 1e6:.1f} MB")
+
+    elif args.command == "evict":
+        if args.older_than_days is None and args.model is None:
+            parser.error("evict needs --older-than-days and/or --model")
+        older_than_s = args.older_than_days * 86400 if args.older_than_days is not None else None
+        print(f"✓ Deleted {store.evict(older_than_s=older_than_s, model=args.model)} embeddings")
+
+    elif args.command == "compact":
+        before = store.stats()["file_bytes"]
+        store.compact()
+        print(f"✓ Compacted {before / 1e6:.1f} MB -> {store.stats()['file_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
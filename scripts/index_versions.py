@@ -0,0 +1,48 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from app.config import get_settings
+from app.services.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, roll back and drop blue/green collection versions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Versions of the collection, marking the active one")
+    commands.add_parser("rollback", help="Re-activate the previously active version (dropping the current one)")
+    drop = commands.add_parser("drop", help="Drop a version that is not active")
+    drop.add_argument("collection", help="Physical collection name, e.g. documents__20250101T120000")
+
+    args = parser.parse_args()
+    settings = get_settings()
+    store = VectorStore(
+        settings.MONGODB_URI,
+        settings.MONGODB_DB_NAME,
+        settings.MONGODB_COLLECTION,
+        storage=settings.EMBEDDING_STORAGE
+    )
+
+    if args.command == "list":
+        versions = store.list_versions()
+        if store.physical_name not in versions:
+            versions.insert(0, store.physical_name)
+        for name in versions:
+            marker = "*" if name == store.physical_name else " "
+            print(f"{marker} {name} ({store.db[name].estimated_document_count()} documents)")
+
+    elif args.command == "rollback":
+        print(f"✓ Active collection is now {store.rollback()}")
+
+    elif args.command == "drop":
+        store.drop_version(args.collection)
+        print(f"✓ Dropped {args.collection}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,46 +6,37 @@ backend_dir = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(backend_dir))
 
 from backend.app.config import get_settings
-from backend.app.services.pdf_processor import PDFProcessor
 from backend.app.services.embeddings import EmbeddingService
-from backend.app.services.vector_store import VectorStore
-from tqdm import tqdm
+from backend.app.services.embedding_store import EmbeddingStore
+from backend.app.services.ingestion import IngestionJob, run_ingestion
 
-def ingest_pdf(pdf_path: str):
+def ingest_pdf(pdf_path: str, tenant_id: str = None):
     settings = get_settings()
+    tenants = settings.tenants()
+    tenant = tenants.get(tenant_id or settings.DEFAULT_TENANT)
+    if tenant is None:
+        print(f"Unknown tenant '{tenant_id}'. Configured: {', '.join(tenants)}")
+        sys.exit(1)
+    if tenant.shards:
+        print(f"Tenant '{tenant.tenant_id}' is sharded; ingest into one of its shard collections instead")
+        sys.exit(1)
     
-    print("1. Processing PDF...")
-    processor = PDFProcessor()
-    chunks = processor.process_pdf(pdf_path)
-    print(f"   Created {len(chunks)} chunks")
-    
-    print("2. Generating embeddings...")
-    embedding_service = EmbeddingService(settings.EMBEDDING_MODEL)
-    texts = [chunk["text"] for chunk in chunks]
-    embeddings = embedding_service.generate_embeddings(texts)
-    
-    print("3. Storing in MongoDB...")
-    vector_store = VectorStore(
-        settings.MONGODB_URI,
-        settings.MONGODB_DB_NAME,
-        settings.MONGODB_COLLECTION
-    )
-    
-    # Combine chunks with embeddings
-    documents = []
-    for chunk, embedding in zip(chunks, embeddings):
-        doc = {
-            **chunk,
-            "embedding": embedding
-        }
-        documents.append(doc)
+    # Same pipeline as uploads through POST /api/documents, run in the foreground.
+    # Chunks embedded by an earlier run (any collection) come from the store
+    print(f"Ingesting {pdf_path} into {tenant.tenant_id} ({tenant.collection})...")
+    embedding_service = EmbeddingService(settings.EMBEDDING_MODEL, store=EmbeddingStore.from_settings())
+    progress = run_ingestion(IngestionJob(pdf_path, tenant), embedding_service)
     
-    vector_store.insert_documents(documents)
+    print(f"1. Parsed {progress['pages_parsed']} pages ({progress['pages_extracted']} extracted, rest from cache)")
+    print(f"2. Embedded {progress['chunks_embedded']} chunks and the sentences of {progress['contexts_embedded']} contexts")
+    print(f"3. Stored {progress['docs_written']} chunks in MongoDB")
+    if progress["docs_replaced"]:
+        print(f"   Replaced {progress['docs_replaced']} chunks of an earlier ingestion of this PDF")
     print("✓ Ingestion complete!")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python scripts/ingest_pdf.py <path_to_pdf>")
+        print("Usage: python scripts/ingest_pdf.py <path_to_pdf> [tenant_id]")
         sys.exit(1)
     
-    ingest_pdf(sys.argv[1])
\ No newline at end of file
+    ingest_pdf(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
\ No newline at end of file